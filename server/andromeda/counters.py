@@ -0,0 +1,212 @@
+"""
+Denormalized counters (likes_count, friends_count, members_count, ...).
+
+Writes adjust counters with a single atomic `UPDATE ... SET n = n + delta`
+instead of re-counting the related rows, so a like on a popular post no
+longer scans all of its likes. Deltas can drift (deletes that bypass signals,
+bulk operations, crashes between statements), so andromeda.tasks
+.reconcile_counters periodically recounts every registered counter in primary
+key chunks and repairs only the rows that disagree.
+
+High-frequency counters that nobody needs to be exact to the millisecond (view
+counts) are write-behind instead: see BufferedCounter.
+"""
+import logging
+from collections import namedtuple
+
+from django.apps import apps
+from django.db import transaction
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from prometheus_client import Counter as MetricCounter
+from redis.exceptions import ResponseError
+
+from andromeda.redis_client import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_CHUNK_SIZE = 1000
+FLUSH_BATCH_SIZE = 500
+FLUSH_LOCK_TIMEOUT = 120
+
+BUFFERED_FLUSHED = MetricCounter(
+    'andromeda_buffered_counter_flushed_total',
+    'Buffered increments written to the database',
+    ['counter'],
+)
+COUNTER_DRIFT = MetricCounter(
+    'andromeda_counter_drift_repaired_total',
+    'Denormalized counter rows corrected by reconciliation',
+    ['counter'],
+)
+
+
+def adjust(model, pk, **deltas):
+    """Atomically add each delta to its counter column on one row, never below zero."""
+    model.objects.filter(pk=pk).update(**{
+        field: F(field) + delta if delta >= 0 else Greatest(F(field) + delta, Value(0))
+        for field, delta in deltas.items()
+    })
+
+
+# `field` on `model` counts the `source` rows whose `fk` points at it (and
+# that match `where`, if given).
+Counter = namedtuple('Counter', ['model', 'field', 'source', 'fk', 'where'], defaults=[None])
+
+COUNTERS = [
+    Counter('posts.Post', 'likes_count', 'posts.Like', 'post'),
+    Counter('posts.Post', 'comments_count', 'posts.Comment', 'post'),
+    Counter('posts.Post', 'shares_count', 'posts.Post', 'shared_post'),
+    *[
+        Counter('posts.Post', f'reaction_{reaction}_count', 'posts.Like', 'post', {'reaction': reaction})
+        for reaction in ('like', 'love', 'haha', 'wow', 'sad', 'angry')
+    ],
+    Counter('users.User', 'posts_count', 'posts.Post', 'author'),
+    Counter('users.User', 'friends_count', 'users.Friendship', 'user'),
+    Counter('groups.Group', 'members_count', 'groups.GroupMember', 'group'),
+    Counter('pages.Page', 'followers_count', 'pages.PageFollow', 'page'),
+    Counter('marketplace.Listing', 'likes_count', 'marketplace.ListingLike', 'listing'),
+    Counter('watch.Video', 'likes_count', 'watch.VideoLike', 'video'),
+    Counter('watch.Video', 'comments_count', 'watch.VideoComment', 'video'),
+]
+
+
+def counter_name(counter):
+    return f'{counter.model}.{counter.field}'
+
+
+def actual_count(counter):
+    """Correlated subquery counting the source rows of the outer row."""
+    source = apps.get_model(counter.source)
+    return Coalesce(Subquery(
+        source.objects.filter(**{counter.fk: OuterRef('pk')}, **(counter.where or {})).order_by().values(counter.fk).annotate(
+            n=Count('pk')
+        ).values('n'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def reconcile(counter, chunk_size=RECONCILE_CHUNK_SIZE):
+    """Recount `counter` chunk by chunk; returns the number of rows repaired."""
+    model = apps.get_model(counter.model)
+    repaired, last_pk = 0, None
+    while True:
+        chunk = model.objects.order_by('pk')
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            break
+        last_pk = pks[-1]
+        drifted = list(model.objects.filter(pk__in=pks).annotate(
+            actual=actual_count(counter),
+        ).exclude(**{counter.field: F('actual')}).values_list('pk', flat=True))
+        if drifted:
+            model.objects.filter(pk__in=drifted).update(**{counter.field: actual_count(counter)})
+            repaired += len(drifted)
+    if repaired:
+        COUNTER_DRIFT.labels(counter=counter_name(counter)).inc(repaired)
+        logger.info(f'Repaired {repaired} drifted {counter_name(counter)} rows')
+    return repaired
+
+
+class BufferedCounter:
+    """
+    Write-behind counter column, e.g. BufferedCounter('watch.Video', 'views_count').
+
+    incr() is one HINCRBY on a Redis hash of pending deltas keyed by primary
+    key, so hot rows are never locked in the request path. flush() (run
+    periodically by andromeda.tasks.flush_buffered_counters) swaps the hash
+    out atomically and applies it with one UPDATE ... CASE per batch; reads add
+    pending() on top of the stored value, which is approximate while a flush
+    runs. Without Redis, incr() updates the row directly.
+    """
+
+    def __init__(self, model, field):
+        self.model_label = model
+        self.field = field
+        self.name = f'{model}.{field}'
+        self.key = redis_key('buffered', self.name)
+        self.flushing_key = redis_key('buffered', self.name, 'flushing')
+        self.lock_key = redis_key('buffered', self.name, 'lock')
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    def incr(self, pk, by=1):
+        redis = get_redis()
+        if redis is not None:
+            try:
+                redis.hincrby(self.key, pk, by)
+                return
+            except Exception as e:
+                logger.warning(f'Buffered counter {self.name} unavailable: {e}')
+        adjust(self.model, pk, **{self.field: by})
+
+    def pending(self, pks):
+        """
+        Deltas not yet flushed for `pks`, as {pk: delta} (both live and in-flight).
+
+        The sum with the stored value is approximate: a flush commits each
+        batch before dropping it from the flushing hash, so for that one round
+        trip a row's delta is counted twice, and the row itself is read at
+        another moment than the hash. Good for display, not for bookkeeping.
+        """
+        pks = list(pks)
+        redis = get_redis()
+        if redis is None or not pks:
+            return {}
+        try:
+            pipe = redis.pipeline(transaction=False)
+            pipe.hmget(self.key, pks)
+            pipe.hmget(self.flushing_key, pks)
+            live, flushing = pipe.execute()
+        except Exception as e:
+            logger.warning(f'Buffered counter {self.name} unavailable: {e}')
+            return {}
+        return {
+            pk: int(a or 0) + int(b or 0)
+            for pk, a, b in zip(pks, live, flushing) if a or b
+        }
+
+    def flush(self, batch_size=FLUSH_BATCH_SIZE):
+        """Apply buffered deltas to the database; returns the number of rows updated."""
+        redis = get_redis()
+        if redis is None:
+            return 0
+        lock = redis.lock(self.lock_key, timeout=FLUSH_LOCK_TIMEOUT)
+        if not lock.acquire(blocking=False):
+            return 0
+        try:
+            # A leftover flushing hash means a previous flush died part-way;
+            # finish it before taking new increments.
+            if not redis.exists(self.flushing_key):
+                try:
+                    redis.rename(self.key, self.flushing_key)
+                except ResponseError:
+                    return 0  # nothing buffered
+            deltas = [(int(pk), int(delta)) for pk, delta in redis.hgetall(self.flushing_key).items()]
+            for start in range(0, len(deltas), batch_size):
+                batch = deltas[start:start + batch_size]
+                with transaction.atomic():
+                    self.model.objects.filter(pk__in=[pk for pk, _ in batch]).update(**{
+                        self.field: F(self.field) + Case(
+                            *[When(pk=pk, then=Value(delta)) for pk, delta in batch],
+                            default=Value(0),
+                            output_field=IntegerField(),
+                        ),
+                    })
+                # Drop each batch once committed so a crash never applies it twice.
+                redis.hdel(self.flushing_key, *[pk for pk, _ in batch])
+            redis.delete(self.flushing_key)
+        finally:
+            lock.release()
+        BUFFERED_FLUSHED.labels(counter=self.name).inc(sum(delta for _, delta in deltas))
+        return len(deltas)
+
+
+LISTING_VIEWS = BufferedCounter('marketplace.Listing', 'views_count')
+VIDEO_VIEWS = BufferedCounter('watch.Video', 'views_count')
+
+BUFFERED_COUNTERS = [LISTING_VIEWS, VIDEO_VIEWS]
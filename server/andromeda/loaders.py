@@ -0,0 +1,103 @@
+"""
+Request-scoped batch loading for viewer-relative serializer fields.
+
+Fields such as `is_friend` or `my_reaction` depend on who is looking, so they
+cannot be select_related. Instead, a list serializer primes a loader with every
+object it is about to render; the first field that asks for a key resolves the
+whole batch with one IN query, and every later lookup is served from memory.
+
+    class PostSerializer(BatchLoadingMixin, serializers.ModelSerializer):
+        class Meta:
+            list_serializer_class = BatchLoadingListSerializer
+
+        def prime_viewer_fields(self, posts):
+            batch_loader(self.context, load_my_reactions).prime(p.pk for p in posts)
+
+        def get_my_reaction(self, obj):
+            return batch_loader(self.context, load_my_reactions).load(obj.pk)
+
+Nested serializers that use BatchLoadingMixin are primed automatically with the
+related objects of the whole page (e.g. every post author at once).
+"""
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import models
+from rest_framework import serializers
+from rest_framework.fields import get_attribute
+
+
+def viewer_of(context):
+    request = context.get('request')
+    if request and request.user.is_authenticated:
+        return request.user
+    return None
+
+
+class BatchLoader:
+    """Collects keys and resolves them in one call to `batch_fn(viewer, keys)`."""
+
+    def __init__(self, batch_fn, viewer, default=None):
+        self.batch_fn = batch_fn
+        self.viewer = viewer
+        self.default = default
+        self.pending = set()
+        self.results = {}
+
+    def prime(self, keys):
+        self.pending.update(key for key in keys if key not in self.results)
+        return self
+
+    def load(self, key):
+        if key not in self.results:
+            self.pending.add(key)
+            keys, self.pending = self.pending, set()
+            found = self.batch_fn(self.viewer, keys)
+            for k in keys:
+                self.results[k] = found.get(k, self.default)
+        return self.results[key]
+
+
+def batch_loader(context, batch_fn, default=None):
+    """Return the loader for `batch_fn` shared by everything rendered in this request."""
+    viewer = viewer_of(context)
+    request = context.get('request')
+    if request is None:
+        return BatchLoader(batch_fn, viewer, default)
+    loaders = getattr(request, '_batch_loaders', None)
+    if loaders is None:
+        loaders = {}
+        setattr(request, '_batch_loaders', loaders)
+    key = (batch_fn, getattr(viewer, 'pk', None))
+    if key not in loaders:
+        loaders[key] = BatchLoader(batch_fn, viewer, default)
+    return loaders[key]
+
+
+class BatchLoadingMixin:
+    def prime(self, instances):
+        """Queue the viewer fields of `instances` and of their nested objects."""
+        for field in self.fields.values():
+            if field.write_only or not isinstance(field, BatchLoadingMixin) or field.source == '*':
+                continue
+            related = []
+            for instance in instances:
+                try:
+                    value = get_attribute(instance, field.source_attrs)
+                except (AttributeError, KeyError, ObjectDoesNotExist):
+                    continue
+                if value is not None:
+                    related.append(value)
+            if related:
+                field.prime(related)
+        if viewer_of(self.context) is not None:
+            self.prime_viewer_fields(instances)
+
+    def prime_viewer_fields(self, instances):
+        pass
+
+
+class BatchLoadingListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        if isinstance(self.child, BatchLoadingMixin):
+            self.child.prime(items)
+        return super().to_representation(items)
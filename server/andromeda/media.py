@@ -0,0 +1,189 @@
+"""
+Resized renditions ("derivatives") of uploaded images.
+
+Originals are kept as uploaded, but clients should never have to download a
+multi-megabyte photo to show a 320px card. Every image field registered with
+track_derivatives() gets a sibling JSONField, `<field>_derivatives`. When a
+saved row's image differs from the one its derivatives were made from,
+andromeda.tasks.generate_derivatives renders each RENDITIONS width (never
+upscaling) as WebP and JPEG after commit. The EXIF orientation is applied to
+the pixels and the EXIF block itself (camera, GPS) is dropped. The result is
+recorded on the row:
+
+    {'source': 'avatars/2024/05/me.jpg', 'width': 3024, 'height': 4032,
+     'renditions': {'thumb': {'width': 320, 'height': 427,
+                              'webp': 'derivatives/avatars/2024/05/me/thumb.webp',
+                              'jpeg': 'derivatives/avatars/2024/05/me/thumb.jpg'}, ...}}
+
+Serializers expose it with SrcsetField as ready-made srcset strings per
+format. Until the task has run the map is empty and clients use the original.
+"""
+import io
+import logging
+import os
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import Signal
+from django.utils import timezone
+from PIL import Image, ImageOps
+from rest_framework import serializers
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS = {'thumb': 320, 'medium': 720, 'large': 1280}
+FORMATS = {
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+DERIVATIVES_ROOT = 'derivatives'
+
+# Sent once a row's derivatives have been written, for caches of its rendering.
+derivatives_ready = Signal()
+
+# (model, field, condition) registered by track_derivatives().
+TRACKED = []
+
+
+def derivatives_field(field):
+    return f'{field}_derivatives'
+
+
+def _normalize(image):
+    """`image` as RGB, or RGBA if it has transparency."""
+    if image.mode in ('RGB', 'RGBA'):
+        return image
+    if image.mode in ('LA', 'PA') or 'transparency' in image.info:
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def _encode(image, fmt, icc_profile):
+    pil_format, _ext, options = FORMATS[fmt]
+    if fmt == 'jpeg' and image.mode == 'RGBA':
+        # JPEG has no alpha: flatten over white.
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    buffer = io.BytesIO()
+    # No exif= argument: Pillow writes no metadata besides the colour profile.
+    image.save(buffer, pil_format, icc_profile=icc_profile, **options)
+    return buffer.getvalue()
+
+
+def render_derivatives(file):
+    """Render and store every rendition of an image file; returns the derivatives map."""
+    with file.open('rb'):
+        source = Image.open(file)
+        icc_profile = source.info.get('icc_profile')
+        source = _normalize(ImageOps.exif_transpose(source))
+    root = os.path.join(DERIVATIVES_ROOT, os.path.splitext(file.name)[0])
+    renditions = {}
+    for name, width in sorted(RENDITIONS.items(), key=lambda item: item[1]):
+        if source.width <= width:
+            # Wider renditions would only repeat the original size.
+            resized = source
+        else:
+            resized = source.resize((width, round(source.height * width / source.width)), Image.LANCZOS)
+        rendition = {'width': resized.width, 'height': resized.height}
+        for fmt, (_pil_format, ext, _options) in FORMATS.items():
+            content = ContentFile(_encode(resized, fmt, icc_profile))
+            rendition[fmt] = default_storage.save(os.path.join(root, f'{name}.{ext}'), content)
+        renditions[name] = rendition
+        if resized is source:
+            break
+    return {'source': file.name, 'width': source.width, 'height': source.height, 'renditions': renditions}
+
+
+def derivative_names(derivatives):
+    return [
+        rendition[fmt]
+        for rendition in (derivatives or {}).get('renditions', {}).values()
+        for fmt in FORMATS if fmt in rendition
+    ]
+
+
+def _delete(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except Exception as e:
+            logger.warning(f'Could not delete derivative {name}: {e}')
+
+
+def update_derivatives(instance, field):
+    """
+    Regenerate `instance.<field>`'s derivatives and record them, unless the
+    image was replaced meanwhile. Returns the new derivatives map or None.
+    """
+    model = type(instance)
+    file = getattr(instance, field)
+    previous = getattr(instance, derivatives_field(field)) or {}
+    derivatives = render_derivatives(file) if file else {}
+
+    values = {derivatives_field(field): derivatives}
+    if any(f.name == 'updated_at' for f in model._meta.concrete_fields):
+        values['updated_at'] = timezone.now()
+    rows = model.objects.filter(pk=instance.pk)
+    if file:
+        rows = rows.filter(**{field: file.name})
+    if not rows.update(**values):
+        _delete(derivative_names(derivatives))
+        return None
+    _delete(set(derivative_names(previous)) - set(derivative_names(derivatives)))
+    setattr(instance, derivatives_field(field), derivatives)
+    derivatives_ready.send(sender=model, instance=instance, field=field)
+    return derivatives
+
+
+def needs_derivatives(instance, field):
+    file = getattr(instance, field)
+    derivatives = getattr(instance, derivatives_field(field)) or {}
+    return derivatives.get('source') != (file.name if file else None)
+
+
+def queue_derivatives(instance, field):
+    from andromeda.tasks import generate_derivatives
+    label, pk = instance._meta.label, instance.pk
+    transaction.on_commit(lambda: generate_derivatives.apply_async(args=[label, pk, field], queue='default'))
+
+
+def track_derivatives(model, field, condition=None):
+    """
+    Keep `model.<field>_derivatives` up to date with `model.<field>`; rows for
+    which `condition(instance)` is false (e.g. video media) are skipped.
+    """
+    TRACKED.append((model, field, condition))
+
+    def on_save(sender, instance, **kwargs):
+        if kwargs.get('raw') or (condition and not condition(instance)):
+            return
+        if needs_derivatives(instance, field):
+            queue_derivatives(instance, field)
+
+    post_save.connect(on_save, sender=model, weak=False, dispatch_uid=f'derivatives:{model._meta.label}.{field}')
+
+
+class SrcsetField(serializers.ReadOnlyField):
+    """
+    A `<field>_derivatives` map as {'webp': srcset, 'jpeg': srcset}, e.g.
+    {'webp': 'https://…/thumb.webp 320w, https://…/medium.webp 720w'}.
+    """
+
+    def to_representation(self, value):
+        renditions = sorted((value or {}).get('renditions', {}).values(), key=lambda r: r['width'])
+        request = self.context.get('request')
+        srcset = {}
+        for fmt in FORMATS:
+            candidates = []
+            for rendition in renditions:
+                if fmt in rendition:
+                    url = default_storage.url(rendition[fmt])
+                    if request is not None:
+                        url = request.build_absolute_uri(url)
+                    candidates.append(f'{url} {rendition["width"]}w')
+            if candidates:
+                srcset[fmt] = ', '.join(candidates)
+        return srcset
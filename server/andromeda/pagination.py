@@ -0,0 +1,154 @@
+"""
+Pagination shared by the list endpoints.
+
+KeysetPagination pages on (created_at, id) with opaque cursors: no COUNT(*),
+no OFFSET, and rows inserted while a client scrolls never shift the next
+page, so deep scrolls cost the same as the first page.
+
+Endpoints opt in with pagination_class = CursorOrPageNumberPagination; clients
+then select keyset mode by sending ?cursor= (empty for the first page) and
+keep the classic page-number response otherwise.
+"""
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    # Views may override with a `keyset_ordering` attribute, e.g.
+    # ('created_at', 'id') for oldest-first threads.
+    ordering = ('-created_at', '-id')
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering = getattr(view, 'keyset_ordering', self.ordering)
+        page_size = self.get_page_size(request)
+        position = self.decode_cursor(request)
+
+        if hasattr(queryset, 'keyset_page'):
+            # Non-SQL sources (e.g. posts.timeline.HomeTimeline) page themselves.
+            results = queryset.keyset_page(position, page_size + 1)
+        else:
+            if position is not None:
+                queryset = queryset.filter(self.position_filter(position))
+            results = list(queryset.order_by(*self.ordering)[:page_size + 1])
+
+        self.has_next = len(results) > page_size
+        self.page = results[:page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def position_filter(self, position):
+        (time_field, id_field), (created_at, pk) = self.field_names(), position
+        op = 'lt' if self.ordering[0].startswith('-') else 'gt'
+        return (
+            Q(**{f'{time_field}__{op}': created_at}) |
+            Q(**{time_field: created_at, f'{id_field}__{op}': pk})
+        )
+
+    def field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            data = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            created_at = parse_datetime(data['t'])
+            pk = int(data['id'])
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+    def encode_cursor(self, instance):
+        time_field, id_field = self.field_names()
+        payload = json.dumps({
+            't': getattr(instance, time_field).isoformat(),
+            'id': getattr(instance, id_field),
+        })
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
+
+
+class CursorOrPageNumberPagination(BasePagination):
+    """Keyset pagination when the request carries ?cursor=, page numbers otherwise."""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.paginator = KeysetPagination()
+        else:
+            self.paginator = PageNumberPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+
+class ThreadPagination(KeysetPagination):
+    """Keyset pages over a materialized-path thread (see andromeda.threads), in path order."""
+
+    ordering = ('path',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        # Threads always page by path, whatever the view's keyset_ordering.
+        return super().paginate_queryset(queryset, request)
+
+    def position_filter(self, position):
+        return Q(path__gt=position)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            path = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))['path']
+        except (TypeError, ValueError, KeyError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(path, str) or not path.isdigit():
+            raise NotFound(self.invalid_cursor_message)
+        return path
+
+    def encode_cursor(self, instance):
+        payload = json.dumps({'path': instance.path})
+        return base64.urlsafe_b64encode(payload.encode('ascii')).decode('ascii')
@@ -0,0 +1,24 @@
+"""
+Raw Redis access for data structures the Django cache API cannot express
+(sorted sets, sets, counters).
+
+Returns None when the configured cache is not Redis-backed (e.g. LocMemCache
+under settings_test) so callers can fall back to PostgreSQL.
+"""
+import logging
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'andromeda'
+
+
+def get_redis():
+    try:
+        from django_redis import get_redis_connection
+        return get_redis_connection('default')
+    except Exception:
+        return None
+
+
+def redis_key(*parts):
+    return ':'.join([KEY_PREFIX, *(str(p) for p in parts)])
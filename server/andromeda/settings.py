@@ -22,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Third-party
     'rest_framework',
@@ -116,6 +117,27 @@ CACHES = {
     }
 }
 
+# ============================================================
+# Feed (materialized home timelines, see posts/timeline.py)
+# ============================================================
+FEED_TIMELINE_LENGTH = int(os.environ.get('FEED_TIMELINE_LENGTH', 800))
+FEED_TIMELINE_TTL = int(os.environ.get('FEED_TIMELINE_TTL', 60 * 60 * 24 * 7))
+# Authors with at least this many friends are merged in at read time
+# (from a per-author recent-posts set) instead of being pushed.
+FEED_FANOUT_THRESHOLD = int(os.environ.get('FEED_FANOUT_THRESHOLD', 5000))
+FEED_AUTHOR_POSTS_LENGTH = int(os.environ.get('FEED_AUTHOR_POSTS_LENGTH', 200))
+# Seconds between flushes of write-behind view counters (andromeda/counters.py)
+# and of buffered VideoView rows (watch/ingest.py)
+BUFFERED_COUNTER_FLUSH_INTERVAL = float(os.environ.get('BUFFERED_COUNTER_FLUSH_INTERVAL', 30))
+# Seconds between batched TagNode syncs of posts whose hashtags changed (posts/tags.py)
+TAG_GRAPH_SYNC_INTERVAL = float(os.environ.get('TAG_GRAPH_SYNC_INTERVAL', 60))
+# Cached friend sets (users/friends.py)
+FRIEND_CACHE_TTL = int(os.environ.get('FRIEND_CACHE_TTL', 60 * 60 * 24 * 7))
+# Presence (users/presence.py): sockets refresh their connection every
+# PRESENCE_HEARTBEAT_INTERVAL seconds; one silent for PRESENCE_TTL has lapsed.
+PRESENCE_HEARTBEAT_INTERVAL = int(os.environ.get('PRESENCE_HEARTBEAT_INTERVAL', 30))
+PRESENCE_TTL = int(os.environ.get('PRESENCE_TTL', 90))
+
 # ============================================================
 # Django Channels (WebSockets)
 # ============================================================
@@ -152,6 +174,8 @@ CELERY_TASK_QUEUES = {
     'emails': {},
 }
 CELERY_TASK_DEFAULT_QUEUE = 'default'
+# Task modules outside installed apps (not found by autodiscover_tasks)
+CELERY_IMPORTS = ['andromeda.tasks']
 
 # ── Periodic tasks ────────────────────────────────────────────
 from celery.schedules import crontab  # noqa: E402
@@ -165,6 +189,30 @@ CELERY_BEAT_SCHEDULE = {
         'task': 'notifications.tasks.send_product_spotlight',
         'schedule': crontab(minute=0),   # fires every hour
     },
+    'flush-buffered-counters': {
+        'task': 'andromeda.tasks.flush_buffered_counters',
+        'schedule': BUFFERED_COUNTER_FLUSH_INTERVAL,
+    },
+    'flush-video-views': {
+        'task': 'watch.tasks.flush_video_views',
+        'schedule': BUFFERED_COUNTER_FLUSH_INTERVAL,
+    },
+    'sync-tag-nodes': {
+        'task': 'posts.tasks.sync_tag_nodes',
+        'schedule': TAG_GRAPH_SYNC_INTERVAL,
+    },
+    'prune-popular-feed': {
+        'task': 'posts.tasks.prune_popular',
+        'schedule': crontab(minute=15),
+    },
+    'sweep-presence': {
+        'task': 'users.tasks.sweep_presence',
+        'schedule': PRESENCE_TTL,
+    },
+    'reconcile-counters-nightly': {
+        'task': 'andromeda.tasks.reconcile_counters',
+        'schedule': crontab(hour=4, minute=0),
+    },
 }
 
 # ============================================================
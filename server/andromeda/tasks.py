@@ -0,0 +1,52 @@
+"""
+Project-wide maintenance tasks – run on the 'default' queue.
+"""
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='andromeda.tasks.reconcile_counters', queue='default')
+def reconcile_counters():
+    """Repair drift in every denormalized counter (see andromeda/counters.py)."""
+    from andromeda.counters import COUNTERS, counter_name, reconcile
+
+    repaired = {}
+    for counter in COUNTERS:
+        try:
+            repaired[counter_name(counter)] = reconcile(counter)
+        except Exception as e:
+            logger.error(f'reconcile_counters failed for {counter_name(counter)}: {e}')
+    return repaired
+
+
+@shared_task(name='andromeda.tasks.flush_buffered_counters', queue='default')
+def flush_buffered_counters():
+    """Write buffered view counts to the database (see BufferedCounter)."""
+    from andromeda.counters import BUFFERED_COUNTERS
+
+    flushed = {}
+    for counter in BUFFERED_COUNTERS:
+        try:
+            flushed[counter.name] = counter.flush()
+        except Exception as e:
+            logger.error(f'flush_buffered_counters failed for {counter.name}: {e}')
+    return flushed
+
+
+@shared_task(name='andromeda.tasks.generate_derivatives', queue='default')
+def generate_derivatives(model_label, pk, field):
+    """Render the resized renditions of an uploaded image (see andromeda/media.py)."""
+    from django.apps import apps
+    from andromeda.media import update_derivatives
+
+    model = apps.get_model(model_label)
+    instance = model.objects.filter(pk=pk).first()
+    if instance is None:
+        return None
+    try:
+        return update_derivatives(instance, field)
+    except Exception as e:
+        logger.error(f'generate_derivatives failed for {model_label} {pk}.{field}: {e}')
+        return None
@@ -0,0 +1,101 @@
+import fakeredis
+import pytest
+from django.contrib.auth import get_user_model
+from andromeda import counters
+from andromeda.counters import BufferedCounter
+from watch.models import Video
+
+User = get_user_model()
+
+
+# ── Fixtures ──────────────────────────────────────────────────────────────────
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(username="alice", password="pass", email="a@a.com")
+
+
+@pytest.fixture
+def videos(user):
+    return [
+        Video.objects.create(uploader=user, title=f"Clip {i}", video_file=f"watch/videos/{i}.mp4")
+        for i in range(3)
+    ]
+
+
+class OverlappingRedis(fakeredis.FakeRedis):
+    """Runs `during_flush` once, while a flush holds the swapped-out hash."""
+    during_flush = None
+
+    def hgetall(self, name):
+        hook, self.during_flush = self.during_flush, None
+        if hook:
+            hook()
+        return super().hgetall(name)
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    server = OverlappingRedis()
+    monkeypatch.setattr(counters, "get_redis", lambda: server)
+    return server
+
+
+def views_counts(videos):
+    return [Video.objects.get(pk=v.pk).views_count for v in videos]
+
+
+# ── Buffered counters ─────────────────────────────────────────────────────────
+
+class TestBufferedCounter:
+    def test_incr_writes_through_without_redis(self, videos):
+        counter = BufferedCounter("watch.Video", "views_count")
+        counter.incr(videos[0].pk, by=2)
+        assert views_counts(videos) == [2, 0, 0]
+        assert counter.pending([videos[0].pk]) == {}
+        assert counter.flush() == 0
+
+    def test_flush_applies_buffered_deltas_once(self, redis, videos):
+        counter = BufferedCounter("watch.Video", "views_count")
+        for _ in range(3):
+            counter.incr(videos[0].pk)
+        counter.incr(videos[1].pk, by=5)
+        assert views_counts(videos) == [0, 0, 0]
+        assert counter.pending([v.pk for v in videos]) == {videos[0].pk: 3, videos[1].pk: 5}
+
+        assert counter.flush(batch_size=1) == 2
+        assert views_counts(videos) == [3, 5, 0]
+        assert counter.pending([v.pk for v in videos]) == {}
+        assert counter.flush() == 0
+        assert views_counts(videos) == [3, 5, 0]
+
+    def test_overlapping_flush_is_skipped(self, redis, videos):
+        counter = BufferedCounter("watch.Video", "views_count")
+        counter.incr(videos[0].pk, by=2)
+        overlapping = []
+
+        def meanwhile():
+            # Another worker flushes and a viewer arrives mid-flush.
+            overlapping.append(counter.flush())
+            counter.incr(videos[0].pk)
+            assert counter.pending([videos[0].pk]) == {videos[0].pk: 3}
+
+        redis.during_flush = meanwhile
+        assert counter.flush() == 1
+        assert overlapping == [0]
+        assert views_counts(videos)[0] == 2
+        assert counter.pending([videos[0].pk]) == {videos[0].pk: 1}
+
+        assert counter.flush() == 1
+        assert views_counts(videos)[0] == 3
+
+    def test_interrupted_flush_is_finished_first(self, redis, videos):
+        counter = BufferedCounter("watch.Video", "views_count")
+        # A flush died after swapping the hash out; new views kept coming.
+        redis.hset(counter.flushing_key, mapping={videos[0].pk: 4, videos[1].pk: 1})
+        counter.incr(videos[0].pk)
+
+        assert counter.flush() == 2
+        assert views_counts(videos) == [4, 1, 0]
+        assert counter.flush() == 1
+        assert views_counts(videos) == [5, 1, 0]
@@ -0,0 +1,78 @@
+"""
+Materialized-path comment threads (posts.Comment, watch.VideoComment).
+
+Every comment stores `path`, the zero-padded ids of its ancestors and of
+itself concatenated ('0000000007' + '0000000042' for reply 42 to comment 7),
+and its `depth`. All segments have the same width, so ordering by path is
+depth-first thread order and a subtree is a path prefix: one range scan on
+the path index (varchar_pattern_ops on PostgreSQL) fetches it and one DELETE
+removes it, instead of walking `parent` level by level.
+
+`parent` is kept for direct replies and still cascades, so deletes that go
+through Django's collector (a post or user being removed) stay correct.
+"""
+from django.db import connection
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+SEGMENT_WIDTH = 10
+PATH_MAX_LENGTH = 250
+# Replies below this depth are attached to their parent's parent instead.
+MAX_DEPTH = PATH_MAX_LENGTH // SEGMENT_WIDTH - 1
+
+
+def segment(pk):
+    return f'{pk:0{SEGMENT_WIDTH}d}'
+
+
+def assign_path(comment):
+    """Set path and depth of a newly created comment (its own id is the last segment)."""
+    parent = comment.parent
+    if parent is not None and parent.depth >= MAX_DEPTH:
+        parent = parent.parent
+    comment.parent = parent
+    comment.path = (parent.path if parent else '') + segment(comment.pk)
+    comment.depth = parent.depth + 1 if parent else 0
+    type(comment).objects.filter(pk=comment.pk).update(
+        path=comment.path, depth=comment.depth, parent=parent,
+    )
+
+
+def subtree(queryset, root):
+    """`root` and all of its replies, in thread order."""
+    return queryset.filter(path__startswith=root.path).order_by('path')
+
+
+def delete_subtree(comment, scope):
+    """
+    Delete `comment` and all of its replies in one statement and return the
+    number of rows removed. Only rows sharing the comment's `scope` foreign key
+    (its post or video) are touched. Like QuerySet.update(), this sends no
+    signals, so callers adjust counters themselves.
+    """
+    if not comment.path:
+        # An empty prefix would match every row.
+        raise ValueError(f'{comment!r} has no thread path')
+    field = type(comment)._meta.get_field(scope)
+    table = connection.ops.quote_name(type(comment)._meta.db_table)
+    column = connection.ops.quote_name(field.column)
+    params = [comment.path + '%', getattr(comment, field.attname)]
+    with connection.cursor() as cursor:
+        # Replies filed under another post or video (from before replies were
+        # validated) survive; detach them from the rows about to go.
+        cursor.execute(
+            f'UPDATE {table} SET parent_id = NULL WHERE path LIKE %s AND {column} <> %s AND parent_id IN '
+            f'(SELECT id FROM {table} WHERE path LIKE %s AND {column} = %s)',
+            params + params,
+        )
+        cursor.execute(f'DELETE FROM {table} WHERE path LIKE %s AND {column} = %s', params)
+        return cursor.rowcount
+
+
+def thread(queryset, root_id=None):
+    """Comments of `queryset` in thread order, or only the subtree under `root_id`."""
+    if root_id is None:
+        return queryset.order_by('path')
+    if not str(root_id).isdigit():
+        raise Http404
+    return subtree(queryset, get_object_or_404(queryset, pk=root_id))
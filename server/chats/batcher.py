@@ -0,0 +1,122 @@
+"""
+Group commit for chat messages sent over WebSockets.
+
+Writing each message on its own costs a thread hop plus several statements.
+Instead, ChatConsumer hands messages to the process-wide MessageBatcher. It
+collects them from every consumer on the event loop for BATCH_WINDOW seconds,
+or until MAX_BATCH_SIZE are queued, and writes the batch in one transaction
+(write_messages):
+
+* one `UPDATE ... RETURNING` per room reserves the batch's sequence numbers
+  (chats.sync), taken in room order so concurrent batches cannot deadlock;
+* one multi-row INSERT ... RETURNING creates every message;
+* one UPDATE per room moves the inbox pointer and bumps updated_at, and one
+  more raises the members' unread counters (chats.inbox.record_messages).
+
+Each sender's future resolves to its saved Message (id, seq, created_at). If
+a batch fails, e.g. on a reply_to pointing nowhere, its messages are retried
+one by one so only the offending sender sees the error.
+"""
+import asyncio
+import logging
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
+from django.db import DatabaseError, transaction
+
+from notifications.mentions import SOURCE_MESSAGE
+from notifications.tasks import queue_mention_notifications
+from . import inbox
+from .models import Message
+from .sync import allocate_seqs
+
+logger = logging.getLogger(__name__)
+
+BATCH_WINDOW = 0.005
+MAX_BATCH_SIZE = 500
+
+
+def write_messages(messages):
+    """Insert unsaved messages (bulk_create skips the Message signals, so their work happens here)."""
+    from .tasks import notify_offline_members
+
+    with transaction.atomic():
+        by_room = defaultdict(list)
+        for message in messages:
+            by_room[message.room_id].append(message)
+        for room_id in sorted(by_room):
+            first = allocate_seqs(room_id, len(by_room[room_id]))
+            for offset, message in enumerate(by_room[room_id]):
+                message.seq = message.updated_seq = first + offset
+        created = Message.objects.bulk_create(messages)
+        inbox.record_messages(created)
+        for message in created:
+            queue_mention_notifications(SOURCE_MESSAGE, message.id, message.content)
+            args = [message.id, message.room_id, message.sender_id]
+            # robust: a broker hiccup must not report committed messages as failed
+            transaction.on_commit(
+                lambda args=args: notify_offline_members.apply_async(args=args, queue='messages'), robust=True,
+            )
+    return created
+
+
+class MessageBatcher:
+    def __init__(self, window=BATCH_WINDOW, max_size=MAX_BATCH_SIZE):
+        self.window = window
+        self.max_size = max_size
+        self.pending = []
+        self.timer = None
+
+    async def save(self, message):
+        """Queue an unsaved Message for the next batch; returns it once written."""
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((message, future))
+        if len(self.pending) >= self.max_size:
+            self._flush_now()
+        elif self.timer is None:
+            self.timer = asyncio.get_running_loop().call_later(self.window, self._flush_now)
+        return await future
+
+    def _flush_now(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        batch, self.pending = self.pending, []
+        if batch:
+            asyncio.ensure_future(self._write(batch))
+
+    async def _write(self, batch):
+        try:
+            await database_sync_to_async(write_messages)([message for message, _ in batch])
+        except Exception as e:
+            if len(batch) == 1 or not isinstance(e, DatabaseError):
+                self._settle(batch, e)
+                return
+            logger.warning(f'Chat message batch of {len(batch)} failed, retrying one by one: {e}')
+            await asyncio.gather(*(self._write([entry]) for entry in batch))
+            return
+        self._settle(batch)
+
+    @staticmethod
+    def _settle(batch, error=None):
+        for message, future in batch:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(message)
+            else:
+                future.set_exception(error)
+
+
+_batchers = {}
+
+
+def get_batcher():
+    """The batcher of the running event loop (one per worker process in practice)."""
+    loop = asyncio.get_running_loop()
+    batcher = _batchers.get(loop)
+    if batcher is None:
+        for other in [other for other in _batchers if other.is_closed()]:
+            del _batchers[other]
+        batcher = _batchers[loop] = MessageBatcher()
+    return batcher
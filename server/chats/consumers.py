@@ -1,14 +1,26 @@
 """
 WebSocket consumer for real-time chat.
-URL: ws://host/ws/chat/<room_id>/?token=<JWT>
+URL: ws://host/ws/chat/<room_id>/?token=<JWT>[&since_seq=<N>]
+
+A reconnecting client passes the highest `updated_seq` it has seen as
+since_seq and receives what it missed as 'sync' frames before live events.
+Those are messages, edits and deletion tombstones in batches (see chats.sync).
+It has caught up when a frame says has_more: false. Otherwise it continues
+from the last frame over GET /api/chats/rooms/<id>/sync/. Live events that
+arrive meanwhile may repeat a synced message; clients dedupe by message_id.
 """
 import json
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from django.utils import timezone
+
+from users.presence import PresenceMixin
+from .batcher import get_batcher
+from .sync import RESUME_MAX_BATCHES, changes, message_event
 
 
-class ChatConsumer(AsyncWebsocketConsumer):
+class ChatConsumer(PresenceMixin, AsyncWebsocketConsumer):
     async def connect(self):
         user = self.scope.get('user')
         if not user or not user.is_authenticated:
@@ -28,23 +40,33 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
 
-        # Notify others user is online
-        await self.channel_layer.group_send(self.room_group_name, {
-            'type': 'user_status',
-            'user_id': user.id,
-            'username': user.username,
-            'status': 'online',
-        })
+        # Joined the group first, so nothing falls between the replay and live events
+        since_seq = self.requested_since_seq()
+        if since_seq is not None:
+            await self.resume(since_seq)
+
+        # Friends hear when the user comes online (see users.presence)
+        await self.join_presence()
 
     async def disconnect(self, close_code):
         if hasattr(self, 'room_group_name'):
-            await self.channel_layer.group_send(self.room_group_name, {
-                'type': 'user_status',
-                'user_id': self.user.id,
-                'username': self.user.username,
-                'status': 'offline',
-            })
             await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+        await self.leave_presence()
+
+    def requested_since_seq(self):
+        values = parse_qs(self.scope.get('query_string', b'').decode()).get('since_seq')
+        try:
+            return max(int(values[0]), 0) if values else None
+        except ValueError:
+            return None
+
+    async def resume(self, since_seq):
+        for _ in range(RESUME_MAX_BATCHES):
+            events, has_more = await self.load_changes(since_seq)
+            await self.send(text_data=json.dumps({'type': 'sync', 'messages': events, 'has_more': has_more}))
+            if not has_more:
+                return
+            since_seq = events[-1]['updated_seq']
 
     async def receive(self, text_data):
         data = json.loads(text_data)
@@ -65,25 +87,15 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if not content and message_type == 'text':
             return
 
-        # Persist to DB
+        # Persist to DB (also queues push notifications for offline members)
         message = await self.save_message(content, message_type, reply_to_id)
 
         # Broadcast to room
         await self.channel_layer.group_send(self.room_group_name, {
             'type': 'chat_message',
-            'message_id': message.id,
-            'content': message.content,
-            'message_type': message.message_type,
-            'sender_id': self.user.id,
-            'sender_username': self.user.username,
-            'sender_avatar': self.user.avatar_url,
-            'reply_to': reply_to_id,
-            'created_at': message.created_at.isoformat(),
+            **message_event(message),
         })
 
-        # Queue push notification via RabbitMQ/Celery for offline members
-        await self.send_push_notifications(message)
-
     async def handle_typing(self, data):
         await self.channel_layer.group_send(self.room_group_name, {
             'type': 'typing_indicator',
@@ -94,8 +106,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     async def handle_read(self, data):
         message_id = data.get('message_id')
-        if message_id:
-            await self.mark_message_read(message_id)
+        # Reading a message reads everything before it; only a moved watermark is news.
+        if message_id and await self.mark_message_read(message_id):
             await self.channel_layer.group_send(self.room_group_name, {
                 'type': 'message_read',
                 'message_id': message_id,
@@ -114,10 +126,6 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def message_read(self, event):
         await self.send(text_data=json.dumps({'type': 'read', **event}))
 
-    async def user_status(self, event):
-        if event['user_id'] != self.user.id:
-            await self.send(text_data=json.dumps({'type': 'status', **event}))
-
     async def notification(self, event):
         await self.send(text_data=json.dumps({'type': 'notification', **event}))
 
@@ -128,33 +136,26 @@ class ChatConsumer(AsyncWebsocketConsumer):
         from .models import ChatMember
         return ChatMember.objects.filter(room_id=room_id, user=user).exists()
 
-    @database_sync_to_async
-    def save_message(self, content, message_type, reply_to_id):
-        from .models import Message, ChatRoom
-        room = ChatRoom.objects.get(id=self.room_id)
-        msg = Message.objects.create(
-            room=room,
+    async def save_message(self, content, message_type, reply_to_id):
+        from .models import Message
+        # Written together with other consumers' messages (see chats.batcher)
+        return await get_batcher().save(Message(
+            room_id=int(self.room_id),
             sender=self.user,
             content=content,
             message_type=message_type,
             reply_to_id=reply_to_id,
-        )
-        # Update room's updated_at
-        ChatRoom.objects.filter(pk=self.room_id).update(updated_at=timezone.now())
-        return msg
+        ))
 
     @database_sync_to_async
-    def mark_message_read(self, message_id):
-        from .models import MessageRead
-        MessageRead.objects.get_or_create(message_id=message_id, user=self.user)
+    def load_changes(self, since_seq):
+        messages, has_more = changes(self.room_id, since_seq)
+        return [message_event(m) for m in messages], has_more
 
     @database_sync_to_async
-    def send_push_notifications(self, message):
+    def mark_message_read(self, message_id):
+        from . import inbox
         try:
-            from chats.tasks import notify_offline_members
-            notify_offline_members.apply_async(
-                args=[message.id, self.room_id, self.user.id],
-                queue='messages',
-            )
-        except Exception:
-            pass
+            return inbox.mark_read(self.room_id, self.user.id, int(message_id))
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,132 @@
+"""
+The chat inbox, kept materialized on the rooms and memberships.
+
+Listing rooms must not look at the messages table: every room carries a
+pointer to its latest visible message plus the sender and a preview of it,
+and every ChatMember carries the number of messages from others since they
+last read. New messages, from the WebSocket consumer or the REST API, update
+both with one UPDATE per room each (record_messages). Edits and deletions of
+the latest message refresh the preview.
+
+Read state is a per-member high-water mark, ChatMember.last_read_message_id:
+message ids only grow, so a member has read every message up to it. mark_read()
+moves it forward and recounts the member's unread messages. "Read by N" for a
+page of messages is derived from the room's watermarks (read_by_counts)
+instead of a row per message and reader.
+"""
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from django.db.models import Case, Count, F, Max, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import ChatMember, ChatRoom, Message
+
+PREVIEW_LENGTH = 255  # ChatRoom.last_message_preview
+
+
+def _last_message_fields(message):
+    if message is None:
+        return {
+            'last_message_id': None, 'last_message_sender_id': None,
+            'last_message_preview': '', 'last_message_at': None,
+        }
+    return {
+        'last_message_id': message.pk,
+        'last_message_sender_id': message.sender_id,
+        'last_message_preview': message.content[:PREVIEW_LENGTH],
+        'last_message_at': message.created_at,
+    }
+
+
+def record_messages(messages):
+    """Account for newly created messages, which may span several rooms."""
+    by_room = defaultdict(list)
+    for message in messages:
+        by_room[message.room_id].append(message)
+    now = timezone.now()
+    for room_id, room_messages in by_room.items():
+        latest = max(room_messages, key=lambda m: m.pk)
+        # A concurrent, older message must not overwrite a newer pointer.
+        ChatRoom.objects.filter(pk=room_id).filter(
+            Q(last_message__isnull=True) | Q(last_message__lt=latest.pk),
+        ).update(updated_at=now, **_last_message_fields(latest))
+
+        # Each member gains the room's new messages except their own.
+        total = len(room_messages)
+        sent = Counter(m.sender_id for m in room_messages if m.sender_id)
+        increment = Value(total)
+        if sent:
+            increment -= Case(*[When(user_id=user_id, then=Value(n)) for user_id, n in sent.items()], default=Value(0))
+        ChatMember.objects.filter(room_id=room_id).exclude(
+            user_id__in=[user_id for user_id, n in sent.items() if n == total],
+        ).update(unread_count=F('unread_count') + increment)
+
+
+def mark_read(room_id, user_id, message_id=None):
+    """
+    Move the member's watermark up to `message_id` (by default the room's
+    latest message); returns the new watermark, or None if it did not move.
+    """
+    messages = Message.objects.filter(room_id=room_id)
+    if message_id is None:
+        message_id = messages.aggregate(latest=Max('id'))['latest']
+        if message_id is None:
+            return None
+    elif not messages.filter(pk=message_id).exists():
+        return None
+    unread = messages.filter(pk__gt=message_id).exclude(sender_id=user_id).order_by().values('room')
+    moved = ChatMember.objects.filter(room_id=room_id, user_id=user_id).filter(
+        Q(last_read_message_id__isnull=True) | Q(last_read_message_id__lt=message_id),
+    ).update(
+        last_read_message_id=message_id,
+        last_read_at=timezone.now(),
+        unread_count=Coalesce(Subquery(unread.annotate(n=Count('id')).values('n')), 0),
+    )
+    return message_id if moved else None
+
+
+def read_by_counts(messages):
+    """
+    How many members other than the sender have read each message, for
+    (room_id, message_id, sender_id) keys, from one query over the rooms'
+    watermarks.
+    """
+    watermarks = defaultdict(dict)
+    members = ChatMember.objects.filter(
+        room_id__in={room_id for room_id, _, _ in messages}, last_read_message_id__isnull=False,
+    ).values_list('room_id', 'user_id', 'last_read_message_id')
+    for room_id, user_id, watermark in members:
+        watermarks[room_id][user_id] = watermark
+    ordered = {room_id: sorted(marks.values()) for room_id, marks in watermarks.items()}
+    counts = {}
+    for key in messages:
+        room_id, message_id, sender_id = key
+        marks = ordered.get(room_id, [])
+        count = len(marks) - bisect_left(marks, message_id)
+        if watermarks[room_id].get(sender_id, 0) >= message_id:
+            count -= 1
+        counts[key] = count
+    return counts
+
+
+def refresh_last_message(room_id):
+    latest = Message.objects.filter(room_id=room_id, is_deleted=False).order_by('-created_at', '-id').first()
+    ChatRoom.objects.filter(pk=room_id).update(**_last_message_fields(latest))
+
+
+def message_edited(message):
+    ChatRoom.objects.filter(pk=message.room_id, last_message=message.pk).update(
+        last_message_preview=message.content[:PREVIEW_LENGTH],
+    )
+
+
+def expire_last_messages(cutoff):
+    """Clear the pointers of rooms whose latest message predates `cutoff` (and was deleted with it)."""
+    ChatRoom.objects.filter(last_message_at__lt=cutoff).update(**_last_message_fields(None))
+
+
+def message_deleted(message):
+    if ChatRoom.objects.filter(pk=message.room_id, last_message=message.pk).exists():
+        refresh_last_message(message.room_id)
@@ -0,0 +1,71 @@
+# Generated by Django 4.2.10 on 2026-10-18 12:03
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Substr
+import django.db.models.deletion
+
+
+def backfill_inbox(apps, schema_editor):
+    ChatRoom = apps.get_model('chats', 'ChatRoom')
+    ChatMember = apps.get_model('chats', 'ChatMember')
+    Message = apps.get_model('chats', 'Message')
+
+    latest = Message.objects.filter(room=OuterRef('pk'), is_deleted=False).order_by('-created_at', '-id')
+    ChatRoom.objects.update(
+        last_message_id=Subquery(latest.values('id')[:1]),
+        last_message_sender_id=Subquery(latest.values('sender_id')[:1]),
+        last_message_preview=Coalesce(
+            Subquery(latest.annotate(preview=Substr('content', 1, 255)).values('preview')[:1]), Value(''),
+        ),
+        last_message_at=Subquery(latest.values('created_at')[:1]),
+    )
+
+    def count(messages):
+        messages = messages.exclude(sender=OuterRef('user')).order_by().values('room')
+        return Coalesce(Subquery(messages.annotate(n=Count('id')).values('n')), 0)
+
+    ChatMember.objects.filter(last_read_at__isnull=True).update(
+        unread_count=count(Message.objects.filter(room=OuterRef('room'))),
+    )
+    ChatMember.objects.filter(last_read_at__isnull=False).update(
+        unread_count=count(Message.objects.filter(room=OuterRef('room'), created_at__gt=OuterRef('last_read_at'))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chats', '0002_message_messages_room_created_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmember',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chats.message'),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_message_sender',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_inbox, migrations.RunPython.noop),
+    ]
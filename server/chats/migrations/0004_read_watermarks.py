@@ -0,0 +1,38 @@
+# Generated by Django 4.2.10 on 2026-10-18 12:05
+
+from django.db import migrations, models
+from django.db.models import Exists, OuterRef, Q, Subquery
+
+
+def backfill_watermarks(apps, schema_editor):
+    """Seed each watermark from last_read_at and the member's MessageRead rows, whichever is further."""
+    ChatMember = apps.get_model('chats', 'ChatMember')
+    Message = apps.get_model('chats', 'Message')
+    MessageRead = apps.get_model('chats', 'MessageRead')
+
+    read_until = Message.objects.filter(
+        room=OuterRef('room'), created_at__lte=OuterRef('last_read_at'),
+    ).order_by('-id').values('id')[:1]
+    ChatMember.objects.filter(last_read_at__isnull=False).update(last_read_message_id=Subquery(read_until))
+
+    reads = MessageRead.objects.filter(user=OuterRef('user'), message__room=OuterRef('room'))
+    last_receipt = Subquery(reads.order_by('-message_id').values('message_id')[:1])
+    ChatMember.objects.filter(Exists(reads)).filter(
+        Q(last_read_message_id__isnull=True) | Q(last_read_message_id__lt=last_receipt),
+    ).update(last_read_message_id=last_receipt)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0003_inbox_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmember',
+            name='last_read_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_watermarks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 4.2.10 on 2026-10-18 12:07
+
+from django.db import migrations, models
+
+
+def number_messages(apps, schema_editor):
+    """Number existing messages per room in creation order."""
+    schema_editor.execute(
+        'UPDATE messages SET seq = numbered.rn, updated_seq = numbered.rn '
+        'FROM (SELECT id, ROW_NUMBER() OVER (PARTITION BY room_id ORDER BY created_at, id) AS rn '
+        'FROM messages) AS numbered WHERE messages.id = numbered.id'
+    )
+    schema_editor.execute(
+        'UPDATE chat_rooms SET last_seq = COALESCE('
+        '(SELECT MAX(seq) FROM messages WHERE messages.room_id = chat_rooms.id), 0)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0004_read_watermarks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatroom',
+            name='last_seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='message',
+            name='updated_seq',
+            field=models.PositiveBigIntegerField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['room', 'updated_seq'], name='messages_room_updated_seq_idx'),
+        ),
+        migrations.RunPython(number_messages, migrations.RunPython.noop),
+    ]
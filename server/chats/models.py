@@ -1,5 +1,6 @@
 from django.conf import settings
-from django.db import models
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
 
 
 class ChatRoom(models.Model):
@@ -16,6 +17,19 @@ class ChatRoom(models.Model):
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL, related_name='created_rooms', on_delete=models.SET_NULL, null=True
     )
+
+    # Latest visible message, denormalized for the inbox (see chats.inbox)
+    last_message = models.ForeignKey(
+        'Message', null=True, blank=True, related_name='+', on_delete=models.SET_NULL
+    )
+    last_message_sender = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, related_name='+', on_delete=models.SET_NULL
+    )
+    last_message_preview = models.CharField(max_length=255, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    # Latest sequence number handed out in this room (see chats.sync)
+    last_seq = models.PositiveBigIntegerField(default=0, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -26,10 +40,6 @@ class ChatRoom(models.Model):
     def __str__(self):
         return self.name or f'Room {self.pk}'
 
-    @property
-    def last_message(self):
-        return self.messages.order_by('-created_at').first()
-
 
 class ChatMember(models.Model):
     ROLE_MEMBER = 'member'
@@ -40,6 +50,10 @@ class ChatMember(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES, default=ROLE_MEMBER)
     last_read_at = models.DateTimeField(null=True, blank=True)
+    # Read receipts: the member has read every message of the room up to this id
+    last_read_message_id = models.BigIntegerField(null=True, blank=True)
+    # Messages from others since the member last marked the room read (see chats.inbox)
+    unread_count = models.PositiveIntegerField(default=0)
     joined_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -71,21 +85,42 @@ class Message(models.Model):
     )
     is_edited = models.BooleanField(default=False)
     is_deleted = models.BooleanField(default=False)
+    # Position in the room and sequence number of the latest change (see chats.sync)
+    seq = models.PositiveBigIntegerField(default=0, editable=False)
+    updated_seq = models.PositiveBigIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         db_table = 'messages'
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['room', '-created_at', '-id'], name='messages_room_created_idx'),
+            models.Index(fields=['room', 'updated_seq'], name='messages_room_updated_seq_idx'),
+        ]
 
     def __str__(self):
         return f'{self.sender} in {self.room}: {self.content[:50]}'
 
+    def save(self, *args, **kwargs):
+        # The seq reserved in pre_save (chats.signals.assign_seq) locks the
+        # room row; committing it with the message keeps concurrent writers
+        # from landing in the room's changes out of order.
+        with transaction.atomic(using=kwargs.get('using')):
+            super().save(*args, **kwargs)
+
     def get_read_by(self):
-        return MessageRead.objects.filter(message=self).select_related('user')
+        """Members other than the sender whose read watermark has reached this message."""
+        return get_user_model().objects.filter(
+            chatmember__room_id=self.room_id, chatmember__last_read_message_id__gte=self.pk,
+        ).exclude(pk=self.sender_id)
 
 
 class MessageRead(models.Model):
+    """
+    Legacy per-message receipts, superseded by ChatMember.last_read_message_id
+    (migration 0004 folded them into the watermarks); no longer written.
+    """
     message = models.ForeignKey(Message, related_name='reads', on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     read_at = models.DateTimeField(auto_now_add=True)
@@ -1,9 +1,20 @@
 from rest_framework import serializers
+
+from andromeda.loaders import BatchLoadingListSerializer, BatchLoadingMixin, batch_loader, viewer_of
+from . import inbox
 from .models import ChatRoom, ChatMember, Message
 from users.serializers import UserSerializer
 
 
-class MessageSerializer(serializers.ModelSerializer):
+def read_key(message):
+    return (message.room_id, message.pk, message.sender_id)
+
+
+def load_read_by_counts(viewer, keys):
+    return inbox.read_by_counts(keys)
+
+
+class MessageSerializer(BatchLoadingMixin, serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
     reply_to_data = serializers.SerializerMethodField()
     read_by_count = serializers.SerializerMethodField()
@@ -14,9 +25,10 @@ class MessageSerializer(serializers.ModelSerializer):
             'id', 'room', 'sender', 'content', 'message_type',
             'file', 'reply_to', 'reply_to_data',
             'is_edited', 'is_deleted', 'read_by_count',
-            'created_at', 'updated_at',
+            'seq', 'updated_seq', 'created_at', 'updated_at',
         ]
-        read_only_fields = ['sender', 'is_edited', 'created_at', 'updated_at']
+        read_only_fields = ['sender', 'is_edited', 'seq', 'updated_seq', 'created_at', 'updated_at']
+        list_serializer_class = BatchLoadingListSerializer
 
     def get_reply_to_data(self, obj):
         if obj.reply_to:
@@ -27,19 +39,32 @@ class MessageSerializer(serializers.ModelSerializer):
             }
         return None
 
+    def to_representation(self, instance):
+        if instance.is_deleted:
+            # Deleted messages only reach clients through delta sync, as tombstones.
+            return {
+                'id': instance.pk, 'room': instance.room_id, 'is_deleted': True,
+                'seq': instance.seq, 'updated_seq': instance.updated_seq,
+            }
+        return super().to_representation(instance)
+
+    def prime_viewer_fields(self, messages):
+        batch_loader(self.context, load_read_by_counts).prime(read_key(m) for m in messages)
+
     def get_read_by_count(self, obj):
-        return obj.reads.count()
+        return batch_loader(self.context, load_read_by_counts).load(read_key(obj))
 
 
-class ChatMemberSerializer(serializers.ModelSerializer):
+class ChatMemberSerializer(BatchLoadingMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
         model = ChatMember
-        fields = ['id', 'user', 'role', 'last_read_at', 'joined_at']
+        fields = ['id', 'user', 'role', 'last_read_at', 'last_read_message_id', 'unread_count', 'joined_at']
+        list_serializer_class = BatchLoadingListSerializer
 
 
-class ChatRoomSerializer(serializers.ModelSerializer):
+class ChatRoomSerializer(BatchLoadingMixin, serializers.ModelSerializer):
     members = ChatMemberSerializer(source='chatmember_set', many=True, read_only=True)
     last_message = serializers.SerializerMethodField()
     unread_count = serializers.SerializerMethodField()
@@ -51,16 +76,30 @@ class ChatRoomSerializer(serializers.ModelSerializer):
             'members', 'last_message', 'unread_count',
             'created_at', 'updated_at',
         ]
+        list_serializer_class = BatchLoadingListSerializer
+
+    def prime(self, rooms):
+        super().prime(rooms)
+        # Every room's members at once, rather than per nested members list.
+        self.fields['members'].child.prime([m for room in rooms for m in room.chatmember_set.all()])
 
+    # Both fields read the denormalized inbox state (see chats.inbox), so a page
+    # of rooms needs no query per room.
     def get_last_message(self, obj):
-        msg = obj.messages.filter(is_deleted=False).order_by('-created_at').first()
-        return MessageSerializer(msg, context=self.context).data if msg else None
+        if not obj.last_message_id:
+            return None
+        sender = obj.last_message_sender
+        return {
+            'id': obj.last_message_id,
+            'content': obj.last_message_preview,
+            'sender': {'id': sender.id, 'username': sender.username} if sender else None,
+            'created_at': serializers.DateTimeField().to_representation(obj.last_message_at),
+        }
 
     def get_unread_count(self, obj):
-        request = self.context.get('request')
-        if not request:
-            return 0
-        member = obj.chatmember_set.filter(user=request.user).first()
-        if not member or not member.last_read_at:
-            return obj.messages.count()
-        return obj.messages.filter(created_at__gt=member.last_read_at).count()
+        if hasattr(obj, 'my_unread_count'):
+            return obj.my_unread_count or 0
+        viewer = viewer_of(self.context)
+        # chatmember_set is prefetched for `members`.
+        member = next((m for m in obj.chatmember_set.all() if viewer and m.user_id == viewer.id), None)
+        return member.unread_count if member else 0
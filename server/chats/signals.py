@@ -0,0 +1,29 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+from notifications.mentions import SOURCE_MESSAGE
+from notifications.tasks import queue_mention_notifications
+from .models import Message
+from .sync import allocate_seqs
+
+
+@receiver(pre_save, sender=Message)
+def assign_seq(sender, instance, raw=False, using=None, update_fields=None, **kwargs):
+    # Every save is a change clients must sync. Saves limited by update_fields
+    # have to list 'updated_seq' to be picked up.
+    if raw:
+        return
+    if not transaction.get_connection(using).in_atomic_block:
+        # Message.save opens one; a bare reservation would commit on its own.
+        raise RuntimeError('Message seqs must be reserved inside the transaction that saves the message.')
+    seq = allocate_seqs(instance.room_id)
+    if instance._state.adding:
+        instance.seq = seq
+    instance.updated_seq = seq
+
+
+@receiver(post_save, sender=Message)
+def notify_mentions(sender, instance, created, update_fields=None, **kwargs):
+    if instance.is_deleted or (update_fields is not None and 'content' not in update_fields):
+        return
+    queue_mention_notifications(SOURCE_MESSAGE, instance.id, instance.content)
@@ -11,19 +11,24 @@ logger = logging.getLogger(__name__)
 def notify_offline_members(message_id, room_id, sender_id):
     """
     Send push/email notifications to room members who are offline.
-    Called after every new chat message.
+    Called after every new chat message. Members with an open socket see the
+    message live and are skipped.
     """
     from chats.models import Message, ChatMember
     from notifications.models import Notification
+    from users.presence import connected_user_ids
 
     try:
         message = Message.objects.select_related('sender', 'room').get(id=message_id)
         members = ChatMember.objects.filter(room_id=room_id).exclude(user_id=sender_id)
+        online = connected_user_ids(members.values_list('user_id', flat=True))
+        if online:
+            members = members.exclude(user_id__in=online)
 
         for member in members:
             # Create in-app notification
             Notification.objects.create(
-                recipient=member.user,
+                recipient_id=member.user_id,
                 sender=message.sender,
                 notification_type=Notification.TYPE_MESSAGE,
                 title=f'New message from {message.sender.username}',
@@ -39,9 +44,13 @@ def cleanup_old_messages():
     """Soft-delete messages older than 1 year (configurable)."""
     from django.utils import timezone
     from datetime import timedelta
+    from chats.inbox import expire_last_messages
     from chats.models import Message
+    from chats.sync import delete_messages
 
     cutoff = timezone.now() - timedelta(days=365)
-    count = Message.objects.filter(created_at__lt=cutoff, is_deleted=False).update(is_deleted=True)
+    # Not a plain update(): clients learn of the deletions through delta sync.
+    count = delete_messages(Message.objects.filter(created_at__lt=cutoff))
+    expire_last_messages(cutoff)
     logger.info(f'Soft-deleted {count} old messages.')
     return count
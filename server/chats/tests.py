@@ -0,0 +1,318 @@
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from chats import inbox
+from chats.models import ChatRoom, ChatMember, Message
+
+User = get_user_model()
+
+
+# ── Fixtures ──────────────────────────────────────────────────────────────────
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(username="alice", password="pass", email="a@a.com")
+
+
+@pytest.fixture
+def other_user(db):
+    return User.objects.create_user(username="bob", password="pass", email="b@b.com")
+
+
+@pytest.fixture
+def third_user(db):
+    return User.objects.create_user(username="carol", password="pass", email="c@c.com")
+
+
+@pytest.fixture
+def auth_client(api_client, user):
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+@pytest.fixture
+def room(user, other_user, third_user):
+    return make_room(user, other_user, third_user)
+
+
+def make_room(*users):
+    room = ChatRoom.objects.create(room_type=ChatRoom.TYPE_GROUP, name="Room")
+    for member in users:
+        ChatMember.objects.create(room=room, user=member)
+    return room
+
+
+def send(room, sender, content):
+    """Post a message through the API, which keeps the inbox up to date."""
+    client = APIClient()
+    client.force_authenticate(user=sender)
+    response = client.post(reverse("message-list"), {"room": room.id, "content": content}, format="json")
+    assert response.status_code == status.HTTP_201_CREATED
+    return Message.objects.get(pk=response.data["id"])
+
+
+def unread_counts(room):
+    return dict(ChatMember.objects.filter(room=room).values_list("user__username", "unread_count"))
+
+
+# ── Inbox ─────────────────────────────────────────────────────────────────────
+
+class TestInbox:
+    def test_new_messages_update_pointer_and_unread_counts(self, room, user, other_user):
+        send(room, user, "Hi")
+        latest = send(room, other_user, "Hello")
+        room.refresh_from_db()
+        assert room.last_message_id == latest.id
+        assert room.last_message_sender_id == other_user.id
+        assert room.last_message_preview == "Hello"
+        assert unread_counts(room) == {"alice": 1, "bob": 1, "carol": 2}
+
+    def test_record_messages_spanning_rooms(self, room, user, other_user):
+        second = make_room(user, other_user)
+        messages = [
+            Message(room=room, sender=user, content="one"),
+            Message(room=room, sender=user, content="two"),
+            Message(room=second, sender=other_user, content="three"),
+        ]
+        for message in messages:
+            message.seq = message.updated_seq = 0
+        created = Message.objects.bulk_create(messages)
+        ChatMember.objects.update(unread_count=0)
+        inbox.record_messages(created)
+        assert unread_counts(room) == {"alice": 0, "bob": 2, "carol": 2}
+        assert unread_counts(second) == {"alice": 1, "bob": 0}
+        room.refresh_from_db()
+        assert room.last_message_id == created[1].id
+
+    def test_deleting_latest_message_moves_pointer_back(self, auth_client, room, user):
+        first = send(room, user, "First")
+        last = send(room, user, "Last")
+        response = auth_client.delete(reverse("message-detail", kwargs={"pk": last.id}))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        room.refresh_from_db()
+        assert room.last_message_id == first.id
+        assert room.last_message_preview == "First"
+
+    def test_room_list_reads_denormalized_state(self, auth_client, room, other_user):
+        send(room, other_user, "Hello")
+        response = auth_client.get(reverse("chatroom-list"))
+        [data] = response.data["results"]
+        assert data["unread_count"] == 1
+        assert data["last_message"]["content"] == "Hello"
+        assert data["last_message"]["sender"]["username"] == "bob"
+
+    def _inbox_queries(self, client):
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(reverse("chatroom-list"))
+        assert response.status_code == status.HTTP_200_OK
+        return len(ctx.captured_queries)
+
+    def test_inbox_queries_do_not_grow_with_rooms(self, auth_client, user, other_user):
+        send(make_room(user, other_user), other_user, "Hi")
+        baseline = self._inbox_queries(auth_client)
+
+        for i in range(3):
+            # Members nobody else shares, so their friendship flags are new keys.
+            member = User.objects.create_user(username=f"member{i}", password="pass", email=f"m{i}@m.com")
+            send(make_room(user, member), member, f"Hi {i}")
+        assert self._inbox_queries(auth_client) == baseline
+
+
+    def test_renaming_keeps_messages_sent_meanwhile(self, auth_client, room, user, monkeypatch):
+        from chats.serializers import ChatRoomSerializer
+
+        def validate(serializer, attrs):
+            # A message lands between loading the room and saving the rename.
+            send(room, user, "Meanwhile")
+            return attrs
+
+        monkeypatch.setattr(ChatRoomSerializer, "validate", validate, raising=False)
+        response = auth_client.patch(reverse("chatroom-detail", kwargs={"pk": room.id}), {"name": "Renamed"}, format="json")
+        assert response.status_code == status.HTTP_200_OK
+        room.refresh_from_db()
+        assert (room.name, room.last_seq, room.last_message_preview) == ("Renamed", 1, "Meanwhile")
+
+
+# ── Read watermarks ───────────────────────────────────────────────────────────
+
+class TestReadWatermarks:
+    def test_mark_read_moves_forward_and_recounts(self, room, user, other_user):
+        first = send(room, other_user, "One")
+        second = send(room, other_user, "Two")
+        send(room, user, "Mine")
+        assert unread_counts(room)["alice"] == 2
+
+        assert inbox.mark_read(room.id, user.id, first.id) == first.id
+        assert unread_counts(room)["alice"] == 1
+        # Reading an older message again does not move the watermark back.
+        assert inbox.mark_read(room.id, user.id, first.id) is None
+        assert inbox.mark_read(room.id, user.id) == Message.objects.latest("id").id
+        assert unread_counts(room)["alice"] == 0
+        assert ChatMember.objects.get(room=room, user=user).last_read_message_id > second.id
+
+    def test_mark_read_ignores_messages_of_other_rooms(self, room, user, other_user):
+        elsewhere = send(make_room(user, other_user), other_user, "Elsewhere")
+        assert inbox.mark_read(room.id, user.id, elsewhere.id) is None
+
+    def test_read_by_counts_from_watermarks(self, room, user, other_user, third_user):
+        first = send(room, user, "One")
+        second = send(room, user, "Two")
+        inbox.mark_read(room.id, other_user.id, first.id)
+        inbox.mark_read(room.id, third_user.id, second.id)
+        keys = [(room.id, m.id, user.id) for m in (first, second)]
+        with CaptureQueriesContext(connection) as ctx:
+            counts = inbox.read_by_counts(keys)
+        assert len(ctx.captured_queries) == 1
+        # The sender's own watermark does not count as a read.
+        inbox.mark_read(room.id, user.id)
+        assert counts == {keys[0]: 2, keys[1]: 1}
+        assert inbox.read_by_counts(keys) == counts
+
+    def test_mark_read_endpoint(self, auth_client, room, other_user):
+        message = send(room, other_user, "Hello")
+        url = reverse("chatroom-mark-read", kwargs={"pk": room.id})
+        assert auth_client.post(url, {"message_id": "x"}, format="json").status_code == status.HTTP_400_BAD_REQUEST
+        assert auth_client.post(url, {"message_id": message.id}, format="json").status_code == status.HTTP_200_OK
+        assert unread_counts(room)["alice"] == 0
+        response = auth_client.get(reverse("chatroom-messages", kwargs={"pk": room.id}))
+        results = response.data["results"] if "results" in response.data else response.data
+        assert [m["read_by_count"] for m in results] == [1]
+
+
+# ── Delta sync ────────────────────────────────────────────────────────────────
+
+class TestSync:
+    def test_messages_are_numbered_per_room(self, room, user, other_user):
+        second = make_room(user, other_user)
+        assert [send(room, user, str(i)).seq for i in range(3)] == [1, 2, 3]
+        message = send(second, user, "Other room")
+        assert (message.seq, message.updated_seq) == (1, 1)
+        room.refresh_from_db()
+        assert room.last_seq == 3
+
+    def test_edits_take_a_new_updated_seq(self, auth_client, room, user):
+        message = send(room, user, "Hello")
+        send(room, user, "Later")
+        auth_client.patch(reverse("message-detail", kwargs={"pk": message.id}), {"content": "Edited"}, format="json")
+        message.refresh_from_db()
+        assert (message.seq, message.updated_seq) == (1, 3)
+
+    def test_sync_returns_changes_and_tombstones(self, auth_client, room, user):
+        messages = [send(room, user, f"Message {i}") for i in range(4)]
+        auth_client.patch(reverse("message-detail", kwargs={"pk": messages[0].id}), {"content": "Edited"}, format="json")
+        auth_client.delete(reverse("message-detail", kwargs={"pk": messages[1].id}))
+
+        url = reverse("chatroom-sync", kwargs={"pk": room.id})
+        response = auth_client.get(url, {"since_seq": 3})
+        assert response.status_code == status.HTTP_200_OK
+        results = response.data["results"]
+        assert [m["id"] for m in results] == [messages[3].id, messages[0].id, messages[1].id]
+        assert results[1]["content"] == "Edited"
+        assert results[2] == {"id": messages[1].id, "room": room.id, "is_deleted": True, "seq": 2, "updated_seq": 6}
+        assert response.data["next_seq"] == 6
+        assert response.data["has_more"] is False
+
+    def test_saves_outside_a_transaction_reserve_their_seq_atomically(self, transactional_db, room, user):
+        # No test transaction here: Message.save has to open the one that
+        # assign_seq reserves the seq in.
+        message = Message.objects.create(room=room, sender=user, content="Hello")
+        message.content = "Edited"
+        message.save()
+        assert (message.seq, message.updated_seq) == (1, 2)
+        room.refresh_from_db()
+        assert room.last_seq == 2
+
+    def test_sync_pages_with_has_more(self, auth_client, room, user):
+        for i in range(3):
+            send(room, user, f"Message {i}")
+        url = reverse("chatroom-sync", kwargs={"pk": room.id})
+        response = auth_client.get(url, {"since_seq": 0, "limit": 2})
+        assert [m["seq"] for m in response.data["results"]] == [1, 2]
+        assert response.data["has_more"] is True
+        response = auth_client.get(url, {"since_seq": response.data["next_seq"], "limit": 2})
+        assert [m["seq"] for m in response.data["results"]] == [3]
+        assert response.data["has_more"] is False
+        assert auth_client.get(url, {"since_seq": "x"}).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_cleanup_sends_tombstones(self, auth_client, room, user):
+        from datetime import timedelta
+        from django.utils import timezone
+        from chats.tasks import cleanup_old_messages
+        old = [send(room, user, f"Old {i}") for i in range(2)]
+        send(room, user, "Recent")
+        Message.objects.filter(pk__in=[m.pk for m in old]).update(created_at=timezone.now() - timedelta(days=400))
+
+        assert cleanup_old_messages() == 2
+        response = auth_client.get(reverse("chatroom-sync", kwargs={"pk": room.id}), {"since_seq": 3})
+        assert [(m["id"], m["is_deleted"], m["updated_seq"]) for m in response.data["results"]] == [
+            (old[0].id, True, 4), (old[1].id, True, 5),
+        ]
+
+
+# ── Batched writes ────────────────────────────────────────────────────────────
+
+class TestMessageBatcher:
+    def test_write_messages_numbers_and_counts(self, room, user, other_user):
+        from chats.batcher import write_messages
+        second = make_room(user, other_user)
+        created = write_messages([
+            Message(room=room, sender=user, content="One"),
+            Message(room=second, sender=user, content="Two"),
+            Message(room=room, sender=other_user, content="Three"),
+        ])
+        assert all(m.pk for m in created)
+        assert [(m.seq, m.updated_seq) for m in created] == [(1, 1), (1, 1), (2, 2)]
+        room.refresh_from_db()
+        assert (room.last_seq, room.last_message_id) == (2, created[2].id)
+        assert unread_counts(room) == {"alice": 1, "bob": 1, "carol": 2}
+        assert unread_counts(second) == {"alice": 0, "bob": 1}
+
+    @pytest.mark.django_db(transaction=True)
+    def test_concurrent_saves_share_one_write(self, room, user, other_user, monkeypatch):
+        import asyncio
+        from chats import batcher
+        writes = []
+        write_messages = batcher.write_messages
+        monkeypatch.setattr(batcher, "write_messages", lambda messages: writes.append(len(messages)) or write_messages(messages))
+
+        async def save_all():
+            message_batcher = batcher.MessageBatcher(window=0.05)
+            return await asyncio.gather(*[
+                message_batcher.save(Message(room=room, sender=sender, content=f"Message {i}"))
+                for i, sender in enumerate([user, other_user, user])
+            ])
+
+        saved = asyncio.run(save_all())
+        assert writes == [3]
+        assert [m.seq for m in saved] == [1, 2, 3]
+        assert list(Message.objects.order_by("seq").values_list("content", flat=True)) == [
+            "Message 0", "Message 1", "Message 2",
+        ]
+
+    @pytest.mark.django_db(transaction=True)
+    def test_failed_batch_only_fails_the_offending_message(self, room, user, other_user):
+        import asyncio
+        from chats.batcher import MessageBatcher
+
+        async def save_all():
+            message_batcher = MessageBatcher(window=0.05)
+            return await asyncio.gather(
+                message_batcher.save(Message(room=room, sender=user, content="Fine")),
+                message_batcher.save(Message(room=room, sender=other_user, content="Broken", reply_to_id=999999)),
+                return_exceptions=True,
+            )
+
+        fine, broken = asyncio.run(save_all())
+        assert isinstance(fine, Message) and fine.pk
+        assert isinstance(broken, Exception)
+        assert list(Message.objects.values_list("content", flat=True)) == ["Fine"]
+        assert unread_counts(room) == {"alice": 0, "bob": 1, "carol": 1}
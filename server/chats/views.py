@@ -1,8 +1,13 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
 from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+
+from andromeda.pagination import CursorOrPageNumberPagination
+from . import inbox, sync
 from .models import ChatRoom, ChatMember, Message
 from .serializers import ChatRoomSerializer, MessageSerializer
 
@@ -11,11 +16,23 @@ User = get_user_model()
 
 class ChatRoomViewSet(viewsets.ModelViewSet):
     serializer_class = ChatRoomSerializer
+    pagination_class = CursorOrPageNumberPagination
+
+    @property
+    def keyset_ordering(self):
+        if self.action == 'messages':
+            return ('-created_at', '-id')
+        return ('-updated_at', '-id')
 
     def get_queryset(self):
+        my_unread_count = ChatMember.objects.filter(
+            room=OuterRef('pk'), user=self.request.user,
+        ).values('unread_count')[:1]
         return ChatRoom.objects.filter(
             members=self.request.user
-        ).prefetch_related('chatmember_set__user').order_by('-updated_at')
+        ).select_related('last_message_sender').prefetch_related(
+            'chatmember_set__user'
+        ).annotate(my_unread_count=Subquery(my_unread_count)).order_by('-updated_at')
 
     def create(self, request, *args, **kwargs):
         member_ids = request.data.get('member_ids', [])
@@ -45,6 +62,14 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
 
         return Response(ChatRoomSerializer(room, context={'request': request}).data, status=201)
 
+    def perform_update(self, serializer):
+        # Only the fields the client edits: a full save would write back the
+        # last_seq and inbox columns as read, undoing messages sent meanwhile.
+        room = serializer.instance
+        for field, value in serializer.validated_data.items():
+            setattr(room, field, value)
+        room.save(update_fields=[*serializer.validated_data, 'updated_at'])
+
     @action(detail=True, methods=['get'])
     def messages(self, request, pk=None):
         room = self.get_object()
@@ -59,11 +84,31 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
             )
         return Response(MessageSerializer(msgs, many=True, context={'request': request}).data)
 
+    @action(detail=True, methods=['get'])
+    def sync(self, request, pk=None):
+        """Messages created, edited or deleted after ?since_seq=, in change order."""
+        room = self.get_object()
+        try:
+            since_seq = max(int(request.query_params.get('since_seq', 0)), 0)
+            limit = int(request.query_params.get('limit', sync.SYNC_BATCH_SIZE))
+        except ValueError:
+            return Response({'detail': 'Invalid since_seq or limit.'}, status=status.HTTP_400_BAD_REQUEST)
+        messages, has_more = sync.changes(room.pk, since_seq, min(max(limit, 1), sync.SYNC_MAX_BATCH_SIZE))
+        return Response({
+            'results': MessageSerializer(messages, many=True, context={'request': request}).data,
+            'next_seq': messages[-1].updated_seq if messages else since_seq,
+            'has_more': has_more,
+        })
+
     @action(detail=True, methods=['post'])
     def mark_read(self, request, pk=None):
-        from django.utils import timezone
         room = self.get_object()
-        ChatMember.objects.filter(room=room, user=request.user).update(last_read_at=timezone.now())
+        message_id = request.data.get('message_id')
+        try:
+            message_id = int(message_id) if message_id is not None else None
+        except (TypeError, ValueError):
+            return Response({'detail': 'Invalid message_id.'}, status=status.HTTP_400_BAD_REQUEST)
+        inbox.mark_read(room.pk, request.user.id, message_id)
         return Response({'status': 'marked_read'})
 
     @action(detail=True, methods=['post'])
@@ -85,15 +130,21 @@ class MessageViewSet(viewsets.ModelViewSet):
         return qs.order_by('-created_at')
 
     def perform_create(self, serializer):
-        serializer.save(sender=self.request.user)
+        with transaction.atomic():
+            message = serializer.save(sender=self.request.user)
+            inbox.record_messages([message])
 
     def perform_update(self, serializer):
-        serializer.save(is_edited=True)
+        with transaction.atomic():
+            message = serializer.save(is_edited=True)
+            inbox.message_edited(message)
 
     def destroy(self, request, *args, **kwargs):
         msg = self.get_object()
         if msg.sender != request.user:
             return Response(status=403)
-        msg.is_deleted = True
-        msg.save()
+        with transaction.atomic():
+            msg.is_deleted = True
+            msg.save()
+            inbox.message_deleted(msg)
         return Response(status=204)
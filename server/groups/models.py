@@ -16,6 +16,8 @@ class Group(models.Model):
     description = models.TextField(blank=True)
     cover_photo = models.ImageField(upload_to='groups/covers/', null=True, blank=True)
     avatar = models.ImageField(upload_to='groups/avatars/', null=True, blank=True)
+    # Resized renditions of `avatar`, see andromeda/media.py
+    avatar_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     privacy = models.CharField(max_length=10, choices=PRIVACY_CHOICES, default=PRIVACY_PUBLIC)
     created_by = models.ForeignKey(
         settings.AUTH_USER_MODEL, related_name='created_groups', on_delete=models.SET_NULL, null=True
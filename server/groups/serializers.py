@@ -1,39 +1,50 @@
 from rest_framework import serializers
+
+from andromeda.loaders import BatchLoadingListSerializer, BatchLoadingMixin, batch_loader
+from andromeda.media import SrcsetField
 from .models import Group, GroupMember
 from users.serializers import UserSerializer
 
 
-class GroupMemberSerializer(serializers.ModelSerializer):
+def load_my_group_roles(viewer, group_ids):
+    return dict(
+        GroupMember.objects.filter(user=viewer, group_id__in=group_ids).values_list('group_id', 'role')
+    )
+
+
+class GroupMemberSerializer(BatchLoadingMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
 
     class Meta:
         model = GroupMember
         fields = ['id', 'user', 'role', 'joined_at']
+        list_serializer_class = BatchLoadingListSerializer
 
 
-class GroupSerializer(serializers.ModelSerializer):
+class GroupSerializer(BatchLoadingMixin, serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
     is_member = serializers.SerializerMethodField()
     my_role = serializers.SerializerMethodField()
+    avatar_srcset = SrcsetField(source='avatar_derivatives')
 
     class Meta:
         model = Group
         fields = [
-            'id', 'name', 'description', 'cover_photo', 'avatar',
+            'id', 'name', 'description', 'cover_photo', 'avatar', 'avatar_srcset',
             'privacy', 'created_by', 'members_count',
             'is_member', 'my_role', 'created_at',
         ]
         read_only_fields = ['created_by', 'members_count']
+        list_serializer_class = BatchLoadingListSerializer
+
+    def prime_viewer_fields(self, groups):
+        batch_loader(self.context, load_my_group_roles).prime(g.pk for g in groups)
 
     def get_is_member(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.memberships.filter(user=request.user).exists()
-        return False
+        return self.get_my_role(obj) is not None
 
     def get_my_role(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            m = obj.memberships.filter(user=request.user).first()
-            return m.role if m else None
+            return batch_loader(self.context, load_my_group_roles).load(obj.pk)
         return None
@@ -1,6 +1,7 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from andromeda.counters import adjust
 from .models import Group, GroupMember
 from .serializers import GroupSerializer, GroupMemberSerializer
 
@@ -31,15 +32,16 @@ class GroupViewSet(viewsets.ModelViewSet):
             return Response({'detail': 'Already a member.'}, status=400)
         if group.privacy == Group.PRIVACY_PUBLIC:
             GroupMember.objects.create(group=group, user=request.user)
-            Group.objects.filter(pk=group.pk).update(members_count=group.memberships.count())
+            adjust(Group, group.pk, members_count=1)
             return Response({'status': 'joined'})
         return Response({'status': 'request_pending'})
 
     @action(detail=True, methods=['post'])
     def leave(self, request, pk=None):
         group = self.get_object()
-        group.memberships.filter(user=request.user).delete()
-        Group.objects.filter(pk=group.pk).update(members_count=group.memberships.count())
+        deleted, _ = group.memberships.filter(user=request.user).delete()
+        if deleted:
+            adjust(Group, group.pk, members_count=-1)
         return Response({'status': 'left'})
 
     @action(detail=True, methods=['get'])
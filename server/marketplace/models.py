@@ -66,6 +66,8 @@ class Listing(models.Model):
 class ListingImage(models.Model):
     listing = models.ForeignKey(Listing, related_name='images', on_delete=models.CASCADE)
     image = models.ImageField(upload_to='marketplace/%Y/%m/')
+    # Resized renditions of `image`, see andromeda/media.py
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     is_primary = models.BooleanField(default=False)
     order = models.PositiveSmallIntegerField(default=0)
 
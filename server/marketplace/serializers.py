@@ -1,8 +1,19 @@
 from rest_framework import serializers
-from .models import Listing, ListingImage, Category, Review
+
+from andromeda.counters import LISTING_VIEWS
+from andromeda.loaders import BatchLoadingListSerializer, BatchLoadingMixin, batch_loader
+from andromeda.media import SrcsetField
+from .models import Listing, ListingImage, ListingLike, Category, Review
 from users.serializers import UserSerializer
 
 
+def load_liked_listings(viewer, listing_ids):
+    return dict.fromkeys(
+        ListingLike.objects.filter(user=viewer, listing_id__in=listing_ids).values_list('listing_id', flat=True),
+        True,
+    )
+
+
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
@@ -10,12 +21,19 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 class ListingImageSerializer(serializers.ModelSerializer):
+    srcset = SrcsetField(source='image_derivatives')
+
     class Meta:
         model = ListingImage
-        fields = ['id', 'image', 'is_primary', 'order']
+        fields = ['id', 'image', 'srcset', 'is_primary', 'order']
 
 
-class ListingSerializer(serializers.ModelSerializer):
+def load_pending_listing_views(viewer, pks):
+    return LISTING_VIEWS.pending(pks)
+
+
+class ListingSerializer(BatchLoadingMixin, serializers.ModelSerializer):
+    views_count = serializers.SerializerMethodField()
     seller = UserSerializer(read_only=True)
     images = ListingImageSerializer(many=True, read_only=True)
     category = CategorySerializer(read_only=True)
@@ -33,18 +51,31 @@ class ListingSerializer(serializers.ModelSerializer):
             'created_at', 'updated_at',
         ]
         read_only_fields = ['seller', 'views_count', 'likes_count']
+        list_serializer_class = BatchLoadingListSerializer
+
+    def prime(self, listings):
+        super().prime(listings)
+        batch_loader(self.context, load_pending_listing_views, 0).prime(obj.pk for obj in listings)
+
+    def get_views_count(self, obj):
+        # Stored count plus the view increments not flushed yet.
+        return obj.views_count + batch_loader(self.context, load_pending_listing_views, 0).load(obj.pk)
+
+    def prime_viewer_fields(self, listings):
+        batch_loader(self.context, load_liked_listings, False).prime(l.pk for l in listings)
 
     def get_is_liked(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.liked_by.filter(user=request.user).exists()
+            return batch_loader(self.context, load_liked_listings, False).load(obj.pk)
         return False
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(BatchLoadingMixin, serializers.ModelSerializer):
     reviewer = UserSerializer(read_only=True)
 
     class Meta:
         model = Review
         fields = ['id', 'listing', 'reviewer', 'rating', 'comment', 'created_at']
         read_only_fields = ['reviewer']
+        list_serializer_class = BatchLoadingListSerializer
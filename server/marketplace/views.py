@@ -1,6 +1,7 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from andromeda.counters import LISTING_VIEWS, adjust
 from .models import Listing, ListingImage, ListingLike, Category, Review
 from .serializers import ListingSerializer, ListingImageSerializer, CategorySerializer, ReviewSerializer
 
@@ -41,7 +42,7 @@ class ListingViewSet(viewsets.ModelViewSet):
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        Listing.objects.filter(pk=instance.pk).update(views_count=instance.views_count + 1)
+        LISTING_VIEWS.incr(instance.pk)
         return super().retrieve(request, *args, **kwargs)
 
     @action(detail=True, methods=['post'])
@@ -49,10 +50,11 @@ class ListingViewSet(viewsets.ModelViewSet):
         listing = self.get_object()
         like, created = ListingLike.objects.get_or_create(user=request.user, listing=listing)
         if not created:
-            like.delete()
-            Listing.objects.filter(pk=listing.pk).update(likes_count=listing.liked_by.count())
+            deleted, _ = like.delete()
+            if deleted:
+                adjust(Listing, listing.pk, likes_count=-1)
             return Response({'liked': False})
-        Listing.objects.filter(pk=listing.pk).update(likes_count=listing.liked_by.count())
+        adjust(Listing, listing.pk, likes_count=1)
         return Response({'liked': True})
 
     @action(detail=True, methods=['post'])
@@ -5,8 +5,10 @@ URL: ws://host/ws/notifications/?token=<JWT>
 import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from users.presence import PresenceMixin
 
-class NotificationConsumer(AsyncWebsocketConsumer):
+
+class NotificationConsumer(PresenceMixin, AsyncWebsocketConsumer):
     async def connect(self):
         user = self.scope.get('user')
         if not user or not user.is_authenticated:
@@ -18,10 +20,12 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
         await self.channel_layer.group_add(self.group_name, self.channel_name)
         await self.accept()
+        await self.join_presence()
 
     async def disconnect(self, close_code):
         if hasattr(self, 'group_name'):
             await self.channel_layer.group_discard(self.group_name, self.channel_name)
+        await self.leave_presence()
 
     async def receive(self, text_data):
         data = json.loads(text_data)
@@ -30,7 +34,7 @@ class NotificationConsumer(AsyncWebsocketConsumer):
 
     async def send_notification(self, event):
         """Called by channel layer when a notification is pushed."""
-        await self.send(text_data=json.dumps({k: v for k, v in event.items() if k != 'type'}))
+        await self.send(text_data=json.dumps(event['notification']))
 
     async def mark_notification_read(self, notification_id):
         from channels.db import database_sync_to_async
@@ -0,0 +1,94 @@
+"""
+@username mentions in posts, comments and chat messages.
+
+Mentions are tokenized with one regex pass and resolved with a single
+case-insensitive `username IN (...)` query (backed by the lower(username)
+index), however many users a text mentions. Notifications for them are
+created by notifications.tasks.send_mention_notifications on the
+`notifications` queue with one bulk INSERT and pushed over WebSockets in one
+batch.
+
+Who may be notified follows who can read the text: nobody for private posts,
+the author's friends for friends-only posts (comments inherit their post's
+privacy), room members for chat messages, and never blocked users.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.db.models.functions import Lower
+
+MAX_MENTIONS = 50
+
+# Usernames are letters, digits and @.+-_; a trailing '.' ends the sentence,
+# and e-mail addresses (user@example.com) are not mentions.
+MENTION_RE = re.compile(r'(?<![\w@.+-])@([\w.+-]+)')
+
+SOURCE_POST = 'post'
+SOURCE_COMMENT = 'comment'
+SOURCE_MESSAGE = 'message'
+
+
+def extract_mentions(text):
+    """Lowercase mentioned usernames in order of first appearance."""
+    names = []
+    for match in MENTION_RE.finditer(text or ''):
+        name = match.group(1).rstrip('.').lower()
+        if name and name not in names:
+            names.append(name)
+            if len(names) == MAX_MENTIONS:
+                break
+    return names
+
+
+def resolve_mentions(text):
+    """Active users mentioned in `text`, from one query."""
+    names = extract_mentions(text)
+    if not names:
+        return []
+    return list(
+        get_user_model().objects.annotate(username_lower=Lower('username'))
+        .filter(username_lower__in=names, is_active=True)
+        .only('id', 'username')
+    )
+
+
+def mention_source(source, object_id):
+    """
+    (sender_id, text, notification extra, audience filter) of a post, comment
+    or chat message; the filter narrows candidate user ids to those allowed to
+    be notified. Returns None if the object is gone.
+    """
+    from chats.models import ChatMember, Message
+    from posts.models import Comment, Post
+    from users.friends import friends_among
+
+    def post_audience(post):
+        if post.privacy == Post.PRIVACY_PRIVATE:
+            return lambda ids: set()
+        if post.privacy == Post.PRIVACY_FRIENDS:
+            return lambda ids: set(friends_among(post.author_id, ids))
+        return set
+
+    if source == SOURCE_POST:
+        post = Post.objects.filter(pk=object_id).first()
+        if post is None:
+            return None
+        return post.author_id, post.content, {'post_id': post.id}, post_audience(post)
+    if source == SOURCE_COMMENT:
+        comment = Comment.objects.select_related('post').filter(pk=object_id).first()
+        if comment is None:
+            return None
+        extra = {'post_id': comment.post_id, 'comment_id': comment.id}
+        return comment.author_id, comment.content, extra, post_audience(comment.post)
+    if source == SOURCE_MESSAGE:
+        message = Message.objects.filter(pk=object_id, is_deleted=False).first()
+        if message is None:
+            return None
+        room_id = message.room_id
+
+        def room_members(ids):
+            return set(ChatMember.objects.filter(room_id=room_id, user_id__in=ids).values_list('user_id', flat=True))
+
+        extra = {'room_id': room_id, 'message_id': message.id}
+        return message.sender_id, message.content, extra, room_members
+    raise ValueError(f'Unknown mention source: {source}')
@@ -45,6 +45,9 @@ class Notification(models.Model):
     class Meta:
         db_table = 'notifications'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', '-id'], name='notifications_recipient_idx'),
+        ]
 
     def __str__(self):
         return f'{self.notification_type} → {self.recipient.username}'
@@ -2,6 +2,7 @@
 Celery tasks for notifications.
 All tasks run on the 'notifications' RabbitMQ queue.
 """
+import asyncio
 from celery import shared_task
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
@@ -11,17 +12,41 @@ logger = logging.getLogger(__name__)
 channel_layer = get_channel_layer()
 
 
+def _notification_event(payload):
+    # The payload is nested: its own 'type' (like, comment, ...) would
+    # otherwise replace the consumer handler name.
+    return {'type': 'send_notification', 'notification': payload}
+
+
 def _push_to_websocket(user_id, payload):
     """Push a notification payload to a user's WS group."""
     try:
         async_to_sync(channel_layer.group_send)(
             f'notifications_{user_id}',
-            {'type': 'send_notification', **payload},
+            _notification_event(payload),
         )
     except Exception as e:
         logger.warning(f'WS push failed for user {user_id}: {e}')
 
 
+def _push_many_to_websocket(payloads):
+    """Push {user_id: payload} to many users' WS groups in one batch."""
+    async def send_all():
+        return await asyncio.gather(*[
+            channel_layer.group_send(f'notifications_{user_id}', _notification_event(payload))
+            for user_id, payload in payloads.items()
+        ], return_exceptions=True)
+
+    try:
+        results = async_to_sync(send_all)()
+    except Exception as e:
+        logger.warning(f'WS push failed for {len(payloads)} users: {e}')
+        return
+    failed = [user_id for user_id, result in zip(payloads, results) if isinstance(result, Exception)]
+    if failed:
+        logger.warning(f'WS push failed for users {failed}')
+
+
 @shared_task(name='notifications.tasks.send_like_notification', queue='notifications')
 def send_like_notification(liker_id, post_author_id, post_id):
     if liker_id == post_author_id:
@@ -83,6 +108,77 @@ def send_comment_notification(commenter_id, post_author_id, post_id, comment_id)
         logger.error(f'send_comment_notification error: {e}')
 
 
+@shared_task(name='notifications.tasks.send_mention_notifications', queue='notifications')
+def send_mention_notifications(source, object_id):
+    """Notify the users mentioned in a post, comment or chat message (see notifications.mentions)."""
+    try:
+        from django.contrib.auth import get_user_model
+        from notifications import mentions
+        from notifications.models import Notification
+        from users.search import blocked_ids
+
+        found = mentions.mention_source(source, object_id)
+        if found is None:
+            return 0
+        sender_id, text, extra, audience = found
+        mentioned = {user.id: user for user in mentions.resolve_mentions(text)}
+        mentioned.pop(sender_id, None)
+        if not mentioned:
+            return 0
+        sender = get_user_model().objects.get(id=sender_id)
+        allowed = audience(set(mentioned)) - blocked_ids(sender)
+        # Edits re-run this task; users already notified for this object are skipped.
+        allowed -= set(Notification.objects.filter(
+            notification_type=Notification.TYPE_MENTION,
+            recipient_id__in=allowed,
+            extra__source=source,
+            **{f'extra__{key}': value for key, value in extra.items()},
+        ).values_list('recipient_id', flat=True))
+        if not allowed:
+            return 0
+
+        title = f'{sender.username} mentioned you'
+        notifs = Notification.objects.bulk_create([
+            Notification(
+                recipient_id=user_id,
+                sender=sender,
+                notification_type=Notification.TYPE_MENTION,
+                title=title,
+                body=text[:100],
+                extra=dict(extra, source=source),
+            )
+            for user_id in sorted(allowed)
+        ])
+        _push_many_to_websocket({
+            notif.recipient_id: {
+                'id': notif.id,
+                'type': 'mention',
+                'title': title,
+                'sender': sender.username,
+                'sender_avatar': sender.avatar_url,
+                **extra,
+                'created_at': notif.created_at.isoformat(),
+            }
+            for notif in notifs
+        })
+        return len(notifs)
+    except Exception as e:
+        logger.error(f'send_mention_notifications error: {e}')
+        return 0
+
+
+def queue_mention_notifications(source, object_id, text):
+    """Enqueue send_mention_notifications after commit if `text` mentions anyone."""
+    from django.db import transaction
+    from notifications.mentions import extract_mentions
+
+    if not extract_mentions(text):
+        return
+    transaction.on_commit(lambda: send_mention_notifications.apply_async(
+        args=[source, object_id], queue='notifications',
+    ), robust=True)
+
+
 @shared_task(name='notifications.tasks.send_friend_request_notification', queue='notifications')
 def send_friend_request_notification(sender_id, receiver_id, request_id):
     try:
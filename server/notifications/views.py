@@ -1,12 +1,15 @@
 from rest_framework import generics, permissions
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
+
+from andromeda.pagination import CursorOrPageNumberPagination
 from .models import Notification
 from .serializers import NotificationSerializer
 
 
 class NotificationListView(generics.ListAPIView):
     serializer_class = NotificationSerializer
+    pagination_class = CursorOrPageNumberPagination
 
     def get_queryset(self):
         qs = Notification.objects.filter(recipient=self.request.user)
@@ -25,6 +25,8 @@ class Page(models.Model):
     description = models.TextField(blank=True)
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default=CATEGORY_OTHER)
     avatar = models.ImageField(upload_to='pages/avatars/', null=True, blank=True)
+    # Resized renditions of `avatar`, see andromeda/media.py
+    avatar_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     cover_photo = models.ImageField(upload_to='pages/covers/', null=True, blank=True)
     website = models.URLField(blank=True)
     email = models.EmailField(blank=True)
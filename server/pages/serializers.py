@@ -3,28 +3,43 @@ import string
 
 from django.utils.text import slugify
 from rest_framework import serializers
-from .models import Page
+
+from andromeda.loaders import BatchLoadingListSerializer, BatchLoadingMixin, batch_loader
+from andromeda.media import SrcsetField
+from .models import Page, PageFollow
 from users.serializers import UserSerializer
 
 
-class PageSerializer(serializers.ModelSerializer):
+def load_followed_pages(viewer, page_ids):
+    return dict.fromkeys(
+        PageFollow.objects.filter(user=viewer, page_id__in=page_ids).values_list('page_id', flat=True),
+        True,
+    )
+
+
+class PageSerializer(BatchLoadingMixin, serializers.ModelSerializer):
     created_by = UserSerializer(read_only=True)
     is_following = serializers.SerializerMethodField()
     username = serializers.CharField(required=False, allow_blank=True)
+    avatar_srcset = SrcsetField(source='avatar_derivatives')
 
     class Meta:
         model = Page
         fields = [
             'id', 'name', 'username', 'description', 'category',
-            'avatar', 'cover_photo', 'website', 'email', 'phone',
+            'avatar', 'avatar_srcset', 'cover_photo', 'website', 'email', 'phone',
             'is_verified', 'followers_count', 'created_by', 'is_following', 'created_at',
         ]
         read_only_fields = ['created_by', 'followers_count', 'is_verified']
+        list_serializer_class = BatchLoadingListSerializer
+
+    def prime_viewer_fields(self, pages):
+        batch_loader(self.context, load_followed_pages, False).prime(p.pk for p in pages)
 
     def get_is_following(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.followers.filter(user=request.user).exists()
+            return batch_loader(self.context, load_followed_pages, False).load(obj.pk)
         return False
 
     def create(self, validated_data):
@@ -1,6 +1,7 @@
 from rest_framework import viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from andromeda.counters import adjust
 from .models import Page, PageFollow
 from .serializers import PageSerializer
 
@@ -16,12 +17,14 @@ class PageViewSet(viewsets.ModelViewSet):
     def follow(self, request, pk=None):
         page = self.get_object()
         _, created = PageFollow.objects.get_or_create(page=page, user=request.user)
-        Page.objects.filter(pk=page.pk).update(followers_count=page.followers.count())
+        if created:
+            adjust(Page, page.pk, followers_count=1)
         return Response({'following': True, 'created': created})
 
     @action(detail=True, methods=['post'])
     def unfollow(self, request, pk=None):
         page = self.get_object()
-        PageFollow.objects.filter(page=page, user=request.user).delete()
-        Page.objects.filter(pk=page.pk).update(followers_count=page.followers.count())
+        deleted, _ = PageFollow.objects.filter(page=page, user=request.user).delete()
+        if deleted:
+            adjust(Page, page.pk, followers_count=-1)
         return Response({'following': False})
@@ -7,3 +7,6 @@ class PostsConfig(AppConfig):
 
     def ready(self):
         import posts.signals  # noqa: F401
+        from andromeda.media import track_derivatives
+        track_derivatives(self.get_model('Post'), 'image')
+        track_derivatives(self.get_model('PostMedia'), 'file', lambda media: media.media_type == 'image')
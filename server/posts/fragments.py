@@ -0,0 +1,109 @@
+"""
+Fragment cache for rendered posts.
+
+Most of a PostSerializer payload (author card, media, tags, counters, link
+preview) is the same for every viewer, yet a popular post was re-serialized
+for each timeline it appeared in. PostSerializer now caches that part as a
+fragment and only overlays the viewer fields (my_reaction, the author's
+friendship flags, the shared post) per request.
+
+A fragment key is derived from the row itself (updated_at and counters of the
+post and of its author, which the page query has already loaded), so edits and
+counter deltas never serve stale data. Changes that leave the post row alone
+(tags, media) bump a per-post version from signals instead. A page costs two
+cache round trips (versions, then fragments) via prefetch().
+"""
+import hashlib
+import logging
+import time
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+FRAGMENT_TTL = 600
+# Outlives every fragment written under the previous version, so an expired
+# version can never resurrect a stale fragment.
+VERSION_TTL = FRAGMENT_TTL * 2
+
+POST_KEY_FIELDS = ('likes_count', 'comments_count', 'shares_count') + tuple(
+    f'reaction_{reaction}_count' for reaction in ('like', 'love', 'haha', 'wow', 'sad', 'angry')
+)
+AUTHOR_KEY_FIELDS = ('friends_count', 'posts_count')
+
+
+def version_key(post_id):
+    return f'post_fragment_version:{post_id}'
+
+
+def invalidate(post_id):
+    try:
+        cache.set(version_key(post_id), time.time_ns(), VERSION_TTL)
+    except Exception as e:
+        logger.warning(f'Post fragment invalidation failed for {post_id}: {e}')
+
+
+def fragment_key(post, version, base_url):
+    author = post.author
+    parts = [
+        version, post.updated_at.isoformat(), *(getattr(post, f) for f in POST_KEY_FIELDS),
+        author.updated_at.isoformat(), *(getattr(author, f) for f in AUTHOR_KEY_FIELDS),
+        base_url,
+    ]
+    digest = hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+    return f'post_fragment:{post.pk}:{digest}'
+
+
+def _base_url(context):
+    # Fragments embed absolute media URLs.
+    request = context.get('request')
+    return request.build_absolute_uri('/') if request else ''
+
+
+def _entries(context):
+    """Request-scoped {post pk: (fragment key, fragment or None)}."""
+    request = context.get('request')
+    if request is None:
+        return {}
+    entries = getattr(request, '_post_fragments', None)
+    if entries is None:
+        entries = {}
+        setattr(request, '_post_fragments', entries)
+    return entries
+
+
+def prefetch(context, posts):
+    """Look up the fragments of `posts` in two cache round trips."""
+    entries = _entries(context)
+    posts = [post for post in posts if post.pk not in entries]
+    if not posts:
+        return entries
+    base_url = _base_url(context)
+    try:
+        versions = cache.get_many([version_key(post.pk) for post in posts])
+        keys = {
+            post.pk: fragment_key(post, versions.get(version_key(post.pk), 0), base_url)
+            for post in posts
+        }
+        found = cache.get_many(list(keys.values()))
+    except Exception as e:
+        logger.warning(f'Post fragment cache unavailable: {e}')
+        return entries
+    for pk, key in keys.items():
+        entries[pk] = (key, found.get(key))
+    return entries
+
+
+def get(context, post):
+    entries = prefetch(context, [post])
+    return entries[post.pk][1] if post.pk in entries else None
+
+
+def store(context, post, fragment):
+    entry = _entries(context).get(post.pk)
+    if entry is None:
+        return
+    try:
+        cache.set(entry[0], fragment, FRAGMENT_TTL)
+    except Exception as e:
+        logger.warning(f'Post fragment cache unavailable: {e}')
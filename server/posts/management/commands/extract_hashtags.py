@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts import fragments
+from posts.models import Post
+from posts.tags import queue_graph_sync, sync_post_tags
+
+
+class Command(BaseCommand):
+    help = 'Re-extract PostTag rows from the content of every post (e.g. posts written before hashtag parsing).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        changed = 0
+        posts = Post.objects.only('id', 'content').order_by('id')
+        for post in posts.iterator(chunk_size=options['chunk_size']):
+            added, removed = sync_post_tags(post)
+            if added or removed:
+                queue_graph_sync(post.id)
+                fragments.invalidate(post.id)
+                changed += 1
+        self.stdout.write(self.style.SUCCESS(f'Updated the tags of {changed} posts.'))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from andromeda.media import TRACKED, needs_derivatives, queue_derivatives
+
+
+class Command(BaseCommand):
+    help = 'Queue resized renditions for every tracked image that has none yet (e.g. uploads made before derivatives).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        queued = 0
+        for model, field, condition in TRACKED:
+            rows = model.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).order_by('pk')
+            for instance in rows.iterator(chunk_size=options['chunk_size']):
+                if (condition is None or condition(instance)) and needs_derivatives(instance, field):
+                    queue_derivatives(instance, field)
+                    queued += 1
+        self.stdout.write(self.style.SUCCESS(f'Queued derivatives for {queued} images.'))
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.10 on 2026-10-18 11:34
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+BACKFILL_BATCH_SIZE = 10000
+
+# Frozen copy of posts.search.SEARCH_VECTOR_SQL at the time of this migration.
+BACKFILL_SQL = """
+UPDATE posts AS p SET search_vector =
+    setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(t.name, ' ') FROM post_tags AS t WHERE t.post_id = p.id
+    ), '')), 'A') ||
+    setweight(to_tsvector('english', p.content), 'A') ||
+    setweight(to_tsvector('english', p.link_title), 'B') ||
+    setweight(to_tsvector('english', p.link_description), 'C') ||
+    setweight(to_tsvector('english', concat_ws(' ', u.username, u.first_name, u.last_name)), 'B')
+FROM users AS u
+WHERE u.id = p.author_id AND p.id >= %s AND p.id < %s
+"""
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT coalesce(max(id), 0) FROM posts')
+        (max_id,) = cursor.fetchone()
+        for start in range(0, max_id + 1, BACKFILL_BATCH_SIZE):
+            cursor.execute(BACKFILL_SQL, [start, start + BACKFILL_BATCH_SIZE])
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS posts_search_vector_idx ON posts USING gin (search_vector)'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS posts_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0002_post_posts_created_id_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 4.2.10 on 2026-10-18 11:41
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+REACTIONS = ['like', 'love', 'haha', 'wow', 'sad', 'angry']
+
+
+def backfill_reaction_counts(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    Like = apps.get_model('posts', 'Like')
+    for reaction in REACTIONS:
+        count = Like.objects.filter(post=OuterRef('pk'), reaction=reaction).order_by().values(
+            'post'
+        ).annotate(n=Count('pk')).values('n')
+        Post.objects.filter(pk__in=Like.objects.filter(reaction=reaction).values('post_id')).update(**{
+            f'reaction_{reaction}_count': Coalesce(Subquery(count, output_field=IntegerField()), 0),
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0003_post_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='reaction_angry_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reaction_haha_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reaction_like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reaction_love_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reaction_sad_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='reaction_wow_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_reaction_counts, migrations.RunPython.noop),
+    ]
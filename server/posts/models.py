@@ -1,6 +1,9 @@
 from django.conf import settings
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
 
+from andromeda.threads import PATH_MAX_LENGTH
+
 
 class Post(models.Model):
     TYPE_TEXT = 'text'
@@ -32,6 +35,8 @@ class Post(models.Model):
 
     # Media
     image = models.ImageField(upload_to='posts/images/%Y/%m/', null=True, blank=True)
+    # Resized renditions of `image`, see andromeda/media.py
+    image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     video = models.FileField(upload_to='posts/videos/%Y/%m/', null=True, blank=True)
     link_url = models.URLField(blank=True)
     link_title = models.CharField(max_length=255, blank=True)
@@ -50,12 +55,22 @@ class Post(models.Model):
     likes_count = models.PositiveIntegerField(default=0)
     comments_count = models.PositiveIntegerField(default=0)
     shares_count = models.PositiveIntegerField(default=0)
+    # Per-reaction breakdown of likes_count (see Like.count_field)
+    reaction_like_count = models.PositiveIntegerField(default=0)
+    reaction_love_count = models.PositiveIntegerField(default=0)
+    reaction_haha_count = models.PositiveIntegerField(default=0)
+    reaction_wow_count = models.PositiveIntegerField(default=0)
+    reaction_sad_count = models.PositiveIntegerField(default=0)
+    reaction_angry_count = models.PositiveIntegerField(default=0)
 
     # Share
     shared_post = models.ForeignKey(
         'self', null=True, blank=True, related_name='shares', on_delete=models.SET_NULL
     )
 
+    # Full-text search document, maintained by posts.search (PostgreSQL only)
+    search_vector = SearchVectorField(null=True, editable=False)
+
     is_edited = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -63,14 +78,27 @@ class Post(models.Model):
     class Meta:
         db_table = 'posts'
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination and per-author timelines
+            models.Index(fields=['-created_at', '-id'], name='posts_created_id_idx'),
+            models.Index(fields=['author', '-created_at'], name='posts_author_created_idx'),
+        ]
 
     def __str__(self):
         return f'Post by {self.author.username} @ {self.created_at:%Y-%m-%d}'
 
+    @property
+    def reaction_counts(self):
+        return {
+            reaction: getattr(self, Like.count_field(reaction))
+            for reaction, _label in Like.REACTION_CHOICES
+        }
+
 
 class PostMedia(models.Model):
     post = models.ForeignKey(Post, related_name='media', on_delete=models.CASCADE)
     file = models.FileField(upload_to='posts/media/%Y/%m/')
+    file_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     media_type = models.CharField(max_length=10, choices=[('image', 'Image'), ('video', 'Video')])
     order = models.PositiveSmallIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -105,6 +133,11 @@ class Like(models.Model):
         db_table = 'likes'
         unique_together = ('user', 'post')
 
+    @staticmethod
+    def count_field(reaction):
+        """The Post column counting `reaction`, e.g. 'reaction_love_count'."""
+        return f'reaction_{reaction}_count'
+
 
 class Comment(models.Model):
     post = models.ForeignKey(Post, related_name='comments', on_delete=models.CASCADE)
@@ -115,6 +148,9 @@ class Comment(models.Model):
     parent = models.ForeignKey(
         'self', null=True, blank=True, related_name='replies', on_delete=models.CASCADE
     )
+    # Materialized thread position, see andromeda.threads.
+    path = models.CharField(max_length=PATH_MAX_LENGTH, blank=True, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     likes_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -122,6 +158,14 @@ class Comment(models.Model):
     class Meta:
         db_table = 'comments'
         ordering = ['created_at']
+        indexes = [
+            # Keyset pages of top-level comments and the windowed reply previews.
+            models.Index(fields=['post', 'parent', 'created_at', 'id'], name='comments_thread_idx'),
+            models.Index(fields=['parent', 'created_at', 'id'], name='comments_replies_idx'),
+            # Subtrees are path prefixes (LIKE 'prefix%'); whole threads are read by (post, path).
+            models.Index(fields=['path'], name='comments_path_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['post', 'path'], name='comments_post_path_idx'),
+        ]
 
     def __str__(self):
         return f'Comment by {self.author.username} on Post {self.post_id}'
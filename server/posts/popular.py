@@ -0,0 +1,173 @@
+"""
+"Popular now": posts ranked by time-decayed engagement.
+
+Every like, comment and share adds its weight to the post's score in one Redis
+sorted set, decayed exponentially with HALF_LIFE from the moment it happened.
+Instead of rewriting every score as time passes, an event at time t adds
+weight * 2 ** ((t - base) / HALF_LIFE): all scores share the same pending
+factor 2 ** ((base - now) / HALF_LIFE), so the set is always ordered by the
+decayed score and reading the top K is one ZREVRANGE. posts.tasks.prune_popular
+periodically folds that factor in (moving `base` forward so scores stay small)
+and drops posts older than RETENTION, tracked in a second set scored by
+creation time. Removed likes and comments subtract their current weight.
+Callers pass the post's created_at along with the event, so scoring needs no
+query.
+
+Reads only look up the ranked ids and filter them through the usual privacy
+rules; without Redis the endpoint ranks recent posts by their counters.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.db.models import F
+from django.utils import timezone
+
+from andromeda.redis_client import get_redis, redis_key
+from .models import Post
+from .timeline import visible_queryset
+
+logger = logging.getLogger(__name__)
+
+WEIGHTS = {'like': 1, 'comment': 2, 'share': 3}
+HALF_LIFE = 6 * 60 * 60
+RETENTION = 3 * 24 * 60 * 60
+REBASE_AFTER = 24 * 60 * 60
+POPULAR_LIMIT = 20
+POPULAR_MAX_LIMIT = 100
+# Ranked ids read per requested post; some are filtered out by privacy.
+POPULAR_OVERFETCH = 2
+PRUNE_BATCH_SIZE = 1000
+
+# KEYS: scores, meta, created; ARGV: post id, weight, now, post created_at, half-life
+ADD_SCRIPT = """
+local base = tonumber(redis.call('HGET', KEYS[2], 'base'))
+if not base then
+    base = tonumber(ARGV[3])
+    redis.call('HSET', KEYS[2], 'base', ARGV[3])
+end
+local delta = tonumber(ARGV[2]) * 2 ^ ((tonumber(ARGV[3]) - base) / tonumber(ARGV[5]))
+if delta < 0 then
+    local current = tonumber(redis.call('ZSCORE', KEYS[1], ARGV[1]))
+    if not current then
+        return 0
+    end
+    if current + delta <= 0 then
+        redis.call('ZREM', KEYS[1], ARGV[1])
+        redis.call('ZREM', KEYS[3], ARGV[1])
+        return 0
+    end
+end
+redis.call('ZINCRBY', KEYS[1], delta, ARGV[1])
+redis.call('ZADD', KEYS[3], 'NX', ARGV[4], ARGV[1])
+return 1
+"""
+
+# KEYS: scores, meta; ARGV: now, half-life, rebase after
+REBASE_SCRIPT = """
+local base = tonumber(redis.call('HGET', KEYS[2], 'base'))
+if not base or tonumber(ARGV[1]) - base < tonumber(ARGV[3]) then
+    return 0
+end
+local factor = 2 ^ ((base - tonumber(ARGV[1])) / tonumber(ARGV[2]))
+redis.call('ZUNIONSTORE', KEYS[1], 1, KEYS[1], 'WEIGHTS', factor)
+redis.call('HSET', KEYS[2], 'base', ARGV[1])
+return 1
+"""
+
+
+def scores_key():
+    return redis_key('popular', 'scores')
+
+
+def meta_key():
+    return redis_key('popular', 'meta')
+
+
+def created_key():
+    return redis_key('popular', 'created')
+
+
+def add(post_id, kind, created_at, count=1, now=None):
+    """
+    Count `count` engagements of `kind` (a WEIGHTS key) on a post created at
+    `created_at`; negative counts take them back.
+    """
+    redis = get_redis()
+    if redis is None or created_at is None:
+        return
+    now = now or time.time()
+    if now - created_at.timestamp() >= RETENTION:
+        return
+    try:
+        redis.register_script(ADD_SCRIPT)(
+            keys=[scores_key(), meta_key(), created_key()],
+            args=[post_id, count * WEIGHTS[kind], now, created_at.timestamp(), HALF_LIFE],
+        )
+    except Exception as e:
+        logger.warning(f'Popular score update failed for post {post_id}: {e}')
+
+
+def remove(post_id):
+    redis = get_redis()
+    if redis is None:
+        return
+    try:
+        pipe = redis.pipeline()
+        pipe.zrem(scores_key(), post_id)
+        pipe.zrem(created_key(), post_id)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f'Popular score removal failed for post {post_id}: {e}')
+
+
+def prune(now=None):
+    """Fold the decay into the stored scores and drop expired posts; returns posts dropped."""
+    redis = get_redis()
+    if redis is None:
+        return 0
+    now = now or time.time()
+    redis.register_script(REBASE_SCRIPT)(keys=[scores_key(), meta_key()], args=[now, HALF_LIFE, REBASE_AFTER])
+    dropped = 0
+    while True:
+        expired = redis.zrangebyscore(created_key(), '-inf', now - RETENTION, start=0, num=PRUNE_BATCH_SIZE)
+        if not expired:
+            return dropped
+        pipe = redis.pipeline()
+        pipe.zrem(scores_key(), *expired)
+        pipe.zrem(created_key(), *expired)
+        pipe.execute()
+        dropped += len(expired)
+
+
+def _db_top(viewer, queryset, limit):
+    since = timezone.now() - timedelta(seconds=RETENTION)
+    engagement = (
+        F('likes_count') * WEIGHTS['like'] +
+        F('comments_count') * WEIGHTS['comment'] +
+        F('shares_count') * WEIGHTS['share']
+    )
+    return list(visible_queryset(viewer.id, queryset).filter(created_at__gte=since).exclude(
+        privacy=Post.PRIVACY_PRIVATE,
+    ).annotate(engagement=engagement).filter(engagement__gt=0).order_by('-engagement', '-id')[:limit])
+
+
+def top(viewer, queryset, limit=POPULAR_LIMIT):
+    """The `limit` highest scored posts of `queryset` that `viewer` may see."""
+    redis = get_redis()
+    if redis is None:
+        return _db_top(viewer, queryset, limit)
+    try:
+        ids = [int(pk) for pk in redis.zrevrange(scores_key(), 0, limit * POPULAR_OVERFETCH - 1)]
+    except Exception as e:
+        logger.warning(f'Popular feed unavailable: {e}')
+        return _db_top(viewer, queryset, limit)
+    since = timezone.now() - timedelta(seconds=RETENTION)
+    # Scores are kept whatever the privacy; private posts are dropped here.
+    posts = {
+        post.pk: post
+        for post in visible_queryset(viewer.id, queryset.filter(pk__in=ids, created_at__gte=since)).exclude(
+            privacy=Post.PRIVACY_PRIVATE,
+        )
+    }
+    return [posts[pk] for pk in ids if pk in posts][:limit]
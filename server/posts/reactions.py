@@ -0,0 +1,125 @@
+"""
+The reaction write path behind PostViewSet.react.
+
+A tap creates the viewer's reaction, switches it to another type, or removes
+it when it repeats the current one. On PostgreSQL set_reaction() does all of
+that in one statement, one round trip: data-modifying CTEs read the previous
+reaction, DELETE or INSERT ... ON CONFLICT DO UPDATE the row and apply the
+likes_count and reaction histogram deltas to the post, returning the previous
+and new state and the post's created_at. No Like signals run, so the
+popular-feed score and the LIKED edge in Neo4j are queued here, after commit.
+
+Other databases (SQLite in settings_test) use the ORM inside a transaction,
+where the Like signals adjust the counters.
+"""
+from collections import namedtuple
+
+from django.db import connection, transaction
+
+from andromeda.counters import adjust
+from .models import Like, Post
+
+# `previous` and `current` are reaction types or None (no reaction).
+ReactionChange = namedtuple('ReactionChange', ['previous', 'current'])
+
+REACTIONS = [reaction for reaction, _ in Like.REACTION_CHOICES]
+
+
+def _histogram_sql():
+    # A reaction type gains one when it is added and loses one when it is
+    # removed or switched away from.
+    return ',\n        '.join(
+        f"{Like.count_field(r)} = GREATEST({Like.count_field(r)}"
+        f" + (c.added IS NOT DISTINCT FROM '{r}')::int"
+        f" - (c.removed IS NOT DISTINCT FROM '{r}'"
+        f" OR c.inserted IS FALSE AND c.previous IS NOT DISTINCT FROM '{r}')::int, 0)"
+        for r in REACTIONS
+    )
+
+
+# The INSERT only runs when the DELETE did not (repeating the current reaction
+# removes it); its WHERE makes a concurrent identical tap a no-op, and xmax = 0
+# tells a fresh insert from a switched row. `prev` reads the statement's
+# snapshot: all CTEs see the same one, so it is the reaction before this tap
+# unless a concurrent tap of the same user switched it in between, in which
+# case the histogram drifts by one until counters.reconcile_counters runs.
+SET_REACTION_SQL = """
+WITH prev AS (
+    SELECT reaction FROM likes
+    WHERE user_id = %(user_id)s AND post_id = %(post_id)s
+), removed AS (
+    DELETE FROM likes
+    WHERE user_id = %(user_id)s AND post_id = %(post_id)s AND reaction = %(reaction)s
+    RETURNING reaction
+), upserted AS (
+    INSERT INTO likes (user_id, post_id, reaction, created_at)
+    SELECT %(user_id)s, %(post_id)s, %(reaction)s, now()
+    WHERE NOT EXISTS (SELECT 1 FROM removed)
+    ON CONFLICT (user_id, post_id) DO UPDATE SET reaction = EXCLUDED.reaction
+        WHERE likes.reaction <> EXCLUDED.reaction
+    RETURNING reaction, (xmax = 0) AS inserted
+), c AS (
+    SELECT
+        (SELECT reaction FROM prev) AS previous,
+        (SELECT reaction FROM removed) AS removed,
+        (SELECT reaction FROM upserted) AS added,
+        (SELECT inserted FROM upserted) AS inserted
+), counted AS (
+    UPDATE posts SET
+        likes_count = GREATEST(likes_count
+            + (c.inserted IS TRUE)::int
+            - (c.removed IS NOT NULL)::int, 0),
+        {histogram}
+    FROM c
+    WHERE posts.id = %(post_id)s
+    RETURNING posts.created_at
+)
+SELECT previous, removed, added, inserted, (SELECT created_at FROM counted) FROM c
+""".format(histogram=_histogram_sql())
+
+
+def _after_commit(user_id, post_id, created_at, created, removed):
+    from . import popular
+    from .tasks import link_liked_post
+
+    if created:
+        transaction.on_commit(lambda: popular.add(post_id, 'like', created_at))
+        transaction.on_commit(lambda: link_liked_post.apply_async(args=[user_id, post_id], queue='default'))
+    if removed:
+        transaction.on_commit(lambda: popular.add(post_id, 'like', created_at, count=-1))
+
+
+def _set_reaction_sql(user_id, post_id, reaction):
+    with connection.cursor() as cursor:
+        cursor.execute(SET_REACTION_SQL, {'user_id': user_id, 'post_id': post_id, 'reaction': reaction})
+        previous, removed, added, inserted, created_at = cursor.fetchone()
+    _after_commit(user_id, post_id, created_at, created=bool(inserted), removed=removed is not None)
+    if removed is not None:
+        return ReactionChange(removed, None)
+    if added is None:
+        # A concurrent identical tap already stored this reaction.
+        return ReactionChange(reaction, reaction)
+    return ReactionChange(None if inserted else previous, added)
+
+
+def _set_reaction_orm(user_id, post_id, reaction):
+    # Creating and deleting a Like adjusts the counters in posts.signals.
+    with transaction.atomic():
+        like = Like.objects.select_for_update().filter(user_id=user_id, post_id=post_id).first()
+        if like is None:
+            Like.objects.create(user_id=user_id, post_id=post_id, reaction=reaction)
+            return ReactionChange(None, reaction)
+        if like.reaction == reaction:
+            like.delete()
+            return ReactionChange(reaction, None)
+        previous, like.reaction = like.reaction, reaction
+        like.save(update_fields=['reaction'])
+        adjust(Post, post_id, **{Like.count_field(previous): -1, Like.count_field(reaction): 1})
+        return ReactionChange(previous, reaction)
+
+
+def set_reaction(user_id, post_id, reaction):
+    """Create, switch or remove `user_id`'s reaction on a post; returns a ReactionChange."""
+    if connection.vendor == 'postgresql':
+        return _set_reaction_sql(user_id, post_id, reaction)
+    return _set_reaction_orm(user_id, post_id, reaction)
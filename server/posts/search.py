@@ -0,0 +1,75 @@
+"""
+Full-text search over posts.
+
+On PostgreSQL every post carries a weighted `search_vector` (tags and content,
+link title, link description, author names) kept up to date by posts.signals
+and backed by a GIN index, so a search is one index scan ranked with ts_rank
+and needs no joins. Other databases (SQLite in settings_test) fall back to the
+original icontains filter.
+"""
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connection
+from django.db.models import F, Q
+
+SEARCH_CONFIG = 'english'
+
+SEARCH_VECTOR_SQL = """
+UPDATE posts AS p SET search_vector =
+    setweight(to_tsvector(%(config)s, coalesce((
+        SELECT string_agg(t.name, ' ') FROM post_tags AS t WHERE t.post_id = p.id
+    ), '')), 'A') ||
+    setweight(to_tsvector(%(config)s, p.content), 'A') ||
+    setweight(to_tsvector(%(config)s, p.link_title), 'B') ||
+    setweight(to_tsvector(%(config)s, p.link_description), 'C') ||
+    setweight(to_tsvector(%(config)s, concat_ws(' ', u.username, u.first_name, u.last_name)), 'B')
+FROM users AS u
+WHERE u.id = p.author_id AND {where}
+"""
+
+
+def uses_search_vector():
+    return connection.vendor == 'postgresql'
+
+
+def update_search_vectors(post_ids=None, author_id=None):
+    """Recompute the search document of the given posts (or of an author's posts)."""
+    if not uses_search_vector():
+        return
+    if post_ids is not None:
+        where, params = 'p.id = ANY(%(ids)s)', {'ids': list(post_ids)}
+    else:
+        where, params = 'p.author_id = %(author_id)s', {'author_id': author_id}
+    with connection.cursor() as cursor:
+        cursor.execute(
+            SEARCH_VECTOR_SQL.format(where=where),
+            dict(params, config=SEARCH_CONFIG),
+        )
+
+
+def to_prefix_query(text):
+    """'run fas' -> 'run:* & fas:*', so partially typed words still match."""
+    terms = re.findall(r'\w+', text)
+    return ' & '.join(f'{term}:*' for term in terms)
+
+
+def search_posts(queryset, text):
+    """Filter `queryset` to posts matching `text`, best matches first."""
+    if not uses_search_vector():
+        return queryset.filter(
+            Q(content__icontains=text) |
+            Q(link_title__icontains=text) |
+            Q(link_description__icontains=text) |
+            Q(author__username__icontains=text) |
+            Q(author__first_name__icontains=text) |
+            Q(author__last_name__icontains=text) |
+            Q(tags__name__icontains=text)
+        ).distinct().order_by('-created_at')
+    raw = to_prefix_query(text)
+    if not raw:
+        return queryset.none()
+    query = SearchQuery(raw, config=SEARCH_CONFIG, search_type='raw')
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query),
+    ).order_by('-rank', '-created_at', '-id')
@@ -1,7 +1,46 @@
+from django.db.models import Count, F, Window
+from django.db.models.functions import RowNumber
 from rest_framework import serializers
+
+from andromeda.loaders import BatchLoadingListSerializer, BatchLoadingMixin, batch_loader
+from andromeda.media import SrcsetField
+from andromeda.pagination import KeysetPagination
+from . import fragments
 from .models import Post, Like, Comment, PostMedia, PostTag
 from users.serializers import UserSerializer
 
+REPLY_PREVIEW_SIZE = 5
+REPLY_ORDERING = ('created_at', 'id')
+NO_REPLIES = ([], 0)
+
+
+def load_my_reactions(viewer, post_ids):
+    return dict(
+        Like.objects.filter(user=viewer, post_id__in=post_ids).values_list('post_id', 'reaction')
+    )
+
+
+def load_reply_previews(viewer, parent_ids):
+    """
+    The first REPLY_PREVIEW_SIZE replies and the total reply count of every
+    parent, as {parent_id: (replies, count)}, from one windowed query.
+    """
+    partition = {'partition_by': F('parent_id')}
+    replies = Comment.objects.filter(parent_id__in=parent_ids).select_related('author').annotate(
+        position=Window(RowNumber(), order_by=[F(f).asc() for f in REPLY_ORDERING], **partition),
+        siblings=Window(Count('id'), **partition),
+    ).filter(position__lte=REPLY_PREVIEW_SIZE).order_by('parent_id', 'position')
+    previews = {}
+    for reply in replies:
+        previews.setdefault(reply.parent_id, ([], reply.siblings))[0].append(reply)
+    return previews
+
+
+def replies_cursor(last_reply):
+    paginator = KeysetPagination()
+    paginator.ordering = REPLY_ORDERING
+    return paginator.encode_cursor(last_reply)
+
 
 class PostTagSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,54 +49,129 @@ class PostTagSerializer(serializers.ModelSerializer):
 
 
 class PostMediaSerializer(serializers.ModelSerializer):
+    srcset = SrcsetField(source='file_derivatives')
+
     class Meta:
         model = PostMedia
-        fields = ['id', 'file', 'media_type', 'order']
+        fields = ['id', 'file', 'srcset', 'media_type', 'order']
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(BatchLoadingMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     replies = serializers.SerializerMethodField()
+    reply_count = serializers.SerializerMethodField()
+    replies_cursor = serializers.SerializerMethodField()
 
     class Meta:
         model = Comment
-        fields = ['id', 'post', 'author', 'content', 'parent', 'likes_count', 'replies', 'created_at']
+        fields = [
+            'id', 'post', 'author', 'content', 'parent', 'depth', 'likes_count',
+            'replies', 'reply_count', 'replies_cursor', 'created_at',
+        ]
         read_only_fields = ['post', 'author', 'likes_count', 'created_at']
         extra_kwargs = {
             'parent': {'required': False, 'allow_null': True},
         }
+        list_serializer_class = BatchLoadingListSerializer
+
+    def validate_parent(self, parent):
+        post = self.context.get('post')
+        if parent is not None and post is not None and parent.post_id != post.pk:
+            raise serializers.ValidationError('The parent comment belongs to a different post.')
+        return parent
+
+    def prime(self, comments):
+        super().prime(comments)
+        top_level = [c.pk for c in comments if c.parent_id is None]
+        if 'replies' not in self.fields or not top_level:
+            return
+        previews = batch_loader(self.context, load_reply_previews, NO_REPLIES).prime(top_level)
+        # Resolve the previews now so the reply authors are batched with the
+        # page's authors instead of once per nested replies list.
+        replies = [reply for pk in top_level for reply in previews.load(pk)[0]]
+        if replies:
+            self.fields['author'].prime([reply.author for reply in replies])
+
+    def _reply_preview(self, obj):
+        if obj.parent_id is not None:
+            return NO_REPLIES
+        return batch_loader(self.context, load_reply_previews, NO_REPLIES).load(obj.pk)
 
     def get_replies(self, obj):
-        if obj.parent is None:
-            return CommentSerializer(obj.replies.all()[:5], many=True, context=self.context).data
-        return []
+        replies, _count = self._reply_preview(obj)
+        return CommentSerializer(replies, many=True, context=self.context).data
+
+    def get_reply_count(self, obj):
+        return self._reply_preview(obj)[1]
+
+    def get_replies_cursor(self, obj):
+        """Cursor for /api/posts/comments/{id}/replies/ when more replies exist."""
+        replies, count = self._reply_preview(obj)
+        if count > len(replies):
+            return replies_cursor(replies[-1])
+        return None
+
 
+class ThreadCommentSerializer(CommentSerializer):
+    """Flat thread entry: replies follow in path order instead of being nested."""
 
-class PostSerializer(serializers.ModelSerializer):
+    class Meta(CommentSerializer.Meta):
+        fields = ['id', 'post', 'author', 'content', 'parent', 'depth', 'likes_count', 'created_at']
+
+
+class PostSerializer(BatchLoadingMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     tags = PostTagSerializer(many=True, read_only=True)
     media = PostMediaSerializer(many=True, read_only=True)
     my_reaction = serializers.SerializerMethodField()
+    reaction_counts = serializers.ReadOnlyField()
     shared_post_data = serializers.SerializerMethodField()
+    image_srcset = SrcsetField(source='image_derivatives')
 
     class Meta:
         model = Post
         fields = [
             'id', 'author', 'content', 'post_type', 'privacy',
-            'image', 'video', 'link_url', 'link_title', 'link_description', 'link_image',
+            'image', 'image_srcset', 'video', 'link_url', 'link_title', 'link_description', 'link_image',
             'group', 'page',
-            'likes_count', 'comments_count', 'shares_count',
+            'likes_count', 'reaction_counts', 'comments_count', 'shares_count',
             'shared_post', 'shared_post_data',
             'is_edited', 'tags', 'media', 'my_reaction',
             'created_at', 'updated_at',
         ]
         read_only_fields = ['author', 'likes_count', 'comments_count', 'shares_count', 'is_edited']
+        list_serializer_class = BatchLoadingListSerializer
+
+    # Rendered per request on top of the cached fragment (see posts.fragments).
+    VIEWER_FIELDS = ('my_reaction', 'shared_post_data')
+
+    def prime(self, posts):
+        # Shared posts are rendered inline, so batch them with the page.
+        shared = [post.shared_post for post in posts if post.shared_post_id and post.shared_post]
+        super().prime(posts + shared)
+        fragments.prefetch(self.context, posts + shared)
+
+    def to_representation(self, instance):
+        fragment = fragments.get(self.context, instance)
+        if fragment is None:
+            data = super().to_representation(instance)
+            fragments.store(self.context, instance, {
+                k: None if k in self.VIEWER_FIELDS else v for k, v in data.items()
+            })
+            return data
+        data = dict(fragment)
+        data['author'] = dict(data['author'], **self.fields['author'].viewer_fields(instance.author))
+        data['my_reaction'] = self.get_my_reaction(instance)
+        data['shared_post_data'] = self.get_shared_post_data(instance)
+        return data
+
+    def prime_viewer_fields(self, posts):
+        batch_loader(self.context, load_my_reactions).prime(post.pk for post in posts)
 
     def get_my_reaction(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            like = Like.objects.filter(user=request.user, post=obj).first()
-            return like.reaction if like else None
+            return batch_loader(self.context, load_my_reactions).load(obj.pk)
         return None
 
     def get_shared_post_data(self, obj):
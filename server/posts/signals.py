@@ -1,59 +1,169 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import Post, Like, Comment
+from andromeda.counters import adjust
+from andromeda.media import derivatives_ready
+from andromeda.threads import assign_path
+from notifications.mentions import SOURCE_COMMENT, SOURCE_POST
+from notifications.tasks import queue_mention_notifications
+from . import fragments, popular, trending
+from .models import Post, Like, Comment, PostMedia, PostTag
+from .search import update_search_vectors, uses_search_vector
+from .tags import queue_graph_sync, sync_post_tags
+from .tasks import link_liked_post
+
+AUTHOR_SEARCH_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+def _created_at(instance, field):
+    """created_at of the post `field` of `instance` points at (loaded once), or None if it is gone."""
+    try:
+        return getattr(instance, field).created_at
+    except Post.DoesNotExist:
+        return None
+
+
+def _deleting_posts(origin):
+    """Whether a delete cascades from posts, which leave the popular feed anyway."""
+    return isinstance(origin, Post) or getattr(origin, 'model', None) is Post
 
 
 @receiver(post_save, sender=Post)
 def sync_post_to_neo4j(sender, instance, created, **kwargs):
     if not created:
         return
+    adjust(get_user_model(), instance.author_id, posts_count=1)
+    if instance.shared_post_id:
+        adjust(Post, instance.shared_post_id, shares_count=1)
+        shared_post_id, created_at = instance.shared_post_id, _created_at(instance, 'shared_post')
+        transaction.on_commit(lambda: popular.add(shared_post_id, 'share', created_at))
+    try:
+        from posts.tasks import fan_out_post
+        transaction.on_commit(
+            lambda: fan_out_post.apply_async(args=[instance.id], queue='default')
+        )
+    except Exception:
+        pass
     try:
         from users.graph_models import UserNode, PostNode
         post_node = PostNode(post_id=instance.id, author_id=instance.author_id).save()
         author_node = UserNode.nodes.get_or_none(user_id=instance.author_id)
         if author_node and post_node:
             author_node.created_posts.connect(post_node)
-        # Update post count
-        instance.author.__class__.objects.filter(pk=instance.author_id).update(
-            posts_count=Post.objects.filter(author_id=instance.author_id).count()
-        )
     except Exception:
         pass
 
 
+@receiver(post_save, sender=Post)
+def notify_post_mentions(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'content' not in update_fields:
+        return
+    queue_mention_notifications(SOURCE_POST, instance.id, instance.content)
+
+
+@receiver(post_save, sender=Post)
+def sync_hashtags(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is not None and 'content' not in update_fields:
+        return
+    added, removed = sync_post_tags(instance)
+    if added or removed:
+        post_id = instance.id
+        transaction.on_commit(lambda: queue_graph_sync(post_id))
+    if added:
+        transaction.on_commit(lambda: trending.record(added))
+
+
+@receiver(post_delete, sender=Post)
+def on_post_deleted(sender, instance, **kwargs):
+    adjust(get_user_model(), instance.author_id, posts_count=-1)
+    if instance.shared_post_id:
+        adjust(Post, instance.shared_post_id, shares_count=-1)
+        shared_post_id, created_at = instance.shared_post_id, _created_at(instance, 'shared_post')
+        transaction.on_commit(lambda: popular.add(shared_post_id, 'share', created_at, count=-1))
+    post_id = instance.id
+    transaction.on_commit(lambda: popular.remove(post_id))
+
+
 @receiver(post_save, sender=Like)
 def on_like_created(sender, instance, created, **kwargs):
     if created:
-        Post.objects.filter(pk=instance.post_id).update(
-            likes_count=Like.objects.filter(post_id=instance.post_id).count()
-        )
-        try:
-            from users.graph_models import UserNode, PostNode
-            user_node = UserNode.nodes.get_or_none(user_id=instance.user_id)
-            post_node = PostNode.nodes.get_or_none(post_id=instance.post_id)
-            if user_node and post_node and not user_node.liked_posts.is_connected(post_node):
-                user_node.liked_posts.connect(post_node)
-        except Exception:
-            pass
+        adjust(Post, instance.post_id, likes_count=1, **{Like.count_field(instance.reaction): 1})
+        post_id, created_at = instance.post_id, _created_at(instance, 'post')
+        user_id = instance.user_id
+        transaction.on_commit(lambda: popular.add(post_id, 'like', created_at))
+        transaction.on_commit(lambda: link_liked_post.apply_async(args=[user_id, post_id], queue='default'))
 
 
 @receiver(post_delete, sender=Like)
-def on_like_deleted(sender, instance, **kwargs):
-    Post.objects.filter(pk=instance.post_id).update(
-        likes_count=Like.objects.filter(post_id=instance.post_id).count()
-    )
+def on_like_deleted(sender, instance, origin=None, **kwargs):
+    adjust(Post, instance.post_id, likes_count=-1, **{Like.count_field(instance.reaction): -1})
+    if _deleting_posts(origin):
+        return
+    post_id, created_at = instance.post_id, _created_at(instance, 'post')
+    transaction.on_commit(lambda: popular.add(post_id, 'like', created_at, count=-1))
 
 
 @receiver(post_save, sender=Comment)
 def on_comment_created(sender, instance, created, **kwargs):
     if created:
-        Post.objects.filter(pk=instance.post_id).update(
-            comments_count=Comment.objects.filter(post_id=instance.post_id).count()
-        )
+        assign_path(instance)
+        adjust(Post, instance.post_id, comments_count=1)
+        queue_mention_notifications(SOURCE_COMMENT, instance.id, instance.content)
+        post_id, created_at = instance.post_id, _created_at(instance, 'post')
+        transaction.on_commit(lambda: popular.add(post_id, 'comment', created_at))
 
 
 @receiver(post_delete, sender=Comment)
-def on_comment_deleted(sender, instance, **kwargs):
-    Post.objects.filter(pk=instance.post_id).update(
-        comments_count=Comment.objects.filter(post_id=instance.post_id).count()
-    )
+def on_comment_deleted(sender, instance, origin=None, **kwargs):
+    adjust(Post, instance.post_id, comments_count=-1)
+    if _deleting_posts(origin):
+        return
+    post_id, created_at = instance.post_id, _created_at(instance, 'post')
+    transaction.on_commit(lambda: popular.add(post_id, 'comment', created_at, count=-1))
+
+
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, **kwargs):
+    if uses_search_vector():
+        post_id = instance.id
+        transaction.on_commit(lambda: update_search_vectors([post_id]))
+
+
+@receiver(post_save, sender=PostTag)
+@receiver(post_delete, sender=PostTag)
+def index_post_tags(sender, instance, **kwargs):
+    if uses_search_vector():
+        post_id = instance.post_id
+        transaction.on_commit(lambda: update_search_vectors([post_id]))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=PostTag)
+@receiver(post_delete, sender=PostTag)
+@receiver(post_save, sender=PostMedia)
+@receiver(post_delete, sender=PostMedia)
+@receiver(derivatives_ready, sender=Post)
+@receiver(derivatives_ready, sender=PostMedia)
+def invalidate_post_fragment(sender, instance, **kwargs):
+    # Edits and counter deltas already change the fragment key (updated_at,
+    # counters); this covers tags, media and saves that skip updated_at.
+    post_id = instance.id if sender is Post else instance.post_id
+    transaction.on_commit(lambda: fragments.invalidate(post_id))
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def reindex_author_posts(sender, instance, created, update_fields=None, **kwargs):
+    """Author names are part of the search document of all their posts."""
+    if created or not uses_search_vector():
+        return
+    if update_fields is not None and not AUTHOR_SEARCH_FIELDS & set(update_fields):
+        return
+    try:
+        from posts.tasks import reindex_author_posts as task
+        author_id = instance.id
+        transaction.on_commit(lambda: task.apply_async(args=[author_id], queue='default'))
+    except Exception:
+        pass
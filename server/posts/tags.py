@@ -0,0 +1,98 @@
+"""
+Hashtags parsed from post content.
+
+Post content is the source of truth for PostTag: posts.signals re-syncs the
+rows whenever a post is created or its content changes, with one bulk INSERT
+for new tags and one DELETE for dropped ones. Newly added tags are counted
+towards trending (posts.trending).
+
+Posts whose tags changed are queued in a Redis set; posts.tasks.sync_tag_nodes
+drains it periodically and links them to their TagNodes in Neo4j with one
+query per batch (without Redis, each post is synced by its own task).
+"""
+import logging
+import re
+
+from andromeda.redis_client import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+MAX_TAGS_PER_POST = 30
+MAX_TAG_LENGTH = 100  # PostTag.name
+GRAPH_SYNC_BATCH_SIZE = 500
+
+# '#django' and '#über' but not '#1', 'C#' or HTML entities such as '&#39;'.
+HASHTAG_RE = re.compile(r'(?<![\w&#])#(\w*[^\W\d_]\w*)')
+
+
+def extract_hashtags(text):
+    """Lowercase hashtags in order of first appearance."""
+    tags = []
+    for match in HASHTAG_RE.finditer(text or ''):
+        tag = match.group(1).lower()[:MAX_TAG_LENGTH]
+        if tag not in tags:
+            tags.append(tag)
+            if len(tags) == MAX_TAGS_PER_POST:
+                break
+    return tags
+
+
+def sync_post_tags(post):
+    """Make the post's PostTag rows match its content; returns (added, removed) names."""
+    from .models import PostTag
+    wanted = extract_hashtags(post.content)
+    existing = set(PostTag.objects.filter(post=post).values_list('name', flat=True))
+    added = [tag for tag in wanted if tag not in existing]
+    removed = existing - set(wanted)
+    if added:
+        PostTag.objects.bulk_create(
+            [PostTag(post=post, name=tag) for tag in added], ignore_conflicts=True,
+        )
+    if removed:
+        PostTag.objects.filter(post=post, name__in=removed).delete()
+    return added, sorted(removed)
+
+
+def graph_sync_key():
+    return redis_key('tags', 'graph_sync')
+
+
+def queue_graph_sync(post_id):
+    redis = get_redis()
+    if redis is not None:
+        try:
+            redis.sadd(graph_sync_key(), post_id)
+            return
+        except Exception as e:
+            logger.warning(f'Tag graph sync queue unavailable: {e}')
+    from .tasks import sync_tag_nodes
+    sync_tag_nodes.apply_async(args=[[post_id]], queue='default')
+
+
+def sync_graph(post_ids):
+    """Link each post's PostNode to the TagNodes of its current tags."""
+    from users.graph_models import TagNode
+    from .models import PostTag
+    post_tags = {post_id: [] for post_id in post_ids}
+    for post_id, name in PostTag.objects.filter(post_id__in=post_ids).values_list('post_id', 'name'):
+        post_tags[post_id].append(name)
+    TagNode.sync_posts(post_tags)
+
+
+def drain_graph_sync(batch_size=GRAPH_SYNC_BATCH_SIZE):
+    """Sync every queued post in batches; returns the number of posts synced."""
+    redis = get_redis()
+    if redis is None:
+        return 0
+    synced = 0
+    while True:
+        post_ids = [int(pid) for pid in redis.spop(graph_sync_key(), batch_size) or []]
+        if not post_ids:
+            return synced
+        try:
+            sync_graph(post_ids)
+        except Exception:
+            # Put the batch back for the next run.
+            redis.sadd(graph_sync_key(), *post_ids)
+            raise
+        synced += len(post_ids)
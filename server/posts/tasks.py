@@ -0,0 +1,74 @@
+"""
+Celery tasks for posts – run on the 'default' queue.
+"""
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='posts.tasks.fan_out_post', queue='default')
+def fan_out_post(post_id):
+    """Push a newly created post into its audience's home timelines."""
+    from posts.models import Post
+    from posts.timeline import push_post
+
+    try:
+        post = Post.objects.select_related('author').get(id=post_id)
+        return push_post(post)
+    except Post.DoesNotExist:
+        return 0
+    except Exception as e:
+        logger.error(f'fan_out_post failed for post {post_id}: {e}')
+        return 0
+
+
+@shared_task(name='posts.tasks.reindex_author_posts', queue='default')
+def reindex_author_posts(author_id):
+    """Refresh the search documents of an author's posts after a name change."""
+    from posts.search import update_search_vectors
+
+    try:
+        update_search_vectors(author_id=author_id)
+    except Exception as e:
+        logger.error(f'reindex_author_posts failed for user {author_id}: {e}')
+
+
+@shared_task(name='posts.tasks.link_liked_post', queue='default')
+def link_liked_post(user_id, post_id):
+    """Add the LIKED edge from a user to a post they reacted to."""
+    try:
+        from users.graph_models import UserNode, PostNode
+        user_node = UserNode.nodes.get_or_none(user_id=user_id)
+        post_node = PostNode.nodes.get_or_none(post_id=post_id)
+        if user_node and post_node and not user_node.liked_posts.is_connected(post_node):
+            user_node.liked_posts.connect(post_node)
+    except Exception as e:
+        logger.error(f'link_liked_post failed for user {user_id}, post {post_id}: {e}')
+
+
+@shared_task(name='posts.tasks.sync_tag_nodes', queue='default')
+def sync_tag_nodes(post_ids=None):
+    """Link posts to their TagNodes in Neo4j; without ids, drain the queued posts."""
+    from posts.tags import drain_graph_sync, sync_graph
+
+    try:
+        if post_ids is not None:
+            sync_graph(post_ids)
+            return len(post_ids)
+        return drain_graph_sync()
+    except Exception as e:
+        logger.error(f'sync_tag_nodes failed: {e}')
+        return 0
+
+
+@shared_task(name='posts.tasks.prune_popular', queue='default')
+def prune_popular():
+    """Fold decay into the popular-feed scores and drop posts past retention."""
+    from posts.popular import prune
+
+    try:
+        return prune()
+    except Exception as e:
+        logger.error(f'prune_popular failed: {e}')
+        return 0
@@ -1,5 +1,6 @@
 import pytest
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
@@ -105,6 +106,203 @@ class TestReactions:
         assert response.status_code == status.HTTP_200_OK
         assert response.data["reaction"] == "love"
 
+    def test_reaction_histogram(self, auth_client, user, other_user, post):
+        Like.objects.create(user=other_user, post=post, reaction="haha")
+        url = reverse("post-react", kwargs={"pk": post.id})
+        auth_client.post(url, {"reaction": "love"}, format="json")
+        auth_client.post(url, {"reaction": "wow"}, format="json")
+        response = auth_client.get(reverse("post-detail", kwargs={"pk": post.id}))
+        counts = response.data["reaction_counts"]
+        assert {k: v for k, v in counts.items() if v} == {"haha": 1, "wow": 1}
+        assert response.data["likes_count"] == 2
+        auth_client.post(url, {"reaction": "wow"}, format="json")
+        post.refresh_from_db()
+        assert post.reaction_counts["wow"] == 0 and post.likes_count == 1
+
+    def test_unknown_reaction_rejected(self, auth_client, post):
+        url = reverse("post-react", kwargs={"pk": post.id})
+        response = auth_client.post(url, {"reaction": "meh"}, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_set_reaction_reports_previous_state(self, user, post):
+        from posts.reactions import ReactionChange, set_reaction
+        assert set_reaction(user.id, post.id, "love") == ReactionChange(None, "love")
+        assert set_reaction(user.id, post.id, "sad") == ReactionChange("love", "sad")
+        assert set_reaction(user.id, post.id, "sad") == ReactionChange("sad", None)
+        post.refresh_from_db()
+        assert post.likes_count == 0 and not any(post.reaction_counts.values())
+
+    def test_only_first_reaction_notifies_after_commit(
+        self, auth_client, other_user, django_capture_on_commit_callbacks
+    ):
+        from notifications.models import Notification
+        post = Post.objects.create(author=other_user, content="Bob's post")
+        url = reverse("post-react", kwargs={"pk": post.id})
+        with django_capture_on_commit_callbacks(execute=True):
+            auth_client.post(url, {"reaction": "like"}, format="json")
+            auth_client.post(url, {"reaction": "love"}, format="json")
+        assert Notification.objects.filter(recipient=other_user, notification_type=Notification.TYPE_LIKE).count() == 1
+
+
+@pytest.mark.skipif(connection.vendor != "postgresql", reason="SET_REACTION_SQL runs on PostgreSQL only")
+class TestReactionStatement:
+    @pytest.fixture
+    def scored(self, monkeypatch):
+        from posts import popular
+        events = []
+        monkeypatch.setattr(popular, "add", lambda post_id, kind, created_at, count=1: events.append(
+            (post_id, kind, created_at, count),
+        ))
+        return events
+
+    @staticmethod
+    def tap(user, post, reaction, django_assert_num_queries):
+        from posts.reactions import set_reaction
+        # The whole tap, counters and popular-feed input included, is one statement.
+        with django_assert_num_queries(1):
+            return set_reaction(user.id, post.id, reaction)
+
+    @staticmethod
+    def state(post):
+        post.refresh_from_db()
+        counts = {k: v for k, v in post.reaction_counts.items() if v}
+        reactions = list(Like.objects.filter(post=post).order_by("id").values_list("reaction", flat=True))
+        return reactions, post.likes_count, counts
+
+    def test_create_toggle_and_switch(self, user, post, scored, django_assert_num_queries,
+                                      django_capture_on_commit_callbacks):
+        from posts.reactions import ReactionChange
+        with django_capture_on_commit_callbacks(execute=True):
+            assert self.tap(user, post, "love", django_assert_num_queries) == ReactionChange(None, "love")
+        assert self.state(post) == (["love"], 1, {"love": 1})
+        assert scored == [(post.id, "like", post.created_at, 1)]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            assert self.tap(user, post, "sad", django_assert_num_queries) == ReactionChange("love", "sad")
+        assert self.state(post) == (["sad"], 1, {"sad": 1})
+        assert len(scored) == 1
+
+        with django_capture_on_commit_callbacks(execute=True):
+            assert self.tap(user, post, "sad", django_assert_num_queries) == ReactionChange("sad", None)
+        assert self.state(post) == ([], 0, {})
+        assert scored[-1] == (post.id, "like", post.created_at, -1)
+
+    def test_repeated_taps_keep_counters_exact(self, user, other_user, post, scored, django_assert_num_queries,
+                                               django_capture_on_commit_callbacks):
+        Like.objects.create(user=other_user, post=post, reaction="haha")
+        with django_capture_on_commit_callbacks(execute=True):
+            for reaction in ["like", "like", "like", "wow", "wow", "haha", "angry", "angry", "angry"]:
+                self.tap(user, post, reaction, django_assert_num_queries)
+        assert self.state(post) == (["haha", "angry"], 2, {"haha": 1, "angry": 1})
+        assert [count for _, _, _, count in scored] == [1, -1, 1, -1, 1, -1, 1]
+
+
+class TestCounters:
+    def test_like_and_unlike_adjust_counter(self, auth_client, user, post):
+        url = reverse("post-react", kwargs={"pk": post.id})
+        auth_client.post(url, {"reaction": "like"}, format="json")
+        post.refresh_from_db()
+        assert post.likes_count == 1
+        auth_client.post(url, {"reaction": "like"}, format="json")
+        post.refresh_from_db()
+        assert post.likes_count == 0
+
+    def test_share_and_delete_adjust_counters(self, auth_client, user, post):
+        response = auth_client.post(reverse("post-share", kwargs={"pk": post.id}), {}, format="json")
+        post.refresh_from_db()
+        user.refresh_from_db()
+        assert (post.shares_count, user.posts_count) == (1, 2)
+        Post.objects.get(pk=response.data["id"]).delete()
+        post.refresh_from_db()
+        user.refresh_from_db()
+        assert (post.shares_count, user.posts_count) == (0, 1)
+
+    def test_reconcile_repairs_drift(self, user, other_user, post):
+        from andromeda.counters import COUNTERS, reconcile
+        Like.objects.create(user=other_user, post=post)
+        Post.objects.filter(pk=post.pk).update(likes_count=7, comments_count=3)
+        repaired = {
+            counter.field: reconcile(counter, chunk_size=1)
+            for counter in COUNTERS
+            if counter.model == "posts.Post" and counter.field in ("likes_count", "comments_count")
+        }
+        post.refresh_from_db()
+        assert (post.likes_count, post.comments_count) == (1, 0)
+        assert repaired == {"likes_count": 1, "comments_count": 1}
+
+    def test_decrement_stops_at_zero(self, post):
+        from andromeda.counters import adjust
+        adjust(Post, post.pk, likes_count=-1)
+        post.refresh_from_db()
+        assert post.likes_count == 0
+
+
+class TestBatchLoading:
+    def _list_queries(self, client):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(reverse("post-list"))
+        assert response.status_code == status.HTTP_200_OK
+        return len(ctx.captured_queries)
+
+    def test_post_list_queries_do_not_grow_with_page(self, auth_client, user, other_user):
+        original = Post.objects.create(author=other_user, content="Original")
+        Like.objects.create(user=user, post=original, reaction="love")
+        Post.objects.create(author=user, content="Share", shared_post=original)
+        baseline = self._list_queries(auth_client)
+
+        for i in range(5):
+            author = User.objects.create_user(username=f"author{i}", password="pass", email=f"{i}@a.com")
+            Post.objects.create(author=author, content=f"Post {i}", shared_post=original)
+        assert self._list_queries(auth_client) == baseline
+
+    def test_my_reaction_is_batched(self, auth_client, user, post):
+        Like.objects.create(user=user, post=post, reaction="haha")
+        response = auth_client.get(reverse("post-list"))
+        assert response.data["results"][0]["my_reaction"] == "haha"
+
+
+class TestFragmentCache:
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def _post_data(self, client, post):
+        response = client.get(reverse("post-detail", kwargs={"pk": post.id}))
+        assert response.status_code == status.HTTP_200_OK
+        return response.data
+
+    def test_fragment_is_reused_with_viewer_overlay(self, api_client, user, other_user, post, monkeypatch):
+        from posts import fragments
+        Like.objects.create(user=other_user, post=post, reaction="wow")
+        api_client.force_authenticate(user=other_user)
+        assert self._post_data(api_client, post)["my_reaction"] == "wow"
+
+        hits = []
+        original_get = fragments.get
+        monkeypatch.setattr(fragments, "get", lambda context, p: hits.append(original_get(context, p)) or hits[-1])
+        api_client.force_authenticate(user=user)
+        data = self._post_data(api_client, post)
+        assert hits and hits[0] is not None
+        assert data["my_reaction"] is None
+        assert data["likes_count"] == 1
+
+    def test_counter_change_is_not_served_stale(self, auth_client, other_user, post):
+        assert self._post_data(auth_client, post)["likes_count"] == 0
+        Like.objects.create(user=other_user, post=post, reaction="love")
+        data = self._post_data(auth_client, post)
+        assert data["likes_count"] == 1
+        assert data["reaction_counts"]["love"] == 1
+
+    def test_tag_change_invalidates(self, auth_client, post, django_capture_on_commit_callbacks):
+        from posts.models import PostTag
+        assert self._post_data(auth_client, post)["tags"] == []
+        with django_capture_on_commit_callbacks(execute=True):
+            PostTag.objects.create(post=post, name="django")
+        assert [t["name"] for t in self._post_data(auth_client, post)["tags"]] == ["django"]
+
 
 # ── Comments ──────────────────────────────────────────────────────────────────
 
@@ -129,6 +327,114 @@ class TestComments:
         post.refresh_from_db()
         assert post.comments_count == 1
 
+    def _thread_queries(self, client, post):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(reverse("post-comments", kwargs={"pk": post.id}) + "?cursor=")
+        assert response.status_code == status.HTTP_200_OK
+        return len(ctx.captured_queries)
+
+    def test_thread_queries_do_not_grow_with_replies(self, auth_client, user, other_user, post):
+        top = Comment.objects.create(post=post, author=user, content="Top")
+        Comment.objects.create(post=post, author=other_user, content="Reply", parent=top)
+        baseline = self._thread_queries(auth_client, post)
+
+        for i in range(5):
+            top = Comment.objects.create(post=post, author=other_user, content=f"Top {i}")
+            replier = User.objects.create_user(username=f"replier{i}", email=f"replier{i}@example.com", password="pass")
+            for j in range(8):
+                Comment.objects.create(post=post, author=replier, content=f"Reply {j}", parent=top)
+        assert self._thread_queries(auth_client, post) == baseline
+
+    def test_reply_preview_and_cursor(self, auth_client, user, post):
+        from posts.serializers import REPLY_PREVIEW_SIZE
+        top = Comment.objects.create(post=post, author=user, content="Top")
+        replies = [
+            Comment.objects.create(post=post, author=user, content=f"Reply {i}", parent=top)
+            for i in range(REPLY_PREVIEW_SIZE + 3)
+        ]
+        response = auth_client.get(reverse("post-comments", kwargs={"pk": post.id}) + "?cursor=")
+        [comment] = response.data["results"]
+        assert comment["reply_count"] == len(replies)
+        assert [r["id"] for r in comment["replies"]] == [r.id for r in replies[:REPLY_PREVIEW_SIZE]]
+
+        url = reverse("comment-replies", kwargs={"pk": top.id})
+        response = auth_client.get(url, {"cursor": comment["replies_cursor"]})
+        assert [r["id"] for r in response.data["results"]] == [r.id for r in replies[REPLY_PREVIEW_SIZE:]]
+        assert response.data["next"] is None
+
+    def test_no_replies_cursor_when_all_shown(self, auth_client, user, post):
+        top = Comment.objects.create(post=post, author=user, content="Top")
+        Comment.objects.create(post=post, author=user, content="Reply", parent=top)
+        response = auth_client.get(reverse("post-comments", kwargs={"pk": post.id}))
+        assert response.data[0]["reply_count"] == 1
+        assert response.data[0]["replies_cursor"] is None
+
+    def _tree(self, post, user):
+        first = Comment.objects.create(post=post, author=user, content="First")
+        second = Comment.objects.create(post=post, author=user, content="Second")
+        reply = Comment.objects.create(post=post, author=user, content="Reply", parent=first)
+        nested = Comment.objects.create(post=post, author=user, content="Nested", parent=reply)
+        return first, second, reply, nested
+
+    def test_thread_is_ordered_by_path(self, auth_client, user, post):
+        first, second, reply, nested = self._tree(post, user)
+        nested.refresh_from_db()
+        assert nested.depth == 2
+        assert nested.path.startswith(reply.path) and reply.path.startswith(first.path)
+
+        url = reverse("post-thread", kwargs={"pk": post.id})
+        response = auth_client.get(url)
+        assert [c["id"] for c in response.data["results"]] == [first.id, reply.id, nested.id, second.id]
+        assert [c["depth"] for c in response.data["results"]] == [0, 1, 2, 0]
+
+        response = auth_client.get(url, {"root": reply.id})
+        assert [c["id"] for c in response.data["results"]] == [reply.id, nested.id]
+
+    def test_thread_pages_by_path(self, auth_client, user, post):
+        first, second, reply, nested = self._tree(post, user)
+        url = reverse("post-thread", kwargs={"pk": post.id})
+        response = auth_client.get(url, {"page_size": 2})
+        ids = [c["id"] for c in response.data["results"]]
+        response = auth_client.get(response.data["next"])
+        ids += [c["id"] for c in response.data["results"]]
+        assert ids == [first.id, reply.id, nested.id, second.id]
+
+    def test_delete_removes_subtree_in_one_statement(self, auth_client, user, post):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        first, second, reply, nested = self._tree(post, user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = auth_client.delete(reverse("comment-detail", kwargs={"pk": first.id}))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert sum(q["sql"].startswith("DELETE") for q in ctx.captured_queries) == 1
+        assert list(Comment.objects.values_list("id", flat=True)) == [second.id]
+        post.refresh_from_db()
+        assert post.comments_count == 1
+
+    def test_reply_must_belong_to_the_same_post(self, auth_client, user, post):
+        other_post = Post.objects.create(author=user, content="Other", post_type=Post.TYPE_TEXT)
+        top = Comment.objects.create(post=post, author=user, content="Top")
+        url = reverse("post-comments", kwargs={"pk": other_post.id})
+        response = auth_client.post(url, {"content": "Reply", "parent": top.id}, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "parent" in response.data
+        assert not other_post.comments.exists()
+
+    def test_delete_stays_within_the_post(self, auth_client, user, post):
+        # A thread mixing posts, as could be created before replies were validated.
+        other_post = Post.objects.create(author=user, content="Other", post_type=Post.TYPE_TEXT)
+        top = Comment.objects.create(post=post, author=user, content="Top")
+        stray = Comment.objects.create(post=other_post, author=user, content="Stray", parent=top)
+        assert stray.path.startswith(top.path)
+        response = auth_client.delete(reverse("comment-detail", kwargs={"pk": top.id}))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert list(Comment.objects.values_list("id", flat=True)) == [stray.id]
+        post.refresh_from_db()
+        other_post.refresh_from_db()
+        assert (post.comments_count, other_post.comments_count) == (0, 1)
+
 
 # ── Feed ──────────────────────────────────────────────────────────────────────
 
@@ -152,6 +458,183 @@ class TestFeed:
         assert "bob" not in usernames
 
 
+    def test_feed_shows_friend_posts(self, api_client, user, other_user):
+        from users.models import FriendRequest
+        FriendRequest.objects.create(sender=user, receiver=other_user, status=FriendRequest.STATUS_ACCEPTED)
+        Post.objects.create(author=other_user, content="Friend's post", privacy="friends")
+        Post.objects.create(author=other_user, content="Private post", privacy="private")
+        api_client.force_authenticate(user=user)
+        response = api_client.get(reverse("post-list") + "?feed=true")
+        assert response.status_code == status.HTTP_200_OK
+        contents = [p["content"] for p in response.data["results"]]
+        assert contents == ["Friend's post"]
+
+    def test_author_listing_respects_privacy(self, api_client, user, other_user):
+        from users.models import FriendRequest
+        Post.objects.create(author=other_user, content="Public post", privacy="public")
+        Post.objects.create(author=other_user, content="Friend's post", privacy="friends")
+        Post.objects.create(author=other_user, content="Private post", privacy="private")
+        api_client.force_authenticate(user=user)
+        url = reverse("post-list") + f"?author={other_user.id}"
+        assert [p["content"] for p in api_client.get(url).data["results"]] == ["Public post"]
+        FriendRequest.objects.create(sender=user, receiver=other_user, status=FriendRequest.STATUS_ACCEPTED)
+        contents = {p["content"] for p in api_client.get(url).data["results"]}
+        assert contents == {"Public post", "Friend's post"}
+
+    def test_high_fanout_friends_are_pulled(self, settings, user, other_user):
+        from users.models import FriendRequest
+        from posts.timeline import high_fanout_friend_ids
+        settings.FEED_FANOUT_THRESHOLD = 100
+        FriendRequest.objects.create(sender=user, receiver=other_user, status=FriendRequest.STATUS_ACCEPTED)
+        User.objects.filter(pk=other_user.pk).update(friends_count=100)
+        assert high_fanout_friend_ids(user.id) == [other_user.id]
+
+    def test_fan_out_missing_post_is_noop(self, db):
+        from posts.tasks import fan_out_post
+        assert fan_out_post(999999) == 0
+
+
+class TestHomeTimeline:
+    @pytest.fixture
+    def redis(self, monkeypatch):
+        import fakeredis
+        from django.core.cache import cache
+        from posts import timeline
+        cache.clear()
+        server = fakeredis.FakeRedis()
+        monkeypatch.setattr(timeline, "get_redis", lambda: server)
+        return server
+
+    @pytest.fixture
+    def third_user(self, db):
+        return User.objects.create_user(username="carol", password="pass", email="c@c.com")
+
+    @staticmethod
+    def befriend(a, b):
+        from users.models import FriendRequest
+        FriendRequest.objects.create(sender=a, receiver=b, status=FriendRequest.STATUS_ACCEPTED)
+
+    @staticmethod
+    def feed(user, url=None, **params):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        if url:
+            return client.get(url).data
+        return client.get(reverse("post-list"), {"feed": "true", **params}).data
+
+    def test_posts_are_pushed_to_live_timelines(self, redis, user, other_user, third_user):
+        from posts.timeline import push_post, timeline_key
+        self.befriend(user, other_user)
+        for reader in (user, third_user):
+            Post.objects.create(author=reader, content="First", privacy="public")
+            self.feed(reader)
+        assert redis.exists(timeline_key(user.id), timeline_key(third_user.id)) == 2
+
+        post = Post.objects.create(author=other_user, content="Hi", privacy="friends")
+        # Alice's timeline is live; Bob's own is not built yet; Carol is no friend.
+        assert push_post(post) == 1
+        assert redis.zscore(timeline_key(user.id), post.id) == post.created_at.timestamp()
+        assert not redis.exists(timeline_key(other_user.id))
+        assert redis.zscore(timeline_key(third_user.id), post.id) is None
+        assert self.feed(user)["results"][0]["id"] == post.id
+
+    def test_private_posts_are_not_pushed(self, redis, user):
+        from posts.timeline import push_post
+        self.feed(user)
+        assert push_post(Post.objects.create(author=user, content="Diary", privacy="private")) == 0
+
+    def test_high_fanout_authors_are_not_pushed(self, redis, settings, user, other_user):
+        from posts.timeline import author_posts_key, push_post, timeline_key
+        settings.FEED_FANOUT_THRESHOLD = 1
+        self.befriend(user, other_user)
+        Post.objects.create(author=other_user, content="Earlier", privacy="public")
+        self.feed(user)
+        assert redis.exists(author_posts_key(other_user.id))
+
+        post = Post.objects.create(author=other_user, content="To everyone", privacy="public")
+        assert push_post(Post.objects.select_related("author").get(pk=post.pk)) == 0
+        assert redis.zscore(timeline_key(user.id), post.id) is None
+        assert redis.zscore(author_posts_key(other_user.id), post.id) == post.created_at.timestamp()
+
+    def test_high_fanout_posts_are_merged_at_read_time(self, redis, settings, user, other_user, third_user):
+        from datetime import timedelta
+        from django.utils import timezone
+        settings.FEED_FANOUT_THRESHOLD = 2
+        self.befriend(user, other_user)
+        self.befriend(user, third_user)
+        self.befriend(other_user, third_user)
+        now = timezone.now()
+        posts = []
+        for minutes, author in enumerate([other_user, user, other_user, third_user]):
+            post = Post.objects.create(author=author, content=f"Post {minutes}", privacy="public")
+            Post.objects.filter(pk=post.pk).update(created_at=now - timedelta(minutes=minutes))
+            posts.append(post)
+
+        # Every friend of Alice has two friends: all their posts are pulled.
+        results = self.feed(user)["results"]
+        assert [p["id"] for p in results] == [p.id for p in posts]
+        from posts.timeline import HomeTimeline
+        timeline = HomeTimeline.for_user(user.id, Post.objects.all())
+        assert [p.id for p in timeline[2:4]] == [posts[2].id, posts[3].id]
+        assert timeline.count() == 4
+
+    def test_keyset_pages_keep_posts_sharing_a_timestamp(self, redis, settings, user, other_user):
+        from django.utils import timezone
+        settings.FEED_FANOUT_THRESHOLD = 1
+        self.befriend(user, other_user)
+        now = timezone.now()
+        posts = [
+            Post.objects.create(author=author, content=f"Post {i}", privacy="public")
+            for i, author in enumerate([user, other_user] * 8)
+        ]
+        Post.objects.update(created_at=now)
+
+        # Pages end inside the run of equal timestamps, across both sources.
+        page = self.feed(user, cursor="", page_size=2)
+        seen = [p["id"] for p in page["results"]]
+        while page["next"]:
+            page = self.feed(user, page["next"])
+            seen += [p["id"] for p in page["results"]]
+        assert seen == sorted((p.id for p in posts), reverse=True)
+
+    def test_friendship_changes_refresh_the_pulled_authors(self, settings, user, other_user, third_user,
+                                                           django_capture_on_commit_callbacks):
+        from django.core.cache import cache
+        from posts.timeline import high_fanout_friend_ids
+        from users.models import FriendRequest
+        cache.clear()
+        settings.FEED_FANOUT_THRESHOLD = 2
+        self.befriend(other_user, third_user)
+        assert high_fanout_friend_ids(user.id) == high_fanout_friend_ids(third_user.id) == []
+        with django_capture_on_commit_callbacks(execute=True):
+            self.befriend(user, other_user)
+        # Bob reached the threshold with Alice's friendship.
+        assert high_fanout_friend_ids(user.id) == [other_user.id]
+        assert high_fanout_friend_ids(third_user.id) == [other_user.id]
+        with django_capture_on_commit_callbacks(execute=True):
+            FriendRequest.objects.filter(sender=user).delete()
+        assert high_fanout_friend_ids(user.id) == high_fanout_friend_ids(third_user.id) == []
+
+
+class TestKeysetPagination:
+    def test_cursor_pages_are_stable_under_inserts(self, auth_client, user):
+        posts = [Post.objects.create(author=user, content=f"Post {i}") for i in range(3)]
+
+        first = auth_client.get(reverse("post-list") + "?cursor=&page_size=2")
+        assert first.status_code == status.HTTP_200_OK
+        assert "count" not in first.data
+        assert [p["id"] for p in first.data["results"]] == [posts[2].id, posts[1].id]
+
+        Post.objects.create(author=user, content="Newer post")
+        second = auth_client.get(first.data["next"])
+        assert [p["id"] for p in second.data["results"]] == [posts[0].id]
+        assert second.data["next"] is None
+
+    def test_invalid_cursor(self, auth_client):
+        response = auth_client.get(reverse("post-list") + "?cursor=garbage")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
 class TestPostSearch:
     def test_search_matches_post_content(self, auth_client, user):
         match = Post.objects.create(author=user, content="Exploring the Andromeda galaxy")
@@ -172,3 +655,346 @@ class TestPostSearch:
         assert response.status_code == status.HTTP_200_OK
         result_ids = [p["id"] for p in response.data["results"]]
         assert bob_post.id in result_ids
+
+    def test_search_matches_tags_once(self, auth_client, user):
+        from posts.models import PostTag
+        post = Post.objects.create(author=user, content="Trip report")
+        PostTag.objects.create(post=post, name="hiking")
+        PostTag.objects.create(post=post, name="hikingboots")
+
+        response = auth_client.get(reverse("post-list") + "?search=hiking")
+
+        assert [p["id"] for p in response.data["results"]] == [post.id]
+
+    def test_prefix_query_strips_operators(self):
+        from posts.search import to_prefix_query
+        assert to_prefix_query("run fas") == "run:* & fas:*"
+        assert to_prefix_query("a & !b:*") == "a:* & b:*"
+        assert to_prefix_query("  ") == ""
+
+
+# ── Hashtags ──────────────────────────────────────────────────────────────────
+
+class TestHashtags:
+    def _tags(self, post):
+        return sorted(post.tags.values_list("name", flat=True))
+
+    def test_extract_hashtags(self):
+        from posts.tags import extract_hashtags
+        text = "#Django tips: C# vs #python, #1 &#39; #django again"
+        assert extract_hashtags(text) == ["django", "python"]
+
+    def test_tags_follow_content(self, auth_client):
+        response = auth_client.post(
+            reverse("post-list"), {"content": "Hello #Andromeda #space", "post_type": "text"}, format="json"
+        )
+        post = Post.objects.get(pk=response.data["id"])
+        assert self._tags(post) == ["andromeda", "space"]
+
+        auth_client.patch(reverse("post-detail", kwargs={"pk": post.id}), {"content": "Only #space now"}, format="json")
+        assert self._tags(post) == ["space"]
+
+    def test_trending_tags(self, auth_client, user):
+        for content in ("#rust #go", "#rust", "#rust #go #zig"):
+            Post.objects.create(author=user, content=content)
+        response = auth_client.get(reverse("post-trending-tags"), {"window": "day", "limit": 2})
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["results"] == [{"name": "rust", "count": 3}, {"name": "go", "count": 2}]
+
+    def test_trending_tags_rejects_unknown_window(self, auth_client):
+        response = auth_client.get(reverse("post-trending-tags"), {"window": "decade"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestTrendingSketch:
+    NOW = 1_700_000_000.0
+
+    @pytest.fixture
+    def redis(self, monkeypatch):
+        import fakeredis
+        from posts import trending
+        server = fakeredis.FakeRedis()
+        monkeypatch.setattr(trending, "get_redis", lambda: server)
+        return server
+
+    def test_record_counts_in_every_sketch_row(self, redis):
+        from posts import trending
+        trending.record(["rust", "go"], now=self.NOW)
+        trending.record(["rust"], now=self.NOW)
+        for window, config in trending.WINDOWS.items():
+            bucket = trending.current_bucket(window, self.NOW)
+            sketch = redis.hgetall(trending.sketch_key(window, bucket))
+            assert [int(sketch[cell.encode()]) for cell in trending.sketch_cells("rust")] == [2] * trending.SKETCH_DEPTH
+            assert redis.zrevrange(trending.top_key(window, bucket), 0, -1, withscores=True) == [
+                (b"rust", 2.0), (b"go", 1.0),
+            ]
+            assert 0 < redis.ttl(trending.sketch_key(window, bucket)) <= config.bucket_seconds * (config.buckets + 1)
+
+    def test_top_sums_the_buckets_of_the_window(self, redis):
+        from posts import trending
+        hour = trending.WINDOWS["hour"]
+        trending.record(["rust", "go"], now=self.NOW)
+        trending.record(["go"], now=self.NOW - hour.bucket_seconds)
+        trending.record(["go"], now=self.NOW - 2 * hour.bucket_seconds)
+        # Older than an hour: only the day window still counts it.
+        trending.record(["zig"], now=self.NOW - 2 * 60 * 60)
+        trending.record(["zig"], now=self.NOW - 2 * 60 * 60 - 1)
+        assert trending.top("hour", now=self.NOW) == [{"name": "go", "count": 3}, {"name": "rust", "count": 1}]
+        assert trending.top("day", now=self.NOW) == [
+            {"name": "go", "count": 3}, {"name": "zig", "count": 2}, {"name": "rust", "count": 1},
+        ]
+        assert trending.top("day", limit=1, now=self.NOW) == [{"name": "go", "count": 3}]
+
+    def test_top_k_keeps_the_heaviest_tags(self, redis, monkeypatch):
+        from posts import trending
+        monkeypatch.setattr(trending, "TOP_K_SIZE", 2)
+        for tags in (["a", "b", "c"], ["a", "b"], ["a"]):
+            trending.record(tags, now=self.NOW)
+        bucket = trending.current_bucket("hour", self.NOW)
+        assert redis.zrevrange(trending.top_key("hour", bucket), 0, -1) == [b"a", b"b"]
+        assert [tag["name"] for tag in trending.top("hour", now=self.NOW)] == ["a", "b"]
+
+    def test_collisions_only_overestimate(self, redis, monkeypatch):
+        from posts import trending
+        # One counter per row: every tag collides with every other.
+        monkeypatch.setattr(trending, "SKETCH_WIDTH", 1)
+        trending.record(["rust", "go"], now=self.NOW)
+        trending.record(["rust"], now=self.NOW)
+        assert trending.top("hour", now=self.NOW) == [{"name": "go", "count": 3}, {"name": "rust", "count": 3}]
+
+
+# ── Popular feed ──────────────────────────────────────────────────────────────
+
+class TestPopularFeed:
+    def test_ranks_by_engagement_and_respects_privacy(self, auth_client, user, other_user):
+        quiet = Post.objects.create(author=other_user, content="Quiet", privacy="public")
+        busy = Post.objects.create(author=other_user, content="Busy", privacy="public")
+        hidden = Post.objects.create(author=other_user, content="Friends only", privacy="friends")
+        Like.objects.create(user=user, post=quiet)
+        Like.objects.create(user=user, post=busy)
+        Comment.objects.create(post=busy, author=user, content="Wow")
+        Like.objects.create(user=user, post=hidden)
+        Post.objects.create(author=user, content="Unliked")
+
+        response = auth_client.get(reverse("post-popular"))
+        assert response.status_code == status.HTTP_200_OK
+        assert [p["id"] for p in response.data["results"]] == [busy.id, quiet.id]
+
+
+class TestPopularScores:
+    T0 = 1_700_000_000.0
+
+    @pytest.fixture
+    def redis(self, monkeypatch):
+        import fakeredis
+        from posts import popular
+        server = fakeredis.FakeRedis()
+        monkeypatch.setattr(popular, "get_redis", lambda: server)
+        return server
+
+    @staticmethod
+    def at(timestamp):
+        from datetime import datetime, timezone
+        return datetime.fromtimestamp(timestamp, tz=timezone.utc)
+
+    def scores(self, redis):
+        from posts.popular import scores_key
+        return {int(member): score for member, score in redis.zrange(scores_key(), 0, -1, withscores=True)}
+
+    def test_events_decay_from_when_they_happened(self, db, redis, django_assert_num_queries):
+        from posts import popular
+        created = self.at(self.T0)
+        with django_assert_num_queries(0):
+            popular.add(1, "like", created, now=self.T0)
+            popular.add(2, "like", created, now=self.T0 + popular.HALF_LIFE)
+            popular.add(3, "comment", created, now=self.T0 + popular.HALF_LIFE)
+        assert self.scores(redis) == {1: 1.0, 2: 2.0, 3: 4.0}
+
+    def test_taking_back_engagement(self, redis):
+        from posts import popular
+        created = self.at(self.T0)
+        popular.add(1, "comment", created, now=self.T0)
+        popular.add(1, "like", created, count=-1, now=self.T0)
+        assert self.scores(redis) == {1: 1.0}
+        popular.add(1, "like", created, count=-1, now=self.T0)
+        assert self.scores(redis) == {}
+        assert not redis.zcard(popular.created_key())
+        # Nothing to take back from a post that was never scored.
+        popular.add(2, "like", created, count=-1, now=self.T0)
+        assert self.scores(redis) == {}
+
+    def test_expired_posts_are_not_scored(self, redis):
+        from posts import popular
+        popular.add(1, "like", self.at(self.T0 - popular.RETENTION), now=self.T0)
+        popular.add(2, "like", None, now=self.T0)
+        assert self.scores(redis) == {}
+
+    def test_prune_rebases_scores(self, redis):
+        from posts import popular
+        created = self.at(self.T0)
+        popular.add(1, "like", created, now=self.T0)
+        popular.add(2, "share", created, now=self.T0 + popular.HALF_LIFE)
+
+        # Not due yet: scores and base stay.
+        assert popular.prune(now=self.T0 + popular.REBASE_AFTER - 1) == 0
+        assert self.scores(redis) == {1: 1.0, 2: 6.0}
+
+        now = self.T0 + popular.REBASE_AFTER
+        assert popular.prune(now=now) == 0
+        factor = 2 ** (-popular.REBASE_AFTER / popular.HALF_LIFE)
+        assert self.scores(redis) == pytest.approx({1: factor, 2: 6 * factor})
+        assert float(redis.hget(popular.meta_key(), "base")) == now
+        # New events are weighed from the new base.
+        popular.add(1, "like", created, now=now)
+        assert self.scores(redis)[1] == pytest.approx(1 + factor)
+
+    def test_prune_drops_expired_posts(self, redis):
+        from posts import popular
+        popular.add(1, "like", self.at(self.T0 - popular.RETENTION + 60), now=self.T0)
+        popular.add(2, "like", self.at(self.T0), now=self.T0)
+        assert popular.prune(now=self.T0 + 60) == 1
+        assert set(self.scores(redis)) == {2}
+        assert [int(m) for m in redis.zrange(popular.created_key(), 0, -1)] == [2]
+
+    def test_feed_reads_the_ranking(self, redis, auth_client, user, other_user, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            quiet = Post.objects.create(author=other_user, content="Quiet", privacy="public")
+            busy = Post.objects.create(author=other_user, content="Busy", privacy="public")
+            diary = Post.objects.create(author=user, content="Diary", privacy="private")
+            for post in (quiet, busy, diary):
+                Like.objects.create(user=user, post=post)
+            Comment.objects.create(post=busy, author=user, content="Wow")
+        assert set(self.scores(redis)) == {quiet.id, busy.id, diary.id}
+
+        response = auth_client.get(reverse("post-popular"))
+        assert [p["id"] for p in response.data["results"]] == [busy.id, quiet.id]
+
+
+# ── Mentions ──────────────────────────────────────────────────────────────────
+
+class TestMentions:
+    def _mention_queries(self, post):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from notifications.tasks import send_mention_notifications
+        with CaptureQueriesContext(connection) as ctx:
+            send_mention_notifications("post", post.id)
+        return len(ctx.captured_queries)
+
+    def test_extract_mentions(self):
+        from notifications.mentions import extract_mentions
+        text = "Thanks @Bob, mail me at alice@example.com. cc @carol. and @bob again"
+        assert extract_mentions(text) == ["bob", "carol"]
+
+    def test_post_mention_notifies_once(self, auth_client, other_user, django_capture_on_commit_callbacks):
+        from notifications.models import Notification
+        with django_capture_on_commit_callbacks(execute=True):
+            response = auth_client.post(reverse("post-list"), {"content": "Hi @BOB", "post_type": "text"}, format="json")
+        mentions = Notification.objects.filter(notification_type=Notification.TYPE_MENTION)
+        assert list(mentions.values_list("recipient_id", flat=True)) == [other_user.id]
+        assert mentions.get().extra["post_id"] == response.data["id"]
+
+        with django_capture_on_commit_callbacks(execute=True):
+            auth_client.patch(
+                reverse("post-detail", kwargs={"pk": response.data["id"]}), {"content": "Hi again @bob"}, format="json"
+            )
+        assert mentions.count() == 1
+
+    def test_private_post_mentions_nobody(self, user, other_user):
+        from notifications.models import Notification
+        post = Post.objects.create(author=user, content="Note to self about @bob", privacy="private")
+        self._mention_queries(post)
+        assert not Notification.objects.filter(notification_type=Notification.TYPE_MENTION).exists()
+
+    def test_mention_queries_do_not_grow_with_mentions(self, user):
+        few = Post.objects.create(author=user, content="@m0 @m1")
+        many = Post.objects.create(author=user, content=" ".join(f"@m{i}" for i in range(30)))
+        for i in range(30):
+            User.objects.create_user(username=f"m{i}", password="pass", email=f"m{i}@a.com")
+        assert self._mention_queries(few) == self._mention_queries(many)
+
+
+# ── Image derivatives ─────────────────────────────────────────────────────────
+
+def make_jpeg(width, height, exif_tags=None):
+    import io
+    from django.core.files.uploadedfile import SimpleUploadedFile
+    from PIL import Image
+    image = Image.new("RGB", (width, height), (200, 30, 30))
+    exif = Image.Exif()
+    for tag, value in (exif_tags or {}).items():
+        exif[tag] = value
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", exif=exif)
+    return SimpleUploadedFile("photo.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+
+class TestImageDerivatives:
+    MAKE, ORIENTATION = 0x010F, 0x0112  # EXIF tags
+
+    def test_renditions_are_rendered_after_commit(self, user, django_capture_on_commit_callbacks):
+        from django.core.files.storage import default_storage
+        from PIL import Image
+        with django_capture_on_commit_callbacks(execute=True):
+            post = Post.objects.create(author=user, image=make_jpeg(1000, 2000, {self.ORIENTATION: 6}))
+        post.refresh_from_db()
+        derivatives = post.image_derivatives
+        assert derivatives["source"] == post.image.name
+        # Orientation 6 is a quarter turn: the pixels come out landscape.
+        assert (derivatives["width"], derivatives["height"]) == (2000, 1000)
+        renditions = derivatives["renditions"]
+        assert {name: r["width"] for name, r in renditions.items()} == {"thumb": 320, "medium": 720, "large": 1280}
+        assert renditions["thumb"]["height"] == 160
+        with default_storage.open(renditions["thumb"]["webp"]) as f:
+            assert Image.open(f).format == "WEBP"
+
+    def test_exif_is_stripped(self, user, django_capture_on_commit_callbacks):
+        from django.core.files.storage import default_storage
+        from PIL import Image
+        with django_capture_on_commit_callbacks(execute=True):
+            post = Post.objects.create(author=user, image=make_jpeg(800, 600, {self.MAKE: "Camera Co"}))
+        post.refresh_from_db()
+        with default_storage.open(post.image_derivatives["renditions"]["thumb"]["jpeg"]) as f:
+            assert not dict(Image.open(f).getexif())
+
+    def test_small_images_are_not_upscaled(self, user, django_capture_on_commit_callbacks):
+        with django_capture_on_commit_callbacks(execute=True):
+            post = Post.objects.create(author=user, image=make_jpeg(500, 250))
+        post.refresh_from_db()
+        renditions = post.image_derivatives["renditions"]
+        assert {name: r["width"] for name, r in renditions.items()} == {"thumb": 320, "medium": 500}
+
+    def test_replacing_the_image_replaces_derivatives(self, user, django_capture_on_commit_callbacks):
+        from django.core.files.storage import default_storage
+        with django_capture_on_commit_callbacks(execute=True):
+            post = Post.objects.create(author=user, image=make_jpeg(400, 400))
+        post.refresh_from_db()
+        old = post.image_derivatives["renditions"]["thumb"]["webp"]
+        with django_capture_on_commit_callbacks(execute=True):
+            post.image = make_jpeg(400, 400)
+            post.save()
+        post.refresh_from_db()
+        assert post.image_derivatives["source"] == post.image.name
+        assert not default_storage.exists(old)
+
+    def test_serializers_return_srcset(self, auth_client, user, django_capture_on_commit_callbacks):
+        from posts.models import PostMedia
+        with django_capture_on_commit_callbacks(execute=True):
+            post = Post.objects.create(author=user, image=make_jpeg(1000, 500))
+            PostMedia.objects.create(post=post, file=make_jpeg(400, 300), media_type="image")
+        data = auth_client.get(reverse("post-detail", kwargs={"pk": post.id})).data
+        webp = data["image_srcset"]["webp"].split(", ")
+        assert len(webp) == 3 and webp[0].startswith("http://") and webp[0].endswith(".webp 320w")
+        assert data["image_srcset"]["jpeg"].endswith(".jpg 1000w")
+        assert data["media"][0]["srcset"]["jpeg"].split(" ")[1::2] == ["320w,", "400w"]
+
+    def test_video_media_is_skipped(self, user, monkeypatch):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from andromeda import media
+        from posts.models import PostMedia
+        queued = []
+        monkeypatch.setattr(media, "queue_derivatives", lambda instance, field: queued.append(instance))
+        post = Post.objects.create(author=user)
+        PostMedia.objects.create(post=post, file=SimpleUploadedFile("clip.mp4", b"\x00" * 16), media_type="video")
+        PostMedia.objects.create(post=post, file=make_jpeg(100, 100), media_type="image")
+        assert [m.media_type for m in queued] == ["image"]
@@ -0,0 +1,280 @@
+"""
+Materialized home timelines (hybrid fan-out).
+
+Each user's feed is a Redis sorted set of post ids scored by creation time and
+trimmed to FEED_TIMELINE_LENGTH entries. New posts are pushed into the
+timelines of their author and the author's friends by posts.tasks.fan_out_post;
+the feed endpoint reads one page of ids and hydrates it in a single query.
+
+Authors with at least FEED_FANOUT_THRESHOLD friends are not pushed: their
+posts go into a per-author recent-posts set instead, and readers merge those
+sets into their own timeline at read time (k-way by created_at).
+
+Timelines and author sets are built lazily from PostgreSQL on first read and
+expire after FEED_TIMELINE_TTL seconds without a read, so fan-out only writes
+to sets that already exist.
+"""
+import heapq
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from prometheus_client import Counter, Gauge, Histogram
+
+from andromeda.redis_client import get_redis, redis_key
+from users.friends import friend_ids
+
+logger = logging.getLogger(__name__)
+
+FEED_PRIVACY = ['public', 'friends']
+FANOUT_CHUNK_SIZE = 1000
+HIGH_FANOUT_CACHE_TTL = 300
+# Extra entries read per source, for posts sharing a timestamp: Redis orders
+# those by member string ('9' after '10'), not by id, and keyset pages skip
+# the ones at the cursor's timestamp.
+TIE_SLACK = 16
+
+FANOUT_THRESHOLD = Gauge(
+    'andromeda_feed_fanout_threshold',
+    'friends_count at or above which posts are pulled at read time instead of pushed',
+)
+FANOUT_THRESHOLD.set(settings.FEED_FANOUT_THRESHOLD)
+FANOUT_SKIPPED = Counter(
+    'andromeda_feed_fanout_skipped_total',
+    'Posts by high-fanout authors that were not pushed to friend timelines',
+)
+MERGE_SOURCES = Histogram(
+    'andromeda_feed_merge_sources',
+    'Sorted sets merged to render one feed page',
+    buckets=(1, 2, 3, 5, 10, 20, 50, 100),
+)
+MERGE_SECONDS = Histogram(
+    'andromeda_feed_merge_seconds',
+    'Time spent reading and merging feed sources for one page',
+)
+
+
+def timeline_key(user_id):
+    return redis_key('timeline', user_id)
+
+
+def author_posts_key(user_id):
+    return redis_key('author_posts', user_id)
+
+
+def high_fanout_cache_key(user_id):
+    return f'feed:high_fanout:{user_id}'
+
+
+def high_fanout_friend_ids(user_id):
+    """Friends whose posts are merged at read time rather than pushed."""
+    def load():
+        from users.models import User
+        from users.models import Friendship
+        return list(User.objects.filter(
+            id__in=Friendship.objects.friend_ids_of(user_id),
+            friends_count__gte=settings.FEED_FANOUT_THRESHOLD,
+        ).values_list('id', flat=True))
+    return cache.get_or_set(high_fanout_cache_key(user_id), load, HIGH_FANOUT_CACHE_TTL)
+
+
+def feed_queryset(user_id, queryset=None):
+    """The relational definition of a feed: own and friends' non-private posts."""
+    from users.models import Friendship
+    from .models import Post
+    if queryset is None:
+        queryset = Post.objects.all()
+    return queryset.filter(
+        Q(author_id__in=Friendship.objects.friend_ids_of(user_id)) | Q(author_id=user_id),
+        privacy__in=FEED_PRIVACY,
+    )
+
+
+def visible_queryset(user_id, queryset):
+    """Posts `user_id` may see: public ones, their own, and friends-only posts of friends."""
+    from users.models import Friendship
+    from .models import Post
+    return queryset.filter(
+        Q(privacy=Post.PRIVACY_PUBLIC) |
+        Q(author_id=user_id) |
+        Q(privacy=Post.PRIVACY_FRIENDS, author_id__in=Friendship.objects.friend_ids_of(user_id))
+    )
+
+
+def _store(redis, key, rows):
+    pipe = redis.pipeline()
+    pipe.delete(key)
+    if rows:
+        pipe.zadd(key, {post_id: created_at.timestamp() for post_id, created_at in rows})
+        pipe.expire(key, settings.FEED_TIMELINE_TTL)
+    pipe.execute()
+
+
+def rebuild_timeline(redis, user_id, pulled_author_ids=()):
+    rows = feed_queryset(user_id).exclude(
+        author_id__in=pulled_author_ids
+    ).order_by('-created_at').values_list('id', 'created_at')[:settings.FEED_TIMELINE_LENGTH]
+    _store(redis, timeline_key(user_id), rows)
+
+
+def rebuild_author_posts(redis, author_id):
+    from .models import Post
+    rows = Post.objects.filter(
+        author_id=author_id, privacy__in=FEED_PRIVACY
+    ).order_by('-created_at').values_list('id', 'created_at')[:settings.FEED_AUTHOR_POSTS_LENGTH]
+    _store(redis, author_posts_key(author_id), rows)
+
+
+def _add_to_live_sets(redis, keys, post_id, score, length):
+    pipe = redis.pipeline(transaction=False)
+    for key in keys:
+        pipe.exists(key)
+    live = [key for key, exists in zip(keys, pipe.execute()) if exists]
+    pipe = redis.pipeline(transaction=False)
+    for key in live:
+        pipe.zadd(key, {post_id: score})
+        pipe.zremrangebyrank(key, 0, -(length + 1))
+    pipe.execute()
+    return len(live)
+
+
+def push_post(post):
+    """Add a new post to every live timeline (or author set) that should contain it."""
+    redis = get_redis()
+    if redis is None or post.privacy not in FEED_PRIVACY:
+        return 0
+    score = post.created_at.timestamp()
+    if post.author.friends_count >= settings.FEED_FANOUT_THRESHOLD:
+        FANOUT_SKIPPED.inc()
+        _add_to_live_sets(
+            redis, [author_posts_key(post.author_id)], post.id, score,
+            settings.FEED_AUTHOR_POSTS_LENGTH,
+        )
+        recipients = [post.author_id]
+    else:
+        recipients = list(friend_ids(post.author_id) | {post.author_id})
+    pushed = 0
+    for start in range(0, len(recipients), FANOUT_CHUNK_SIZE):
+        keys = [timeline_key(uid) for uid in recipients[start:start + FANOUT_CHUNK_SIZE]]
+        pushed += _add_to_live_sets(redis, keys, post.id, score, settings.FEED_TIMELINE_LENGTH)
+    return pushed
+
+
+def invalidate_timelines(*user_ids):
+    """Drop timelines whose membership changed; they are rebuilt on next read."""
+    if not user_ids:
+        return
+    try:
+        cache.delete_many([high_fanout_cache_key(uid) for uid in user_ids])
+    except Exception as e:
+        logger.warning(f'High-fanout cache invalidation failed for {user_ids}: {e}')
+    redis = get_redis()
+    if redis is None:
+        return
+    try:
+        redis.delete(*[timeline_key(uid) for uid in user_ids])
+    except Exception as e:
+        logger.warning(f'Timeline invalidation failed for {user_ids}: {e}')
+
+
+def invalidate_friend_timelines(*author_ids):
+    """
+    Drop the timelines of the authors' friends, for authors who crossed
+    FEED_FANOUT_THRESHOLD: their posts switch between pushed and pulled.
+    """
+    invalidate_timelines(*{uid for author_id in author_ids for uid in friend_ids(author_id)})
+
+
+class HomeTimeline:
+    """
+    Lazy, sliceable view of a user's timeline merged with the recent posts of
+    the high-fanout authors they are friends with.
+
+    Django's Paginator only needs count() and slicing, so PageNumberPagination
+    works unchanged while only the requested page of ids is read and hydrated;
+    keyset_page() serves andromeda.pagination.KeysetPagination.
+    """
+
+    def __init__(self, redis, user_id, queryset, pulled_author_ids=()):
+        self.redis = redis
+        self.queryset = queryset
+        self.keys = [timeline_key(user_id)] + [author_posts_key(a) for a in pulled_author_ids]
+
+    @classmethod
+    def for_user(cls, user_id, queryset):
+        redis = get_redis()
+        if redis is None:
+            return None
+        try:
+            pulled = high_fanout_friend_ids(user_id)
+            keys = [timeline_key(user_id)] + [author_posts_key(a) for a in pulled]
+            pipe = redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.expire(key, settings.FEED_TIMELINE_TTL)
+            alive = pipe.execute()
+            if not alive[0]:
+                rebuild_timeline(redis, user_id, pulled)
+            for author_id, exists in zip(pulled, alive[1:]):
+                if not exists:
+                    rebuild_author_posts(redis, author_id)
+        except Exception as e:
+            logger.warning(f'Timeline unavailable for user {user_id}: {e}')
+            return None
+        return cls(redis, user_id, queryset, pulled)
+
+    def count(self):
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self.keys:
+            pipe.zcard(key)
+        return sum(pipe.execute())
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start = index.start or 0
+        stop = index.stop if index.stop is not None else 0
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self.keys:
+            pipe.zrevrange(key, 0, stop + TIE_SLACK - 1, withscores=True)
+        return self.hydrate(self.merge(pipe, stop)[start:stop])
+
+    def keyset_page(self, position, limit):
+        """Posts strictly older than `position` ((created_at, id)), newest first."""
+        pipe = self.redis.pipeline(transaction=False)
+        for key in self.keys:
+            if position is None:
+                pipe.zrevrange(key, 0, limit + TIE_SLACK - 1, withscores=True)
+            else:
+                pipe.zrevrangebyscore(
+                    key, position[0].timestamp(), '-inf',
+                    start=0, num=limit + TIE_SLACK, withscores=True,
+                )
+        bound = None if position is None else (position[0].timestamp(), position[1])
+        return self.hydrate(self.merge(pipe, limit, bound))
+
+    def merge(self, pipe, limit, bound=None):
+        """Newest-first k-way merge of every source, keeping entries below `bound`."""
+        MERGE_SOURCES.observe(len(self.keys))
+        with MERGE_SECONDS.time():
+            streams = [
+                sorted(((score, int(member)) for member, score in stream), reverse=True)
+                for stream in pipe.execute()
+            ]
+            if bound is not None:
+                streams = [[entry for entry in stream if entry < bound] for stream in streams]
+            ids, seen = [], set()
+            for _score, post_id in heapq.merge(*streams, reverse=True):
+                if post_id not in seen:
+                    seen.add(post_id)
+                    ids.append(post_id)
+                    if len(ids) >= limit:
+                        break
+        return ids
+
+    def hydrate(self, ids):
+        posts = self.queryset.filter(privacy__in=FEED_PRIVACY).in_bulk(ids)
+        return [posts[pid] for pid in ids if pid in posts]
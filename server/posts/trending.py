@@ -0,0 +1,142 @@
+"""
+Trending hashtags over sliding windows.
+
+Each window (last hour, last day) is a ring of time buckets in Redis. A
+bucket holds
+
+* a Count-Min sketch: SKETCH_DEPTH rows of SKETCH_WIDTH counters in one hash,
+  so memory per bucket is fixed however many distinct tags are used, and
+* a top-K sorted set of the bucket's heaviest tags, trimmed to TOP_K_SIZE.
+
+record() increments the sketch of the current bucket and re-scores the tag in
+that bucket's top-K (two round trips). top() takes the union of the top-K sets
+of the window's buckets as candidates and estimates each candidate over the
+whole window from the summed sketches (two more round trips), so the
+/api/posts/trending-tags/ endpoint never scans post_tags. Buckets expire on
+their own once they leave the window.
+
+Without Redis, top() falls back to counting PostTag rows of recent posts.
+"""
+import hashlib
+import logging
+import time
+from collections import namedtuple
+from datetime import timedelta
+
+from django.db.models import Count
+from django.utils import timezone
+
+from andromeda.redis_client import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+SKETCH_WIDTH = 2048
+SKETCH_DEPTH = 4
+TOP_K_SIZE = 100
+TRENDING_LIMIT = 10
+TRENDING_MAX_LIMIT = 50
+
+Window = namedtuple('Window', ['bucket_seconds', 'buckets'])
+
+WINDOWS = {
+    'hour': Window(bucket_seconds=5 * 60, buckets=12),
+    'day': Window(bucket_seconds=60 * 60, buckets=24),
+}
+DEFAULT_WINDOW = 'hour'
+
+
+def sketch_key(window, bucket):
+    return redis_key('trending', window, 'sketch', bucket)
+
+
+def top_key(window, bucket):
+    return redis_key('trending', window, 'top', bucket)
+
+
+def sketch_cells(tag):
+    """The counter of `tag` in each sketch row, as hash fields."""
+    digest = hashlib.blake2b(tag.encode(), digest_size=4 * SKETCH_DEPTH).digest()
+    return [
+        f'{row}:{int.from_bytes(digest[4 * row:4 * row + 4], "big") % SKETCH_WIDTH}'
+        for row in range(SKETCH_DEPTH)
+    ]
+
+
+def current_bucket(window, now=None):
+    return int((now or time.time()) // WINDOWS[window].bucket_seconds)
+
+
+def window_buckets(window, now=None):
+    last = current_bucket(window, now)
+    return list(range(last - WINDOWS[window].buckets + 1, last + 1))
+
+
+def record(tags, now=None):
+    """Count one use of each of `tags` in every window."""
+    redis = get_redis()
+    if redis is None or not tags:
+        return
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for name, window in WINDOWS.items():
+            bucket = current_bucket(name, now)
+            ttl = window.bucket_seconds * (window.buckets + 1)
+            for tag in tags:
+                for cell in sketch_cells(tag):
+                    pipe.hincrby(sketch_key(name, bucket), cell, 1)
+            pipe.expire(sketch_key(name, bucket), ttl)
+        results = iter(pipe.execute())
+
+        pipe = redis.pipeline(transaction=False)
+        for name, window in WINDOWS.items():
+            bucket = current_bucket(name, now)
+            ttl = window.bucket_seconds * (window.buckets + 1)
+            estimates = {tag: min(next(results) for _ in range(SKETCH_DEPTH)) for tag in tags}
+            next(results)  # expire
+            pipe.zadd(top_key(name, bucket), estimates)
+            pipe.zremrangebyrank(top_key(name, bucket), 0, -TOP_K_SIZE - 1)
+            pipe.expire(top_key(name, bucket), ttl)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f'Trending tags unavailable: {e}')
+
+
+def _db_top(window, limit):
+    from .models import PostTag
+    config = WINDOWS[window]
+    since = timezone.now() - timedelta(seconds=config.bucket_seconds * config.buckets)
+    rows = PostTag.objects.filter(post__created_at__gte=since).values('name').annotate(
+        count=Count('id'),
+    ).order_by('-count', 'name')[:limit]
+    return [{'name': row['name'], 'count': row['count']} for row in rows]
+
+
+def top(window=DEFAULT_WINDOW, limit=TRENDING_LIMIT, now=None):
+    """The `limit` most used tags of `window` as [{'name', 'count'}], most used first."""
+    redis = get_redis()
+    if redis is None:
+        return _db_top(window, limit)
+    buckets = window_buckets(window, now)
+    try:
+        pipe = redis.pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.zrange(top_key(window, bucket), 0, -1)
+        candidates = sorted({tag.decode() for members in pipe.execute() for tag in members})
+        if not candidates:
+            return []
+
+        cells = {tag: sketch_cells(tag) for tag in candidates}
+        fields = sorted({cell for tag_cells in cells.values() for cell in tag_cells})
+        pipe = redis.pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.hmget(sketch_key(window, bucket), fields)
+        totals = dict.fromkeys(fields, 0)
+        for values in pipe.execute():
+            for field, value in zip(fields, values):
+                totals[field] += int(value or 0)
+    except Exception as e:
+        logger.warning(f'Trending tags unavailable: {e}')
+        return _db_top(window, limit)
+    counts = {tag: min(totals[cell] for cell in tag_cells) for tag, tag_cells in cells.items()}
+    ranked = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    return [{'name': tag, 'count': count} for tag, count in ranked if count > 0]
@@ -1,35 +1,46 @@
-from django.db.models import Q
+from django.db import transaction
+from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
-from users.models import FriendRequest
+from andromeda import threads
+from andromeda.counters import adjust
+from andromeda.pagination import CursorOrPageNumberPagination, KeysetPagination, ThreadPagination
+from notifications.tasks import send_like_notification
+from . import popular, reactions, trending
 from .models import Post, Like, Comment
-from .serializers import PostSerializer, CommentSerializer
+from .serializers import PostSerializer, CommentSerializer, ThreadCommentSerializer, REPLY_ORDERING
+from .search import search_posts
+from .timeline import HomeTimeline, feed_queryset, visible_queryset
+
+FEED_ONLY_PARAMS = {'feed', 'page', 'page_size', 'cursor'}
 
 
 class PostViewSet(viewsets.ModelViewSet):
     serializer_class = PostSerializer
+    pagination_class = CursorOrPageNumberPagination
+
+    @property
+    def keyset_ordering(self):
+        if self.action == 'comments':
+            return REPLY_ORDERING
+        return ('-created_at', '-id')
+
+    def get_base_queryset(self):
+        return Post.objects.select_related('author', 'shared_post__author').prefetch_related(
+            'media', 'tags', 'shared_post__media', 'shared_post__tags'
+        ).defer('search_vector', 'shared_post__search_vector')
 
     def get_queryset(self):
-        user = self.request.user
-        qs = Post.objects.select_related('author', 'shared_post__author').prefetch_related(
-            'media', 'tags'
-        )
+        qs = self.get_base_queryset()
 
         # Feed: posts from friends + own posts
         feed_filter = self.request.query_params.get('feed')
         if feed_filter == 'true':
-            accepted = FriendRequest.objects.filter(
-                status=FriendRequest.STATUS_ACCEPTED
-            ).filter(Q(sender=user) | Q(receiver=user))
-            friend_ids = set()
-            for fr in accepted:
-                friend_ids.add(fr.sender_id if fr.receiver_id == user.id else fr.receiver_id)
-            qs = qs.filter(
-                Q(author_id__in=friend_ids) | Q(author=user),
-                privacy__in=['public', 'friends'],
-            )
+            qs = feed_queryset(self.request.user.id, qs)
+        else:
+            qs = visible_queryset(self.request.user.id, qs)
 
         author_id = self.request.query_params.get('author')
         if author_id:
@@ -43,49 +54,65 @@ class PostViewSet(viewsets.ModelViewSet):
         if search:
             search = search.strip()
             if search:
-                qs = qs.filter(
-                    Q(content__icontains=search) |
-                    Q(link_title__icontains=search) |
-                    Q(link_description__icontains=search) |
-                    Q(author__username__icontains=search) |
-                    Q(author__first_name__icontains=search) |
-                    Q(author__last_name__icontains=search) |
-                    Q(tags__name__icontains=search)
-                ).distinct()
+                return search_posts(qs, search)
 
         return qs.order_by('-created_at')
 
+    def list(self, request, *args, **kwargs):
+        # Plain feed requests page through the materialized timeline instead
+        # of scanning posts; any extra filter falls back to the SQL feed.
+        params = set(request.query_params)
+        if request.query_params.get('feed') == 'true' and params <= FEED_ONLY_PARAMS:
+            timeline = HomeTimeline.for_user(request.user.id, self.get_base_queryset())
+            if timeline is not None:
+                page = self.paginate_queryset(timeline)
+                serializer = self.get_serializer(page, many=True)
+                return self.get_paginated_response(serializer.data)
+        return super().list(request, *args, **kwargs)
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
     def perform_update(self, serializer):
         serializer.save(is_edited=True)
 
+    @action(detail=False, methods=['get'], url_path='popular', url_name='popular')
+    def popular_posts(self, request):
+        """The most engaged-with posts of the last few days, by time-decayed score."""
+        try:
+            limit = min(int(request.query_params.get('limit', popular.POPULAR_LIMIT)), popular.POPULAR_MAX_LIMIT)
+        except ValueError:
+            limit = popular.POPULAR_LIMIT
+        posts = popular.top(request.user, self.get_base_queryset(), max(limit, 1))
+        return Response({'results': PostSerializer(posts, many=True, context={'request': request}).data})
+
+    @action(detail=False, methods=['get'], url_path='trending-tags')
+    def trending_tags(self, request):
+        """Most used hashtags of the last ?window=hour|day."""
+        window = request.query_params.get('window', trending.DEFAULT_WINDOW)
+        if window not in trending.WINDOWS:
+            return Response({'detail': 'Unknown window.'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(int(request.query_params.get('limit', trending.TRENDING_LIMIT)), trending.TRENDING_MAX_LIMIT)
+        except ValueError:
+            limit = trending.TRENDING_LIMIT
+        return Response({'window': window, 'results': trending.top(window, max(limit, 1))})
+
     @action(detail=True, methods=['post'])
     def react(self, request, pk=None):
         post = self.get_object()
         reaction = request.data.get('reaction', 'like')
-        like, created = Like.objects.get_or_create(user=request.user, post=post)
-        if not created:
-            if like.reaction == reaction:
-                # Toggle off
-                like.delete()
-                return Response({'reacted': False})
-            like.reaction = reaction
-            like.save()
-        else:
-            like.reaction = reaction
-            like.save()
-            # Trigger notification via Celery
-            try:
-                from notifications.tasks import send_like_notification
-                send_like_notification.apply_async(
-                    args=[request.user.id, post.author_id, post.id],
-                    queue='notifications',
-                )
-            except Exception:
-                pass
-        return Response({'reacted': True, 'reaction': like.reaction})
+        if reaction not in dict(Like.REACTION_CHOICES):
+            return Response({'detail': 'Unknown reaction.'}, status=status.HTTP_400_BAD_REQUEST)
+        change = reactions.set_reaction(request.user.id, post.pk, reaction)
+        if change.current is None:
+            return Response({'reacted': False})
+        if change.previous is None:
+            user_id, author_id, post_id = request.user.id, post.author_id, post.pk
+            transaction.on_commit(lambda: send_like_notification.apply_async(
+                args=[user_id, author_id, post_id], queue='notifications',
+            ))
+        return Response({'reacted': True, 'reaction': change.current})
 
     @action(detail=True, methods=['post'])
     def share(self, request, pk=None):
@@ -96,16 +123,22 @@ class PostViewSet(viewsets.ModelViewSet):
             post_type=Post.TYPE_TEXT,
             shared_post=original,
         )
-        Post.objects.filter(pk=original.pk).update(shares_count=Post.objects.filter(shared_post=original).count())
         return Response(PostSerializer(shared, context={'request': request}).data, status=201)
 
     @action(detail=True, methods=['get', 'post'])
     def comments(self, request, pk=None):
         post = self.get_object()
         if request.method == 'GET':
-            comments = post.comments.filter(parent=None).select_related('author').prefetch_related('replies__author')
+            # Replies come from one windowed query in CommentSerializer, so a
+            # page costs the same number of queries however busy the thread is.
+            comments = post.comments.filter(parent=None).select_related('author')
+            if KeysetPagination.cursor_query_param in request.query_params:
+                page = self.paginate_queryset(comments)
+                return self.get_paginated_response(
+                    CommentSerializer(page, many=True, context={'request': request}).data
+                )
             return Response(CommentSerializer(comments, many=True, context={'request': request}).data)
-        serializer = CommentSerializer(data=request.data, context={'request': request})
+        serializer = CommentSerializer(data=request.data, context={'request': request, 'post': post})
         serializer.is_valid(raise_exception=True)
         comment = serializer.save(author=request.user, post=post)
         # Trigger notification
@@ -119,15 +152,46 @@ class PostViewSet(viewsets.ModelViewSet):
             pass
         return Response(CommentSerializer(comment, context={'request': request}).data, status=201)
 
+    @action(detail=True, methods=['get'])
+    def thread(self, request, pk=None):
+        """Every comment depth-first in path order, or one subtree with ?root=<comment id>."""
+        post = self.get_object()
+        comments = threads.thread(post.comments.select_related('author'), request.query_params.get('root'))
+        paginator = ThreadPagination()
+        page = paginator.paginate_queryset(comments, request)
+        return paginator.get_paginated_response(
+            ThreadCommentSerializer(page, many=True, context={'request': request}).data
+        )
+
 
 class CommentViewSet(viewsets.ModelViewSet):
     serializer_class = CommentSerializer
 
     def get_queryset(self):
-        return Comment.objects.filter(author=self.request.user)
+        return Comment.objects.filter(author=self.request.user).select_related('post')
+
+    @action(detail=True, methods=['get'])
+    def replies(self, request, pk=None):
+        """Replies to any visible comment, oldest first, keyset-paginated (?cursor=)."""
+        visible_posts = visible_queryset(request.user.id, Post.objects.all())
+        parent = get_object_or_404(Comment, pk=pk, post__in=visible_posts)
+        paginator = KeysetPagination()
+        paginator.ordering = REPLY_ORDERING
+        page = paginator.paginate_queryset(parent.replies.select_related('author'), request)
+        return paginator.get_paginated_response(
+            CommentSerializer(page, many=True, context={'request': request}).data
+        )
 
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
     def perform_update(self, serializer):
         serializer.save()
+
+    def perform_destroy(self, instance):
+        # One DELETE for the whole subtree; it sends no post_delete signals.
+        created_at = instance.post.created_at
+        with transaction.atomic():
+            deleted = threads.delete_subtree(instance, 'post')
+            adjust(Post, instance.post_id, comments_count=-deleted)
+        transaction.on_commit(lambda: popular.add(instance.post_id, 'comment', created_at, count=-deleted))
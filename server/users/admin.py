@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, FriendRequest, Block
+from .models import User, FriendRequest, Friendship, Block
 
 
 @admin.register(User)
@@ -24,4 +24,10 @@ class FriendRequestAdmin(admin.ModelAdmin):
     list_filter = ['status']
 
 
+@admin.register(Friendship)
+class FriendshipAdmin(admin.ModelAdmin):
+    list_display = ['user', 'friend', 'since']
+    raw_id_fields = ['user', 'friend']
+
+
 admin.site.register(Block)
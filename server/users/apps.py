@@ -7,3 +7,6 @@ class UsersConfig(AppConfig):
 
     def ready(self):
         import users.signals  # noqa: F401
+        from andromeda.media import track_derivatives
+        track_derivatives(self.get_model('User'), 'avatar')
+        track_derivatives(self.get_model('User'), 'cover_photo')
@@ -0,0 +1,166 @@
+"""
+Cached friend sets.
+
+Each user's friends are kept in a Redis set, so a friendship check is one
+SISMEMBER and mutual friends are one SINTER instead of queries against the
+friendships table. Sets are loaded lazily from PostgreSQL, updated incrementally
+when a request is accepted or a friendship is removed, and can be rebuilt with
+`manage.py rebuild_friend_cache`. Without Redis every call reads the database.
+
+A loaded set always contains the sentinel member 0, so "no friends" is cached
+too and never confused with "not loaded".
+"""
+import logging
+
+from django.conf import settings
+
+from andromeda.redis_client import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+SENTINEL = 0
+REBUILD_CHUNK_SIZE = 1000
+
+
+def friends_key(user_id):
+    return redis_key('friends', user_id)
+
+
+def db_friend_ids(user_id):
+    from .models import Friendship
+    return set(Friendship.objects.filter(user_id=user_id).values_list('friend_id', flat=True))
+
+
+def _db_are_friends(user_id, other_id):
+    from .models import Friendship
+    return Friendship.objects.filter(user_id=user_id, friend_id=other_id).exists()
+
+
+def _db_friends_among(user_id, candidate_ids):
+    from .models import Friendship
+    return set(Friendship.objects.filter(
+        user_id=user_id, friend_id__in=list(candidate_ids)
+    ).values_list('friend_id', flat=True))
+
+
+def _db_mutual_friend_ids(user_id, other_id):
+    from .models import Friendship
+    return set(Friendship.objects.filter(
+        user_id=user_id, friend_id__in=Friendship.objects.friend_ids_of(other_id)
+    ).values_list('friend_id', flat=True))
+
+
+def _members(values):
+    return {int(v) for v in values} - {SENTINEL}
+
+
+def _store(pipe, user_id, ids):
+    key = friends_key(user_id)
+    pipe.delete(key)
+    pipe.sadd(key, SENTINEL, *ids)
+    pipe.expire(key, settings.FRIEND_CACHE_TTL)
+
+
+def _ensure_loaded(redis, *user_ids):
+    pipe = redis.pipeline(transaction=False)
+    for uid in user_ids:
+        pipe.expire(friends_key(uid), settings.FRIEND_CACHE_TTL)
+    missing = [uid for uid, alive in zip(user_ids, pipe.execute()) if not alive]
+    if missing:
+        pipe = redis.pipeline()
+        for uid in missing:
+            _store(pipe, uid, db_friend_ids(uid))
+        pipe.execute()
+
+
+def _cached(fallback):
+    """Run the Redis implementation, or `fallback` when Redis is unavailable."""
+    def decorator(func):
+        def wrapper(*args):
+            redis = get_redis()
+            if redis is not None:
+                try:
+                    return func(redis, *args)
+                except Exception as e:
+                    logger.warning(f'Friend cache unavailable: {e}')
+            return fallback(*args)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+@_cached(db_friend_ids)
+def friend_ids(redis, user_id):
+    _ensure_loaded(redis, user_id)
+    return _members(redis.smembers(friends_key(user_id)))
+
+
+@_cached(_db_are_friends)
+def are_friends(redis, user_id, other_id):
+    _ensure_loaded(redis, user_id)
+    return other_id != SENTINEL and bool(redis.sismember(friends_key(user_id), other_id))
+
+
+@_cached(_db_friends_among)
+def friends_among(redis, user_id, candidate_ids):
+    """The subset of `candidate_ids` that are friends of `user_id`."""
+    candidate_ids = list(candidate_ids)
+    if not candidate_ids:
+        return set()
+    _ensure_loaded(redis, user_id)
+    flags = redis.smismember(friends_key(user_id), candidate_ids)
+    return {cid for cid, is_friend in zip(candidate_ids, flags) if is_friend and cid != SENTINEL}
+
+
+@_cached(_db_mutual_friend_ids)
+def mutual_friend_ids(redis, user_id, other_id):
+    _ensure_loaded(redis, user_id, other_id)
+    return _members(redis.sinter(friends_key(user_id), friends_key(other_id)))
+
+
+def _update(user_id, other_id, add):
+    redis = get_redis()
+    if redis is None:
+        return
+    try:
+        # Only touch loaded sets; unloaded ones read the new state from the DB.
+        pipe = redis.pipeline(transaction=False)
+        pipe.exists(friends_key(user_id))
+        pipe.exists(friends_key(other_id))
+        loaded = pipe.execute()
+        pipe = redis.pipeline()
+        for (uid, friend_id), is_loaded in zip([(user_id, other_id), (other_id, user_id)], loaded):
+            if is_loaded:
+                (pipe.sadd if add else pipe.srem)(friends_key(uid), friend_id)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f'Friend cache update failed for {user_id}/{other_id}: {e}')
+
+
+def add_friendship(user_id, other_id):
+    _update(user_id, other_id, add=True)
+
+
+def remove_friendship(user_id, other_id):
+    _update(user_id, other_id, add=False)
+
+
+def rebuild(user_ids):
+    """Reload the friend sets of `user_ids` from PostgreSQL in chunks."""
+    from .models import Friendship
+    redis = get_redis()
+    if redis is None:
+        return 0
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), REBUILD_CHUNK_SIZE):
+        chunk = user_ids[start:start + REBUILD_CHUNK_SIZE]
+        adjacency = {uid: set() for uid in chunk}
+        rows = Friendship.objects.filter(user_id__in=chunk).values_list('user_id', 'friend_id')
+        for user_id, friend_id in rows:
+            adjacency[user_id].add(friend_id)
+        pipe = redis.pipeline()
+        for uid, ids in adjacency.items():
+            _store(pipe, uid, ids)
+        pipe.execute()
+    return len(user_ids)
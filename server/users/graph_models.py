@@ -100,3 +100,24 @@ class TagNode(StructuredNode):
     name = StringProperty(unique_index=True, required=True)
 
     posts = RelationshipFrom('PostNode', 'TAGGED_WITH')
+
+    @classmethod
+    def sync_posts(cls, post_tags):
+        """
+        Make the TAGGED_WITH edges of many posts match `post_tags`
+        ({post_id: [tag names]}) in one round trip, creating missing tags.
+        """
+        query = """
+        UNWIND $rows AS row
+        MATCH (p:PostNode {post_id: row.post_id})
+        OPTIONAL MATCH (p)-[old:TAGGED_WITH]->(t:TagNode)
+        WHERE NOT t.name IN row.tags
+        DELETE old
+        WITH DISTINCT p, row
+        UNWIND row.tags AS name
+        MERGE (t:TagNode {name: name})
+          ON CREATE SET t.uid = replace(randomUUID(), '-', '')
+        MERGE (p)-[:TAGGED_WITH]->(t)
+        """
+        rows = [{'post_id': post_id, 'tags': tags} for post_id, tags in post_tags.items()]
+        db.cypher_query(query, {'rows': rows})
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from andromeda.redis_client import get_redis
+from users import friends
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Redis friend sets from the friendships table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'user_ids', nargs='*', type=int,
+            help='Only rebuild these users (default: every active user).',
+        )
+
+    def handle(self, *args, **options):
+        if get_redis() is None:
+            raise CommandError('Redis is not configured; nothing to rebuild.')
+        user_ids = options['user_ids'] or User.objects.filter(
+            is_active=True
+        ).order_by('id').values_list('id', flat=True).iterator(chunk_size=friends.REBUILD_CHUNK_SIZE)
+        count = friends.rebuild(user_ids)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt friend sets for {count} users.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from andromeda.redis_client import get_redis
+from users import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the Redis people-typeahead index from the users table.'
+
+    def handle(self, *args, **options):
+        if get_redis() is None:
+            raise CommandError('Redis is not configured; nothing to rebuild.')
+        count = search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} users for typeahead.'))
@@ -0,0 +1,77 @@
+# Generated by Django 4.2.10 on 2026-10-18 11:33
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def backfill_friendships(apps, schema_editor):
+    FriendRequest = apps.get_model('users', 'FriendRequest')
+    Friendship = apps.get_model('users', 'Friendship')
+    accepted = FriendRequest.objects.filter(status='accepted').order_by('id').values_list(
+        'sender_id', 'receiver_id', 'updated_at'
+    )
+    batch = []
+    for sender_id, receiver_id, since in accepted.iterator(chunk_size=BACKFILL_BATCH_SIZE):
+        batch.append(Friendship(user_id=sender_id, friend_id=receiver_id, since=since))
+        batch.append(Friendship(user_id=receiver_id, friend_id=sender_id, since=since))
+        if len(batch) >= BACKFILL_BATCH_SIZE:
+            Friendship.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        Friendship.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0003_remove_follow_add_privacy'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Friendship',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('since', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'db_table': 'friendships',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['receiver', 'status'], name='friend_requests_recv_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendrequest',
+            index=models.Index(fields=['sender', 'status'], name='friend_requests_sent_idx'),
+        ),
+        migrations.AddField(
+            model_name='friendship',
+            name='friend',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='friendship',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='friendships', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='friendship',
+            index=models.Index(fields=['user', '-since'], name='friendships_user_since_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.UniqueConstraint(fields=('user', 'friend'), name='unique_friendship'),
+        ),
+        migrations.AddConstraint(
+            model_name='friendship',
+            constraint=models.CheckConstraint(check=models.Q(('user', models.F('friend')), _negated=True), name='no_self_friendship'),
+        ),
+        migrations.RunPython(backfill_friendships, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,8 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
 
 
 class User(AbstractUser):
@@ -12,6 +14,9 @@ class User(AbstractUser):
     bio = models.TextField(blank=True, default='')
     avatar = models.ImageField(upload_to='avatars/%Y/%m/', null=True, blank=True)
     cover_photo = models.ImageField(upload_to='covers/%Y/%m/', null=True, blank=True)
+    # Resized renditions of the images above, see andromeda/media.py
+    avatar_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+    cover_photo_derivatives = models.JSONField(default=dict, blank=True, editable=False)
     location = models.CharField(max_length=120, blank=True)
     website = models.URLField(blank=True)
     birth_date = models.DateField(null=True, blank=True)
@@ -61,6 +66,10 @@ class User(AbstractUser):
     class Meta:
         db_table = 'users'
         ordering = ['-created_at']
+        indexes = [
+            # Case-insensitive @mention lookups (notifications/mentions.py).
+            models.Index(Lower('username'), name='users_username_lower_idx'),
+        ]
 
     def __str__(self):
         return self.username
@@ -102,11 +111,65 @@ class FriendRequest(models.Model):
                 name='no_self_friend_request',
             ),
         ]
+        indexes = [
+            # Pending inbox/outbox listings.
+            models.Index(fields=['receiver', 'status'], name='friend_requests_recv_idx'),
+            models.Index(fields=['sender', 'status'], name='friend_requests_sent_idx'),
+        ]
 
     def __str__(self):
         return f'{self.sender} → {self.receiver} ({self.status})'
 
 
+class FriendshipManager(models.Manager):
+    def befriend(self, user_id, friend_id, since=None):
+        """Store both directions of a friendship; returns False if it already existed."""
+        if self.filter(user_id=user_id, friend_id=friend_id).exists():
+            return False
+        since = since or timezone.now()
+        self.bulk_create([
+            Friendship(user_id=user_id, friend_id=friend_id, since=since),
+            Friendship(user_id=friend_id, friend_id=user_id, since=since),
+        ], ignore_conflicts=True)
+        return True
+
+    def unfriend(self, user_id, friend_id):
+        """Remove both directions; returns False if they were not friends."""
+        deleted, _ = self.filter(
+            Q(user_id=user_id, friend_id=friend_id) | Q(user_id=friend_id, friend_id=user_id)
+        ).delete()
+        return deleted > 0
+
+    def friend_ids_of(self, user_id):
+        return self.filter(user_id=user_id).values('friend_id')
+
+
+class Friendship(models.Model):
+    """
+    One row per direction of an accepted friend request, so "friends of X"
+    is an index range scan on (user_id, friend_id) instead of an OR over
+    friend_requests.
+    """
+    user = models.ForeignKey(User, related_name='friendships', on_delete=models.CASCADE)
+    friend = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    since = models.DateTimeField(default=timezone.now)
+
+    objects = FriendshipManager()
+
+    class Meta:
+        db_table = 'friendships'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'friend'], name='unique_friendship'),
+            models.CheckConstraint(check=~Q(user=models.F('friend')), name='no_self_friendship'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-since'], name='friendships_user_since_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} ↔ {self.friend}'
+
+
 class Block(models.Model):
     blocker = models.ForeignKey(User, related_name='blocking_set', on_delete=models.CASCADE)
     blocked = models.ForeignKey(User, related_name='blocked_by_set', on_delete=models.CASCADE)
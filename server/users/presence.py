@@ -0,0 +1,203 @@
+"""
+Who is online.
+
+Every open WebSocket (ChatConsumer, NotificationConsumer) is a connection of
+its user. Connections are kept in a Redis sorted set per user, scored by when
+they expire; the consumer pushes that back every PRESENCE_HEARTBEAT_INTERVAL
+seconds, so the connections of a crashed worker lapse after PRESENCE_TTL
+instead of keeping their user online forever. A second sorted set indexes the
+online users by their latest expiry: "which of these users are online" is one
+ZMSCORE, and users.tasks.sweep_presence finds the lapsed ones.
+
+A user comes online with their first connection and goes offline with the
+last (or when the sweep finds none left). Only those transitions are
+broadcast, as 'status' events to the user's friends who are online
+themselves, and never for users who turned off show_online_status.
+
+Without Redis nothing is tracked and everybody is reported offline.
+"""
+import asyncio
+import json
+import logging
+import time
+
+from channels.db import database_sync_to_async
+from django.conf import settings
+
+from andromeda.redis_client import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+ONLINE = 'online'
+OFFLINE = 'offline'
+SWEEP_BATCH_SIZE = 1000
+# Most users one bulk query may ask about.
+PRESENCE_MAX_IDS = 500
+
+# KEYS: connections, online; ARGV: connection, now, expires, user id, ttl
+CONNECT_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+redis.call('EXPIRE', KEYS[1], ARGV[5])
+local was_online = redis.call('ZSCORE', KEYS[2], ARGV[4])
+redis.call('ZADD', KEYS[2], 'GT', ARGV[3], ARGV[4])
+if was_online then
+    return 0
+end
+return 1
+"""
+
+# KEYS: connections, online; ARGV: connection, now, user id
+DISCONNECT_SCRIPT = """
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[2])
+if redis.call('ZCARD', KEYS[1]) > 0 then
+    return 0
+end
+return redis.call('ZREM', KEYS[2], ARGV[3])
+"""
+
+# KEYS: connections, online; ARGV: now, user id
+SWEEP_SCRIPT = """
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', ARGV[1])
+local latest = redis.call('ZRANGE', KEYS[1], -1, -1, 'WITHSCORES')
+if latest[2] then
+    redis.call('ZADD', KEYS[2], latest[2], ARGV[2])
+    return 0
+end
+return redis.call('ZREM', KEYS[2], ARGV[2])
+"""
+
+
+def connections_key(user_id):
+    return redis_key('presence', 'connections', user_id)
+
+
+def online_key():
+    return redis_key('presence', 'online')
+
+
+def presence_group(user_id):
+    """The channel layer group of every WebSocket of `user_id`, for friends' presence events."""
+    return f'presence_{user_id}'
+
+
+def _queue_broadcast(user_id, status):
+    from .tasks import broadcast_presence
+    try:
+        broadcast_presence.apply_async(args=[user_id, status], queue='notifications')
+    except Exception as e:
+        logger.warning(f'Could not queue presence broadcast for user {user_id}: {e}')
+
+
+def connect(user_id, connection, now=None):
+    """
+    Register (or, as a heartbeat, extend) one connection of `user_id`;
+    returns whether the user just came online.
+    """
+    redis = get_redis()
+    if redis is None:
+        return False
+    now = time.time() if now is None else now
+    try:
+        came_online = redis.eval(
+            CONNECT_SCRIPT, 2, connections_key(user_id), online_key(),
+            connection, now, now + settings.PRESENCE_TTL, user_id, settings.PRESENCE_TTL,
+        )
+    except Exception as e:
+        logger.warning(f'Presence update failed for user {user_id}: {e}')
+        return False
+    if came_online:
+        _queue_broadcast(user_id, ONLINE)
+    return bool(came_online)
+
+
+heartbeat = connect
+
+
+def disconnect(user_id, connection, now=None):
+    """Drop one connection of `user_id`; returns whether it was the user's last."""
+    redis = get_redis()
+    if redis is None:
+        return False
+    now = time.time() if now is None else now
+    try:
+        went_offline = redis.eval(DISCONNECT_SCRIPT, 2, connections_key(user_id), online_key(), connection, now, user_id)
+    except Exception as e:
+        logger.warning(f'Presence update failed for user {user_id}: {e}')
+        return False
+    if went_offline:
+        _queue_broadcast(user_id, OFFLINE)
+    return bool(went_offline)
+
+
+def connected_user_ids(user_ids, now=None):
+    """
+    The subset of `user_ids` with a live connection, regardless of their
+    show_online_status (e.g. to skip notifying them).
+    """
+    user_ids = list(user_ids)
+    redis = get_redis()
+    if redis is None or not user_ids:
+        return set()
+    now = time.time() if now is None else now
+    try:
+        scores = redis.zmscore(online_key(), user_ids)
+    except Exception as e:
+        logger.warning(f'Presence lookup failed: {e}')
+        return set()
+    return {user_id for user_id, expires in zip(user_ids, scores) if expires is not None and expires > now}
+
+
+def online_user_ids(user_ids):
+    """The subset of `user_ids` that is online and lets others see it."""
+    from .models import User
+    connected = connected_user_ids(user_ids)
+    if not connected:
+        return set()
+    return set(User.objects.filter(id__in=connected, show_online_status=True).values_list('id', flat=True))
+
+
+def sweep(now=None):
+    """Take users whose connections all lapsed offline; returns their ids."""
+    redis = get_redis()
+    if redis is None:
+        return []
+    now = time.time() if now is None else now
+    offline = []
+    while True:
+        candidates = [int(uid) for uid in redis.zrangebyscore(online_key(), '-inf', now, start=0, num=SWEEP_BATCH_SIZE)]
+        for user_id in candidates:
+            if redis.eval(SWEEP_SCRIPT, 2, connections_key(user_id), online_key(), now, user_id):
+                offline.append(user_id)
+                _queue_broadcast(user_id, OFFLINE)
+        if len(candidates) < SWEEP_BATCH_SIZE:
+            return offline
+
+
+class PresenceMixin:
+    """
+    Consumer mixin: counts the socket as a connection of its user while it is
+    open and delivers the presence events of the user's friends.
+    """
+
+    async def join_presence(self):
+        self.presence_group = presence_group(self.user.id)
+        await self.channel_layer.group_add(self.presence_group, self.channel_name)
+        await database_sync_to_async(connect)(self.user.id, self.channel_name)
+        self.presence_heartbeat = asyncio.ensure_future(self._presence_heartbeat())
+
+    async def leave_presence(self):
+        if not hasattr(self, 'presence_group'):
+            return
+        self.presence_heartbeat.cancel()
+        await self.channel_layer.group_discard(self.presence_group, self.channel_name)
+        await database_sync_to_async(disconnect)(self.user.id, self.channel_name)
+
+    async def _presence_heartbeat(self):
+        while True:
+            await asyncio.sleep(settings.PRESENCE_HEARTBEAT_INTERVAL)
+            await database_sync_to_async(heartbeat)(self.user.id, self.channel_name)
+
+    async def presence_changed(self, event):
+        await self.send(text_data=json.dumps({**event, 'type': 'status'}))
@@ -0,0 +1,197 @@
+"""
+People search.
+
+search_people() is the full search behind /api/users/?search=: on PostgreSQL
+it matches usernames and names with pg_trgm word similarity (GIN-indexed, so
+typos and partial words still hit) and ranks by similarity; other databases
+fall back to icontains.
+
+typeahead() serves /api/users/typeahead/: every searchable user is indexed
+in one Redis sorted set under each lowercase term (username, first name, last
+name, full name) as "term\\x00id" members with equal scores, so a prefix lookup
+is a single ZRANGEBYLEX, and the compact cards it returns come from one HMGET.
+The index is updated on user save and rebuilt with
+`manage.py rebuild_typeahead_index`; without Redis it falls back to an
+istartswith query.
+
+Both skip users with searchable=False and users on either side of a Block.
+"""
+import json
+import logging
+
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Greatest
+
+from andromeda.redis_client import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+TYPEAHEAD_LIMIT = 8
+TYPEAHEAD_MAX_LIMIT = 20
+# Terms fetched per requested card: one user can match on several terms and
+# some hits are filtered out by blocks.
+TYPEAHEAD_OVERFETCH = 4
+REBUILD_CHUNK_SIZE = 1000
+SEPARATOR = '\x00'
+
+
+def typeahead_key():
+    return redis_key('typeahead', 'terms')
+
+
+def cards_key():
+    return redis_key('typeahead', 'cards')
+
+
+def blocked_ids(viewer):
+    """Users the viewer has blocked or been blocked by."""
+    from .models import Block
+    ids = set()
+    for blocker_id, blocked_id in Block.objects.filter(
+        Q(blocker=viewer) | Q(blocked=viewer)
+    ).values_list('blocker_id', 'blocked_id'):
+        ids.add(blocked_id if blocker_id == viewer.id else blocker_id)
+    return ids
+
+
+def search_people(queryset, text, viewer):
+    queryset = queryset.filter(searchable=True, is_active=True).exclude(id__in=blocked_ids(viewer))
+    if connection.vendor != 'postgresql':
+        return queryset.filter(
+            Q(username__icontains=text) |
+            Q(first_name__icontains=text) |
+            Q(last_name__icontains=text)
+        ).order_by('username')
+    return queryset.filter(
+        Q(username__trigram_word_similar=text) |
+        Q(first_name__trigram_word_similar=text) |
+        Q(last_name__trigram_word_similar=text)
+    ).annotate(
+        similarity=Greatest(
+            TrigramWordSimilarity(text, 'username'),
+            TrigramWordSimilarity(text, 'first_name'),
+            TrigramWordSimilarity(text, 'last_name'),
+        ),
+    ).order_by('-similarity', 'username')
+
+
+def terms_for(user):
+    full_name = f'{user.first_name} {user.last_name}'.strip()
+    return sorted({t.lower() for t in (user.username, user.first_name, user.last_name, full_name) if t})
+
+
+def card_for(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'full_name': user.full_name,
+        'avatar': user.avatar.url if user.avatar else None,
+        'is_verified': user.is_verified,
+    }
+
+
+def _should_index(user):
+    return user.searchable and user.is_active
+
+
+def _index(pipe, user, old_card=None):
+    """Queue the commands that replace `user`'s entries (given its previous card)."""
+    if old_card is not None:
+        pipe.zrem(typeahead_key(), *[f'{t}{SEPARATOR}{user.id}' for t in old_card['terms']])
+    if not _should_index(user):
+        pipe.hdel(cards_key(), user.id)
+        return
+    terms = terms_for(user)
+    pipe.zadd(typeahead_key(), {f'{t}{SEPARATOR}{user.id}': 0 for t in terms})
+    pipe.hset(cards_key(), user.id, json.dumps(dict(card_for(user), terms=terms)))
+
+
+def index_user(user):
+    redis = get_redis()
+    if redis is None:
+        return
+    try:
+        old = redis.hget(cards_key(), user.id)
+        pipe = redis.pipeline()
+        _index(pipe, user, json.loads(old) if old else None)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f'Typeahead index update failed for user {user.id}: {e}')
+
+
+def unindex_user(user_id):
+    redis = get_redis()
+    if redis is None:
+        return
+    try:
+        old = redis.hget(cards_key(), user_id)
+        if old:
+            pipe = redis.pipeline()
+            pipe.zrem(typeahead_key(), *[f'{t}{SEPARATOR}{user_id}' for t in json.loads(old)['terms']])
+            pipe.hdel(cards_key(), user_id)
+            pipe.execute()
+    except Exception as e:
+        logger.warning(f'Typeahead index removal failed for user {user_id}: {e}')
+
+
+def rebuild_index():
+    from .models import User
+    redis = get_redis()
+    if redis is None:
+        return 0
+    redis.delete(typeahead_key(), cards_key())
+    count = 0
+    users = User.objects.filter(searchable=True, is_active=True).order_by('id')
+    pipe = redis.pipeline(transaction=False)
+    for user in users.iterator(chunk_size=REBUILD_CHUNK_SIZE):
+        _index(pipe, user)
+        count += 1
+        if count % REBUILD_CHUNK_SIZE == 0:
+            pipe.execute()
+    pipe.execute()
+    return count
+
+
+def _db_typeahead(prefix, viewer, limit):
+    from .models import User
+    users = User.objects.filter(
+        Q(username__istartswith=prefix) |
+        Q(first_name__istartswith=prefix) |
+        Q(last_name__istartswith=prefix),
+        searchable=True, is_active=True,
+    ).exclude(id__in=blocked_ids(viewer) | {viewer.id}).order_by('username')[:limit]
+    return [card_for(u) for u in users]
+
+
+def typeahead(prefix, viewer, limit=TYPEAHEAD_LIMIT):
+    """Compact cards of users with a name or username starting with `prefix`."""
+    prefix = prefix.strip().lower()
+    if not prefix or SEPARATOR in prefix:
+        return []
+    redis = get_redis()
+    if redis is None:
+        return _db_typeahead(prefix, viewer, limit)
+    try:
+        encoded = prefix.encode()
+        members = redis.zrangebylex(
+            typeahead_key(), b'[' + encoded, b'[' + encoded + b'\xff',
+            start=0, num=limit * TYPEAHEAD_OVERFETCH,
+        )
+        excluded = blocked_ids(viewer) | {viewer.id}
+        ids = []
+        for member in members:
+            uid = int(member.rsplit(b'\x00', 1)[1])
+            if uid not in excluded and uid not in ids:
+                ids.append(uid)
+        ids = ids[:limit]
+        if not ids:
+            return []
+        cards = [json.loads(c) for c in redis.hmget(cards_key(), ids) if c]
+    except Exception as e:
+        logger.warning(f'Typeahead unavailable: {e}')
+        return _db_typeahead(prefix, viewer, limit)
+    for card in cards:
+        card.pop('terms', None)
+    return cards
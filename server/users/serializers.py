@@ -2,12 +2,42 @@ from django.contrib.auth.password_validation import validate_password
 from django.db.models import Q
 from rest_framework import serializers
 from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from andromeda.loaders import (
+    BatchLoadingListSerializer, BatchLoadingMixin, batch_loader, viewer_of,
+)
+from andromeda.media import SrcsetField
+from . import friends
 from .models import User, FriendRequest
 
-
-class UserSerializer(serializers.ModelSerializer):
+NO_FRIENDSHIP = {'is_friend': False, 'sent': False, 'received': False}
+
+
+def load_friendship_states(viewer, user_ids):
+    """Friendship flags between the viewer and each user: friends from the
+    cached friend set, pending requests from one query."""
+    states = {}
+    for other_id in friends.friends_among(viewer.id, user_ids):
+        states[other_id] = dict(NO_FRIENDSHIP, is_friend=True)
+    rows = FriendRequest.objects.filter(
+        Q(sender=viewer, receiver_id__in=user_ids) |
+        Q(receiver=viewer, sender_id__in=user_ids),
+        status=FriendRequest.STATUS_PENDING,
+    ).values_list('sender_id', 'receiver_id')
+    for sender_id, receiver_id in rows:
+        other_id = receiver_id if sender_id == viewer.id else sender_id
+        state = states.setdefault(other_id, dict(NO_FRIENDSHIP))
+        if sender_id == viewer.id:
+            state['sent'] = True
+        else:
+            state['received'] = True
+    return states
+
+
+class UserSerializer(BatchLoadingMixin, serializers.ModelSerializer):
     avatar_url = serializers.SerializerMethodField()
     cover_photo_url = serializers.SerializerMethodField()
+    avatar_srcset = SrcsetField(source='avatar_derivatives')
+    cover_photo_srcset = SrcsetField(source='cover_photo_derivatives')
     is_friend = serializers.SerializerMethodField()
     friend_request_sent = serializers.SerializerMethodField()
     friend_request_received = serializers.SerializerMethodField()
@@ -16,7 +46,8 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = [
             'id', 'username', 'email', 'first_name', 'last_name',
-            'full_name', 'bio', 'avatar_url', 'avatar', 'cover_photo_url', 'cover_photo',
+            'full_name', 'bio', 'avatar_url', 'avatar', 'avatar_srcset',
+            'cover_photo_url', 'cover_photo', 'cover_photo_srcset',
             'location', 'website', 'birth_date', 'is_verified',
             'friends_count', 'posts_count',
             'created_at', 'is_friend', 'friend_request_sent', 'friend_request_received',
@@ -32,6 +63,16 @@ class UserSerializer(serializers.ModelSerializer):
             'avatar': {'write_only': True},
             'cover_photo': {'write_only': True},
         }
+        list_serializer_class = BatchLoadingListSerializer
+
+    def prime_viewer_fields(self, users):
+        batch_loader(self.context, load_friendship_states, NO_FRIENDSHIP).prime(u.pk for u in users)
+
+    def _friendship(self, obj):
+        viewer = viewer_of(self.context)
+        if viewer is None or viewer.pk == obj.pk:
+            return NO_FRIENDSHIP
+        return batch_loader(self.context, load_friendship_states, NO_FRIENDSHIP).load(obj.pk)
 
     def get_avatar_url(self, obj):
         request = self.context.get('request')
@@ -45,36 +86,23 @@ class UserSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(obj.cover_photo.url)
         return None
 
+    def viewer_fields(self, obj):
+        """The fields of the card that depend on who is looking."""
+        state = self._friendship(obj)
+        return {
+            'is_friend': state['is_friend'],
+            'friend_request_sent': state['sent'],
+            'friend_request_received': state['received'],
+        }
+
     def get_is_friend(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated and request.user != obj:
-            return FriendRequest.objects.filter(
-                status=FriendRequest.STATUS_ACCEPTED
-            ).filter(
-                Q(sender=request.user, receiver=obj) |
-                Q(sender=obj, receiver=request.user)
-            ).exists()
-        return False
+        return self._friendship(obj)['is_friend']
 
     def get_friend_request_sent(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated and request.user != obj:
-            return FriendRequest.objects.filter(
-                sender=request.user,
-                receiver=obj,
-                status=FriendRequest.STATUS_PENDING,
-            ).exists()
-        return False
+        return self._friendship(obj)['sent']
 
     def get_friend_request_received(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated and request.user != obj:
-            return FriendRequest.objects.filter(
-                sender=obj,
-                receiver=request.user,
-                status=FriendRequest.STATUS_PENDING,
-            ).exists()
-        return False
+        return self._friendship(obj)['received']
 
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -116,7 +144,7 @@ class AndromedaTokenSerializer(TokenObtainPairSerializer):
         return token
 
 
-class FriendRequestSerializer(serializers.ModelSerializer):
+class FriendRequestSerializer(BatchLoadingMixin, serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
     receiver = UserSerializer(read_only=True)
 
@@ -124,3 +152,4 @@ class FriendRequestSerializer(serializers.ModelSerializer):
         model = FriendRequest
         fields = ['id', 'sender', 'receiver', 'status', 'created_at']
         read_only_fields = ['sender', 'status', 'created_at']
+        list_serializer_class = BatchLoadingListSerializer
@@ -1,9 +1,24 @@
 """
-Keep Neo4j UserNode in sync with the PostgreSQL User model.
+Keep Neo4j UserNode and the Redis friend sets in sync with the PostgreSQL
+User and FriendRequest models.
 """
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
-from .models import User, FriendRequest
+from .models import User, FriendRequest, Friendship
+from . import friends, search
+
+# Fields that appear in typeahead terms or cards.
+TYPEAHEAD_FIELDS = {
+    'username', 'first_name', 'last_name', 'avatar', 'is_verified', 'searchable', 'is_active',
+}
+
+
+def fanout_crossed(user_ids, friends_count):
+    """Those of `user_ids` whose friends_count just became `friends_count`."""
+    return list(User.objects.filter(pk__in=user_ids, friends_count=friends_count).values_list('id', flat=True))
 
 
 @receiver(post_save, sender=User)
@@ -27,6 +42,13 @@ def sync_user_to_neo4j(sender, instance, created, **kwargs):
         pass  # Neo4j unavailable during migrations – non-blocking
 
 
+@receiver(post_save, sender=User)
+def update_typeahead_index(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not TYPEAHEAD_FIELDS & set(update_fields):
+        return
+    transaction.on_commit(lambda: search.index_user(instance))
+
+
 @receiver(post_delete, sender=User)
 def remove_user_from_neo4j(sender, instance, **kwargs):
     try:
@@ -36,26 +58,58 @@ def remove_user_from_neo4j(sender, instance, **kwargs):
             node.delete()
     except Exception:
         pass
+    user_id = instance.id
+    transaction.on_commit(lambda: search.unindex_user(user_id))
 
 
 @receiver(post_save, sender=FriendRequest)
 def handle_friend_request_accepted(sender, instance, **kwargs):
     if instance.status != FriendRequest.STATUS_ACCEPTED:
         return
+    sender_id, receiver_id = instance.sender_id, instance.receiver_id
+    crossed = []
+    if Friendship.objects.befriend(sender_id, receiver_id, since=instance.updated_at):
+        User.objects.filter(pk__in=[sender_id, receiver_id]).update(friends_count=F('friends_count') + 1)
+        crossed = fanout_crossed([sender_id, receiver_id], settings.FEED_FANOUT_THRESHOLD)
     try:
         from users.graph_models import UserNode
-        node_a = UserNode.nodes.get_or_none(user_id=instance.sender_id)
-        node_b = UserNode.nodes.get_or_none(user_id=instance.receiver_id)
+        node_a = UserNode.nodes.get_or_none(user_id=sender_id)
+        node_b = UserNode.nodes.get_or_none(user_id=receiver_id)
         if node_a and node_b and not node_a.friends.is_connected(node_b):
             node_a.friends.connect(node_b)
-        # Update counters
-        for uid in [instance.sender_id, instance.receiver_id]:
-            user = User.objects.get(pk=uid)
-            user.friends_count = user.sent_requests.filter(
-                status=FriendRequest.STATUS_ACCEPTED
-            ).count() + user.received_requests.filter(
-                status=FriendRequest.STATUS_ACCEPTED
-            ).count()
-            user.save(update_fields=['friends_count'])
     except Exception:
         pass
+    transaction.on_commit(lambda: friends.add_friendship(sender_id, receiver_id))
+    from posts.timeline import invalidate_friend_timelines, invalidate_timelines
+    # After commit: a feed read in between would re-cache the old friendship.
+    transaction.on_commit(lambda: invalidate_timelines(sender_id, receiver_id))
+    if crossed:
+        transaction.on_commit(lambda: invalidate_friend_timelines(*crossed))
+
+
+@receiver(post_delete, sender=FriendRequest)
+def handle_friendship_removed(sender, instance, **kwargs):
+    """Deleting an accepted request (unfriending) undoes what accepting did."""
+    if instance.status != FriendRequest.STATUS_ACCEPTED:
+        return
+    sender_id, receiver_id = instance.sender_id, instance.receiver_id
+    crossed = []
+    if Friendship.objects.unfriend(sender_id, receiver_id):
+        User.objects.filter(pk__in=[sender_id, receiver_id], friends_count__gt=0).update(
+            friends_count=F('friends_count') - 1
+        )
+        crossed = fanout_crossed([sender_id, receiver_id], settings.FEED_FANOUT_THRESHOLD - 1)
+    try:
+        from users.graph_models import UserNode
+        node_a = UserNode.nodes.get_or_none(user_id=sender_id)
+        node_b = UserNode.nodes.get_or_none(user_id=receiver_id)
+        if node_a and node_b and node_a.friends.is_connected(node_b):
+            node_a.friends.disconnect(node_b)
+    except Exception:
+        pass
+    transaction.on_commit(lambda: friends.remove_friendship(sender_id, receiver_id))
+    from posts.timeline import invalidate_friend_timelines, invalidate_timelines
+    # After commit: a feed read in between would re-cache the old friendship.
+    transaction.on_commit(lambda: invalidate_timelines(sender_id, receiver_id))
+    if crossed:
+        transaction.on_commit(lambda: invalidate_friend_timelines(*crossed))
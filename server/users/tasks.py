@@ -1,5 +1,6 @@
 """
-Celery tasks for users – runs on the 'emails' queue.
+Celery tasks for users – emails run on the 'emails' queue, presence
+broadcasts on 'notifications'.
 """
 from celery import shared_task
 import logging
@@ -44,3 +45,50 @@ def send_password_reset_email(user_id, reset_link):
         )
     except Exception as e:
         logger.error(f'send_password_reset_email error: {e}')
+
+
+@shared_task(name='users.tasks.broadcast_presence', queue='notifications')
+def broadcast_presence(user_id, status):
+    """Tell the online friends of `user_id` that they came online or went offline."""
+    import asyncio
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+    from users import friends, presence
+    from users.models import User
+
+    try:
+        user = User.objects.only('username', 'show_online_status').get(id=user_id)
+        if not user.show_online_status:
+            return
+        # Transitions can be processed out of order; only announce the current state.
+        is_online = bool(presence.connected_user_ids([user_id]))
+        if is_online != (status == presence.ONLINE):
+            return
+        recipients = presence.connected_user_ids(friends.friend_ids(user_id))
+        if not recipients:
+            return
+        event = {'type': 'presence_changed', 'user_id': user_id, 'username': user.username, 'status': status}
+        channel_layer = get_channel_layer()
+
+        async def send_all():
+            await asyncio.gather(*[
+                channel_layer.group_send(presence.presence_group(friend_id), event) for friend_id in recipients
+            ], return_exceptions=True)
+
+        async_to_sync(send_all)()
+    except Exception as e:
+        logger.error(f'broadcast_presence error: {e}')
+
+
+@shared_task(name='users.tasks.sweep_presence', queue='default')
+def sweep_presence():
+    """Take users offline whose sockets stopped sending heartbeats (e.g. a crashed worker)."""
+    from users import presence
+    try:
+        offline = presence.sweep()
+    except Exception as e:
+        logger.error(f'sweep_presence error: {e}')
+        return 0
+    if offline:
+        logger.info(f'Presence sweep took {len(offline)} users offline.')
+    return len(offline)
@@ -122,6 +122,20 @@ class TestMe:
         user.refresh_from_db()
         assert user.bio == "Hello world"
 
+    def test_me_returns_avatar_srcset(self, auth_client, user, django_capture_on_commit_callbacks):
+        import io
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.new("RGBA", (900, 900), (0, 0, 255, 128)).save(buffer, "PNG")
+        with django_capture_on_commit_callbacks(execute=True):
+            user.avatar = SimpleUploadedFile("me.png", buffer.getvalue(), content_type="image/png")
+            user.save()
+        user.refresh_from_db()  # the authenticated instance
+        srcset = auth_client.get(reverse("me")).data["avatar_srcset"]
+        assert [c.split(" ")[1] for c in srcset["webp"].split(", ")] == ["320w", "720w", "900w"]
+        assert srcset["jpeg"].count(".jpg ") == 3
+
 
 # ── Follow ────────────────────────────────────────────────────────────────────
 
@@ -163,3 +177,361 @@ class TestFriendRequests:
         assert response.status_code == status.HTTP_200_OK
         fr.refresh_from_db()
         assert fr.status == FriendRequest.STATUS_ACCEPTED
+
+    def test_accept_creates_symmetric_friendship(self, api_client, user, other_user):
+        from users.models import FriendRequest, Friendship
+        fr = FriendRequest.objects.create(sender=other_user, receiver=user)
+        assert not Friendship.objects.exists()
+        api_client.force_authenticate(user=user)
+        api_client.post(reverse("friend-request-accept", kwargs={"pk": fr.id}))
+        pairs = set(Friendship.objects.values_list("user_id", "friend_id"))
+        assert pairs == {(user.id, other_user.id), (other_user.id, user.id)}
+        user.refresh_from_db()
+        assert user.friends_count == 1
+
+    def test_user_list_reports_friendship_flags(self, api_client, user, other_user):
+        from users.models import FriendRequest
+        carol = User.objects.create_user(username="carol", email="carol@example.com", password="testpass123")
+        dave = User.objects.create_user(username="dave", email="dave@example.com", password="testpass123")
+        FriendRequest.objects.create(sender=user, receiver=other_user, status=FriendRequest.STATUS_ACCEPTED)
+        FriendRequest.objects.create(sender=user, receiver=carol)
+        FriendRequest.objects.create(sender=dave, receiver=user)
+        api_client.force_authenticate(user=user)
+        response = api_client.get(reverse("user-list"))
+        flags = {
+            u["username"]: (u["is_friend"], u["friend_request_sent"], u["friend_request_received"])
+            for u in response.data["results"]
+        }
+        assert flags == {
+            "alice": (False, False, False),
+            "bob": (True, False, False),
+            "carol": (False, True, False),
+            "dave": (False, False, True),
+        }
+
+    def test_unfriend_updates_counts_and_friend_set(self, api_client, user, other_user):
+        from users import friends
+        from users.models import FriendRequest, Friendship
+        fr = FriendRequest.objects.create(sender=user, receiver=other_user, status=FriendRequest.STATUS_ACCEPTED)
+        assert friends.are_friends(user.id, other_user.id)
+        api_client.force_authenticate(user=user)
+        response = api_client.delete(reverse("friend-request-detail", kwargs={"pk": fr.id}))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert not friends.are_friends(user.id, other_user.id)
+        assert not Friendship.objects.exists()
+        other_user.refresh_from_db()
+        assert other_user.friends_count == 0
+
+    def test_timelines_invalidated_after_commit(self, user, other_user, monkeypatch, django_capture_on_commit_callbacks):
+        from posts import timeline
+        from users.models import FriendRequest
+        invalidated = []
+        monkeypatch.setattr(timeline, "invalidate_timelines", lambda *ids: invalidated.append(set(ids)))
+        with django_capture_on_commit_callbacks(execute=True):
+            fr = FriendRequest.objects.create(sender=user, receiver=other_user, status=FriendRequest.STATUS_ACCEPTED)
+            assert invalidated == []
+        with django_capture_on_commit_callbacks(execute=True):
+            fr.delete()
+            assert len(invalidated) == 1
+        assert invalidated == [{user.id, other_user.id}] * 2
+
+
+class TestFriendSets:
+    def test_mutual_friends(self, user, other_user):
+        from users import friends
+        from users.models import FriendRequest
+        carol = User.objects.create_user(username="carol", email="carol@example.com", password="testpass123")
+        FriendRequest.objects.create(sender=user, receiver=carol, status=FriendRequest.STATUS_ACCEPTED)
+        FriendRequest.objects.create(sender=carol, receiver=other_user, status=FriendRequest.STATUS_ACCEPTED)
+        FriendRequest.objects.create(sender=user, receiver=other_user)
+        assert friends.mutual_friend_ids(user.id, other_user.id) == {carol.id}
+        assert friends.friends_among(user.id, [other_user.id, carol.id]) == {carol.id}
+
+    def test_rebuild_command_requires_redis(self, db):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        with pytest.raises(CommandError):
+            call_command("rebuild_friend_cache")
+
+
+class TestFriendSetsWithRedis:
+    @pytest.fixture
+    def redis(self, monkeypatch):
+        import fakeredis
+        from users import friends
+        server = fakeredis.FakeRedis()
+        monkeypatch.setattr(friends, "get_redis", lambda: server)
+        return server
+
+    @pytest.fixture
+    def carol(self, db):
+        return User.objects.create_user(username="carol", email="carol@example.com", password="testpass123")
+
+    @staticmethod
+    def befriend(a, b):
+        from users.models import FriendRequest
+        return FriendRequest.objects.create(sender=a, receiver=b, status=FriendRequest.STATUS_ACCEPTED)
+
+    def test_sets_load_once_with_the_sentinel(self, redis, user, other_user, django_assert_num_queries):
+        from users import friends
+        self.befriend(user, other_user)
+        with django_assert_num_queries(2):
+            assert friends.friend_ids(user.id) == {other_user.id}
+            assert friends.friend_ids(other_user.id) == {user.id}
+        assert redis.smembers(friends.friends_key(user.id)) == {b"0", str(other_user.id).encode()}
+
+        carol = User.objects.create_user(username="carol", email="carol@example.com", password="testpass123")
+        with django_assert_num_queries(1):
+            # "No friends" is cached too.
+            assert friends.friend_ids(carol.id) == set()
+            assert friends.friend_ids(carol.id) == set()
+        assert redis.smembers(friends.friends_key(carol.id)) == {b"0"}
+        assert 0 < redis.ttl(friends.friends_key(carol.id)) <= friends.settings.FRIEND_CACHE_TTL
+
+    def test_membership_checks_read_the_sets(self, redis, user, other_user, carol, django_assert_num_queries):
+        from users import friends
+        self.befriend(user, other_user)
+        self.befriend(user, carol)
+        self.befriend(carol, other_user)
+        with django_assert_num_queries(2):
+            assert friends.are_friends(user.id, carol.id)
+            assert not friends.are_friends(user.id, user.id)
+            assert not friends.are_friends(user.id, friends.SENTINEL)
+            assert friends.friends_among(user.id, [carol.id, other_user.id, user.id, 0]) == {carol.id, other_user.id}
+            assert friends.friends_among(user.id, []) == set()
+            # SINTER over both sets, loading the missing one; the sentinel is no friend.
+            assert friends.mutual_friend_ids(user.id, carol.id) == {other_user.id}
+            assert friends.mutual_friend_ids(carol.id, user.id) == {other_user.id}
+
+    def test_friendship_changes_update_loaded_sets(self, redis, user, other_user, carol,
+                                                   django_capture_on_commit_callbacks):
+        from users import friends
+        assert friends.friend_ids(user.id) == set()
+        with django_capture_on_commit_callbacks(execute=True):
+            request = self.befriend(user, other_user)
+        assert redis.smembers(friends.friends_key(user.id)) == {b"0", str(other_user.id).encode()}
+        # Bob's set was never loaded; it is read from the database when needed.
+        assert not redis.exists(friends.friends_key(other_user.id))
+        assert friends.are_friends(other_user.id, user.id)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            request.delete()
+        assert friends.friend_ids(user.id) == friends.friend_ids(other_user.id) == set()
+
+    def test_rebuild_reloads_from_the_database(self, redis, user, other_user, carol):
+        from users import friends
+        self.befriend(user, other_user)
+        redis.sadd(friends.friends_key(user.id), carol.id)
+        redis.delete(friends.friends_key(carol.id))
+        assert friends.rebuild([user.id, carol.id]) == 2
+        assert friends.friend_ids(user.id) == {other_user.id}
+        assert redis.smembers(friends.friends_key(carol.id)) == {b"0"}
+
+
+class TestPeopleSearch:
+    def test_search_skips_unsearchable_and_blocked_users(self, auth_client, user, other_user):
+        from users.models import Block
+        User.objects.create_user(username="bobby", email="bobby@example.com", password="testpass123", searchable=False)
+        bobcat = User.objects.create_user(username="bobcat", email="bobcat@example.com", password="testpass123")
+        Block.objects.create(blocker=bobcat, blocked=user)
+        response = auth_client.get(reverse("user-list") + "?search=bob")
+        assert [u["username"] for u in response.data["results"]] == ["bob"]
+
+    def test_typeahead_returns_compact_cards(self, auth_client, user, other_user):
+        from users.models import Block
+        User.objects.create_user(username="bobby", email="bobby@example.com", password="testpass123", searchable=False)
+        Block.objects.create(blocker=user, blocked=User.objects.create_user(
+            username="bobcat", email="bobcat@example.com", password="testpass123",
+        ))
+        response = auth_client.get(reverse("user-typeahead") + "?q=Bo")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == [{
+            "id": other_user.id, "username": "bob", "full_name": "Bob Jones",
+            "avatar": None, "is_verified": False,
+        }]
+
+
+class TestTypeaheadWithRedis:
+    @pytest.fixture
+    def redis(self, monkeypatch):
+        import fakeredis
+        from users import search
+        server = fakeredis.FakeRedis()
+        monkeypatch.setattr(search, "get_redis", lambda: server)
+        return server
+
+    @staticmethod
+    def names(cards):
+        return [card["username"] for card in cards]
+
+    def test_prefixes_match_any_term(self, redis, user, other_user):
+        from users import search
+        from users.models import Block
+        bobby = User.objects.create_user(username="rob", email="rob@example.com", password="testpass123",
+                                         first_name="Bobby", last_name="Tables")
+        User.objects.create_user(username="boa", email="boa@example.com", password="testpass123")
+        blocked = User.objects.create_user(username="bobcat", email="bobcat@example.com", password="testpass123")
+        Block.objects.create(blocker=blocked, blocked=user)
+        assert search.rebuild_index() == 5
+
+        assert self.names(search.typeahead("Bob", user)) == ["bob", "rob"]
+        assert self.names(search.typeahead("bob j", user)) == ["bob"]
+        assert self.names(search.typeahead("jon", user)) == ["bob"]
+        assert self.names(search.typeahead("tab", user)) == ["rob"]
+        assert self.names(search.typeahead("bo", user, limit=1)) == ["boa"]
+        # Not the viewer themselves, and nothing for an empty or separator prefix.
+        assert search.typeahead("ali", user) == []
+        assert search.typeahead(" ", user) == search.typeahead("a\x00", user) == []
+        assert search.typeahead("bobby", user) == [{
+            "id": bobby.id, "username": "rob", "full_name": "Bobby Tables", "avatar": None, "is_verified": False,
+        }]
+
+    def test_index_follows_renames(self, redis, user, other_user, django_capture_on_commit_callbacks):
+        from users import search
+        search.rebuild_index()
+        with django_capture_on_commit_callbacks(execute=True):
+            other_user.username, other_user.first_name = "robert", "Robert"
+            other_user.save()
+        assert search.typeahead("bob", user) == []
+        assert self.names(search.typeahead("rob", user)) == ["robert"]
+        assert self.names(search.typeahead("jones", user)) == ["robert"]
+        members = {m.decode() for m in redis.zrange(search.typeahead_key(), 0, -1)}
+        assert {m for m in members if m.endswith(f"\x00{other_user.id}")} == {
+            f"{term}\x00{other_user.id}" for term in ("jones", "robert", "robert jones")
+        }
+
+        with django_capture_on_commit_callbacks(execute=True):
+            other_user.searchable = False
+            other_user.save(update_fields=["searchable"])
+        assert search.typeahead("rob", user) == []
+        assert not redis.hexists(search.cards_key(), other_user.id)
+
+    def test_deleted_users_leave_the_index(self, redis, user, other_user, django_capture_on_commit_callbacks):
+        from users import search
+        search.rebuild_index()
+        with django_capture_on_commit_callbacks(execute=True):
+            other_user.delete()
+        assert search.typeahead("bob", user) == []
+        assert redis.zcard(search.typeahead_key()) == len(search.terms_for(user))
+
+
+class TestPresence:
+    def test_online_query_validates_ids(self, auth_client):
+        url = reverse("user-online")
+        assert auth_client.get(url + "?ids=1,x").status_code == status.HTTP_400_BAD_REQUEST
+        too_many = ",".join(str(i) for i in range(1, 502))
+        assert auth_client.get(url + "?ids=" + too_many).status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_nobody_is_online_without_redis(self, auth_client, user, other_user):
+        from users import presence
+        assert not presence.connect(other_user.id, "channel-1")
+        response = auth_client.get(reverse("user-online") + f"?ids={user.id},{other_user.id}")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {"online": []}
+
+
+class TestPresenceWithRedis:
+    @pytest.fixture
+    def redis(self, monkeypatch):
+        import fakeredis
+        from users import presence
+        server = fakeredis.FakeRedis()
+        monkeypatch.setattr(presence, "get_redis", lambda: server)
+        return server
+
+    @pytest.fixture
+    def broadcasts(self, monkeypatch):
+        from users import presence
+        sent = []
+        monkeypatch.setattr(presence, "_queue_broadcast", lambda user_id, status: sent.append((user_id, status)))
+        return sent
+
+    def test_online_until_last_connection_closes(self, redis, broadcasts, user, other_user):
+        from users import presence
+        assert presence.connect(user.id, "socket-1", now=100)
+        assert not presence.connect(user.id, "socket-2", now=101)
+        assert presence.connected_user_ids([user.id, other_user.id], now=102) == {user.id}
+
+        assert not presence.disconnect(user.id, "socket-1", now=103)
+        assert presence.connected_user_ids([user.id], now=104) == {user.id}
+        assert presence.disconnect(user.id, "socket-2", now=105)
+        assert presence.connected_user_ids([user.id], now=106) == set()
+        assert broadcasts == [(user.id, "online"), (user.id, "offline")]
+
+    def test_sweep_expires_lapsed_connections(self, redis, broadcasts, user, other_user, settings):
+        from users import presence
+        settings.PRESENCE_TTL = 90
+        presence.connect(user.id, "crashed", now=100)
+        presence.connect(other_user.id, "alive", now=100)
+        presence.heartbeat(other_user.id, "alive", now=180)
+        assert presence.connected_user_ids([user.id, other_user.id], now=200) == {other_user.id}
+
+        assert presence.sweep(now=200) == [user.id]
+        assert presence.sweep(now=200) == []
+        assert presence.connected_user_ids([other_user.id], now=200) == {other_user.id}
+        assert broadcasts[-1] == (user.id, "offline")
+        # A heartbeat after the sweep brings the user back.
+        assert presence.heartbeat(user.id, "crashed", now=210)
+
+    def test_online_query_hides_users_who_opt_out(self, redis, broadcasts, auth_client, user, other_user):
+        from users import presence
+        carol = User.objects.create_user(username="carol", email="carol@example.com", password="testpass123",
+                                         show_online_status=False)
+        for member in (other_user, carol):
+            presence.connect(member.id, f"socket-{member.id}")
+        response = auth_client.get(reverse("user-online") + f"?ids={other_user.id},{carol.id},{user.id}")
+        assert response.data == {"online": [other_user.id]}
+        assert presence.connected_user_ids([other_user.id, carol.id]) == {other_user.id, carol.id}
+
+    def test_status_fans_out_to_online_friends_only(self, redis, user, other_user):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from users import presence
+        from users.models import FriendRequest
+        from users.tasks import broadcast_presence
+        carol = User.objects.create_user(username="carol", email="carol@example.com", password="testpass123")
+        dave = User.objects.create_user(username="dave", email="dave@example.com", password="testpass123")
+        FriendRequest.objects.create(sender=user, receiver=other_user, status=FriendRequest.STATUS_ACCEPTED)
+        FriendRequest.objects.create(sender=user, receiver=dave, status=FriendRequest.STATUS_ACCEPTED)
+        channel_layer = get_channel_layer()
+        channels = {}
+        for member in (other_user, carol, dave):
+            channels[member.username] = async_to_sync(channel_layer.new_channel)()
+            async_to_sync(channel_layer.group_add)(presence.presence_group(member.id), channels[member.username])
+        # bob is an online friend, carol is online but no friend, dave is an offline friend.
+        for member in (user, other_user, carol):
+            presence.connect(member.id, f"socket-{member.id}")
+
+        def received(name):
+            async def drain():
+                import asyncio
+                events = []
+                while True:
+                    try:
+                        events.append(await asyncio.wait_for(channel_layer.receive(channels[name]), 0.05))
+                    except asyncio.TimeoutError:
+                        return events
+            return async_to_sync(drain)()
+
+        received("bob")  # the connect() calls above broadcast already
+        broadcast_presence(user.id, "online")
+        assert received("bob") == [{"type": "presence_changed", "user_id": user.id, "username": "alice", "status": "online"}]
+        assert received("carol") == [] and received("dave") == []
+        # Stale transitions are not announced.
+        broadcast_presence(user.id, "offline")
+        assert received("bob") == []
+
+    def test_offline_notifications_skip_online_members(self, redis, broadcasts, user, other_user):
+        from chats.models import ChatRoom, ChatMember, Message
+        from chats.tasks import notify_offline_members
+        from notifications.models import Notification
+        from users import presence
+        carol = User.objects.create_user(username="carol", email="carol@example.com", password="testpass123")
+        room = ChatRoom.objects.create(room_type=ChatRoom.TYPE_GROUP)
+        for member in (user, other_user, carol):
+            ChatMember.objects.create(room=room, user=member)
+        message = Message.objects.create(room=room, sender=user, content="Hi")
+        presence.connect(other_user.id, "socket")
+        notify_offline_members(message.id, room.id, user.id)
+        recipients = Notification.objects.filter(notification_type=Notification.TYPE_MESSAGE)
+        assert list(recipients.values_list("recipient_id", flat=True)) == [carol.id]
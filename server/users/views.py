@@ -1,5 +1,5 @@
 from django.contrib.auth import get_user_model
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, permissions, status, viewsets
@@ -9,7 +9,9 @@ from rest_framework.response import Response
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from . import friends, presence
 from .models import FriendRequest, Block
+from .search import TYPEAHEAD_LIMIT, TYPEAHEAD_MAX_LIMIT, search_people, typeahead
 from .serializers import (
     UserSerializer, RegisterSerializer,
     AndromedaTokenSerializer, FriendRequestSerializer,
@@ -67,13 +69,9 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
 
     def get_queryset(self):
         qs = super().get_queryset()
-        search = self.request.query_params.get('search')
+        search = self.request.query_params.get('search', '').strip()
         if search:
-            qs = qs.filter(
-                Q(username__icontains=search) |
-                Q(first_name__icontains=search) |
-                Q(last_name__icontains=search)
-            )
+            qs = search_people(qs, search, self.request.user)
         return qs
 
     def get_object(self):
@@ -83,6 +81,30 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
             return get_object_or_404(User, username=lookup)
         return super().get_object()
 
+    @action(detail=False, methods=['get'])
+    def typeahead(self, request):
+        """Compact cards for people whose name or username starts with ?q=."""
+        try:
+            limit = min(int(request.query_params.get('limit', TYPEAHEAD_LIMIT)), TYPEAHEAD_MAX_LIMIT)
+        except ValueError:
+            limit = TYPEAHEAD_LIMIT
+        cards = typeahead(request.query_params.get('q', ''), request.user, max(limit, 1))
+        for card in cards:
+            if card['avatar']:
+                card['avatar'] = request.build_absolute_uri(card['avatar'])
+        return Response(cards)
+
+    @action(detail=False, methods=['get'])
+    def online(self, request):
+        """Which of the users in ?ids=1,2,3 are online (if they let others see it)."""
+        try:
+            ids = {int(i) for i in request.query_params.get('ids', '').split(',') if i.strip()}
+        except ValueError:
+            raise ValidationError({'ids': 'Expected a comma-separated list of user ids.'})
+        if len(ids) > presence.PRESENCE_MAX_IDS:
+            raise ValidationError({'ids': f'At most {presence.PRESENCE_MAX_IDS} ids per request.'})
+        return Response({'online': sorted(presence.online_user_ids(ids))})
+
     @action(detail=False, methods=['get'])
     def suggestions(self, request):
         """Friend suggestions via Neo4j graph or fallback."""
@@ -98,14 +120,12 @@ class UserViewSet(viewsets.ReadOnlyModelViewSet):
             pass
         # Fallback: users not yet involved in friend requests
         blocked = Block.objects.filter(blocker=request.user).values_list('blocked_id', flat=True)
-        involved = FriendRequest.objects.filter(
+        open_requests = FriendRequest.objects.filter(
             Q(sender=request.user) | Q(receiver=request.user)
-        )
-        involved_ids = (
-            list(involved.values_list('sender_id', flat=True)) +
-            list(involved.values_list('receiver_id', flat=True))
-        )
-        exclude_ids = set(list(blocked) + involved_ids + [request.user.id])
+        ).exclude(status=FriendRequest.STATUS_ACCEPTED).values_list('sender_id', 'receiver_id')
+        exclude_ids = set(blocked) | friends.friend_ids(request.user.id) | {request.user.id}
+        for sender_id, receiver_id in open_requests:
+            exclude_ids.update((sender_id, receiver_id))
         users = User.objects.exclude(id__in=exclude_ids).order_by('?')[:10]
         return Response(UserSerializer(users, many=True, context={'request': request}).data)
 
@@ -137,9 +157,14 @@ class FriendRequestViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post'])
     def accept(self, request, pk=None):
-        fr = get_object_or_404(FriendRequest, pk=pk, receiver=request.user, status='pending')
-        fr.status = FriendRequest.STATUS_ACCEPTED
-        fr.save()
+        with transaction.atomic():
+            # The post_save handler writes the Friendship rows in this transaction.
+            fr = get_object_or_404(
+                FriendRequest.objects.select_for_update(),
+                pk=pk, receiver=request.user, status='pending',
+            )
+            fr.status = FriendRequest.STATUS_ACCEPTED
+            fr.save()
         return Response({'status': 'accepted'})
 
     @action(detail=True, methods=['post'])
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class WatchConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'watch'
+
+    def ready(self):
+        import watch.signals  # noqa: F401
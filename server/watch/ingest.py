@@ -0,0 +1,155 @@
+"""
+Buffered VideoView ingestion.
+
+Opening a video and the player's watch-progress heartbeats only touch Redis:
+
+* record_view() adds one pending view per (video, viewer) to a hash, so a
+  viewer who reloads a video several times between flushes yields one row;
+* record_progress() overwrites the viewer's latest watch_time in a second
+  hash, so any number of heartbeats collapse into one value per flush.
+
+watch.tasks.flush_video_views swaps both hashes out, bulk_creates the pending
+views with their watch_time filled in and applies leftover progress (for
+views flushed earlier) to each viewer's latest row. Without Redis both calls
+write to the database directly.
+
+A viewer is the user id, or the client IP for anonymous requests.
+"""
+import json
+import logging
+
+from django.db import transaction
+from django.db.models import F, Subquery, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from redis.exceptions import ResponseError
+
+from andromeda.redis_client import get_redis, redis_key
+
+logger = logging.getLogger(__name__)
+
+FLUSH_BATCH_SIZE = 1000
+FLUSH_LOCK_TIMEOUT = 120
+
+
+def views_key(suffix=None):
+    return redis_key('video_views', 'pending', *([suffix] if suffix else []))
+
+
+def progress_key(suffix=None):
+    return redis_key('video_views', 'progress', *([suffix] if suffix else []))
+
+
+def lock_key():
+    return redis_key('video_views', 'lock')
+
+
+def viewer_field(user_id, ip_address):
+    return f'u{user_id}' if user_id else f'ip{ip_address or ""}'
+
+
+def _latest_view(video_id, user_id, ip_address):
+    from .models import VideoView
+    views = VideoView.objects.filter(video_id=video_id)
+    if user_id:
+        views = views.filter(user_id=user_id)
+    else:
+        views = views.filter(user_id__isnull=True, ip_address=ip_address)
+    return views.order_by('-created_at', '-id').values('id')[:1]
+
+
+def record_view(video_id, user_id=None, ip_address=None):
+    from .models import VideoView
+    redis = get_redis()
+    if redis is not None:
+        try:
+            field = f'{video_id}:{viewer_field(user_id, ip_address)}'
+            event = {'user': user_id, 'ip': ip_address, 'at': timezone.now().isoformat()}
+            redis.hsetnx(views_key(), field, json.dumps(event))
+            return
+        except Exception as e:
+            logger.warning(f'Video view buffer unavailable: {e}')
+    VideoView.objects.create(video_id=video_id, user_id=user_id, ip_address=ip_address)
+
+
+def record_progress(video_id, watch_time, user_id=None, ip_address=None):
+    from .models import VideoView
+    redis = get_redis()
+    if redis is not None:
+        try:
+            redis.hset(progress_key(), f'{video_id}:{viewer_field(user_id, ip_address)}', int(watch_time))
+            return
+        except Exception as e:
+            logger.warning(f'Video view buffer unavailable: {e}')
+    VideoView.objects.filter(
+        pk=Subquery(_latest_view(video_id, user_id, ip_address))
+    ).update(watch_time=Greatest(F('watch_time'), Value(int(watch_time))))
+
+
+def _swap(redis, key, flushing_key):
+    # A leftover flushing hash means a previous flush died; finish it first.
+    if not redis.exists(flushing_key):
+        try:
+            redis.rename(key, flushing_key)
+        except ResponseError:
+            return {}  # nothing buffered
+    return {k.decode(): v for k, v in redis.hgetall(flushing_key).items()}
+
+
+def flush():
+    """Write buffered views and progress; returns (rows created, rows updated)."""
+    from django.contrib.auth import get_user_model
+    from .models import Video, VideoView
+
+    redis = get_redis()
+    if redis is None:
+        return 0, 0
+    lock = redis.lock(lock_key(), timeout=FLUSH_LOCK_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        return 0, 0
+    try:
+        views = _swap(redis, views_key(), views_key('flushing'))
+        progress = {k: int(v) for k, v in _swap(redis, progress_key(), progress_key('flushing')).items()}
+
+        fields = list(views)
+        created = 0
+        for start in range(0, len(fields), FLUSH_BATCH_SIZE):
+            batch = fields[start:start + FLUSH_BATCH_SIZE]
+            events = [(field, int(field.split(':', 1)[0]), json.loads(views[field])) for field in batch]
+            # Videos or users deleted since the view was recorded are skipped.
+            video_ids = set(Video.objects.filter(
+                id__in={video_id for _, video_id, _ in events}
+            ).values_list('id', flat=True))
+            user_ids = set(get_user_model().objects.filter(
+                id__in={e['user'] for _, _, e in events if e['user']}
+            ).values_list('id', flat=True))
+            rows = [
+                VideoView(
+                    video_id=video_id,
+                    user_id=event['user'] if event['user'] in user_ids else None,
+                    ip_address=event['ip'],
+                    watch_time=progress.pop(field, 0),
+                    created_at=parse_datetime(event['at']),
+                )
+                for field, video_id, event in events if video_id in video_ids
+            ]
+            VideoView.objects.bulk_create(rows, batch_size=FLUSH_BATCH_SIZE)
+            created += len(rows)
+            redis.hdel(views_key('flushing'), *batch)
+        redis.delete(views_key('flushing'))
+
+        # Heartbeats for views that were already flushed update the latest row.
+        updated = 0
+        with transaction.atomic():
+            for field, watch_time in progress.items():
+                video_id, viewer = field.split(':', 1)
+                user_id = int(viewer[1:]) if viewer.startswith('u') else None
+                ip_address = None if user_id else viewer[2:] or None
+                updated += VideoView.objects.filter(
+                    pk=Subquery(_latest_view(int(video_id), user_id, ip_address))
+                ).update(watch_time=Greatest(F('watch_time'), Value(watch_time)))
+        redis.delete(progress_key('flushing'))
+    finally:
+        lock.release()
+    return created, updated
@@ -0,0 +1,19 @@
+# Generated by Django 4.2.10 on 2026-10-18 11:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watch', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='videoview',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
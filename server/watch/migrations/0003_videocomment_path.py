@@ -0,0 +1,67 @@
+# Generated by Django 4.2.10 on 2026-10-18 11:46
+
+from django.db import migrations, models
+from django.db.models import Q
+
+# Frozen copy of andromeda.threads (segment width, depth limit and the path
+# backfill) at the time of this migration.
+SEGMENT_WIDTH = 10
+MAX_DEPTH = 250 // SEGMENT_WIDTH - 1
+BACKFILL_BATCH_SIZE = 1000
+
+
+def segment(pk):
+    return f'{pk:0{SEGMENT_WIDTH}d}'
+
+
+def backfill_paths(model):
+    """Roots first, then repeatedly every comment whose parent already has a path."""
+    ready = model.objects.filter(path='').filter(Q(parent__isnull=True) | ~Q(parent__path=''))
+    while True:
+        batch = list(ready.values_list('id', 'parent_id', 'parent__path', 'parent__depth')[:BACKFILL_BATCH_SIZE])
+        if not batch:
+            break
+        rows = []
+        for pk, parent_id, parent_path, parent_depth in batch:
+            if parent_id is None:
+                rows.append(model(id=pk, parent_id=None, path=segment(pk), depth=0))
+                continue
+            if parent_depth >= MAX_DEPTH:
+                parent_path = parent_path[:-SEGMENT_WIDTH]
+                parent_id, parent_depth = int(parent_path[-SEGMENT_WIDTH:]), parent_depth - 1
+            rows.append(model(id=pk, parent_id=parent_id, path=parent_path + segment(pk), depth=parent_depth + 1))
+        model.objects.bulk_update(rows, ['parent', 'path', 'depth'])
+
+
+
+def backfill_comment_paths(apps, schema_editor):
+    backfill_paths(apps.get_model('watch', 'VideoComment'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('watch', '0002_videoview_created_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videocomment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='videocomment',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, max_length=250),
+        ),
+        migrations.AddIndex(
+            model_name='videocomment',
+            index=models.Index(fields=['path'], name='video_comments_path_idx', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='videocomment',
+            index=models.Index(fields=['video', 'path'], name='video_comments_video_path_idx'),
+        ),
+        migrations.RunPython(backfill_comment_paths, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,8 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
+
+from andromeda.threads import PATH_MAX_LENGTH
 
 
 class Video(models.Model):
@@ -44,7 +47,8 @@ class VideoView(models.Model):
     )
     watch_time = models.PositiveIntegerField(default=0, help_text='Seconds watched')
     ip_address = models.GenericIPAddressField(null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    # Not auto_now_add: buffered views keep the time they were recorded.
+    created_at = models.DateTimeField(default=timezone.now)
 
     class Meta:
         db_table = 'video_views'
@@ -65,9 +69,16 @@ class VideoComment(models.Model):
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     content = models.TextField()
     parent = models.ForeignKey('self', null=True, blank=True, related_name='replies', on_delete=models.CASCADE)
+    # Materialized thread position, see andromeda.threads.
+    path = models.CharField(max_length=PATH_MAX_LENGTH, blank=True, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
     likes_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         db_table = 'video_comments'
         ordering = ['created_at']
+        indexes = [
+            models.Index(fields=['path'], name='video_comments_path_idx', opclasses=['varchar_pattern_ops']),
+            models.Index(fields=['video', 'path'], name='video_comments_video_path_idx'),
+        ]
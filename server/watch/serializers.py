@@ -1,21 +1,43 @@
 from rest_framework import serializers
-from .models import Video, VideoComment
+
+from andromeda.counters import VIDEO_VIEWS
+from andromeda.loaders import BatchLoadingListSerializer, BatchLoadingMixin, batch_loader
+from .models import Video, VideoComment, VideoLike
 from users.serializers import UserSerializer
 
 
-class VideoCommentSerializer(serializers.ModelSerializer):
+def load_liked_videos(viewer, video_ids):
+    return dict.fromkeys(
+        VideoLike.objects.filter(user=viewer, video_id__in=video_ids).values_list('video_id', flat=True),
+        True,
+    )
+
+
+class VideoCommentSerializer(BatchLoadingMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
 
     class Meta:
         model = VideoComment
-        fields = ['id', 'video', 'author', 'content', 'parent', 'likes_count', 'created_at']
+        fields = ['id', 'video', 'author', 'content', 'parent', 'depth', 'likes_count', 'created_at']
         read_only_fields = ['video', 'author', 'likes_count']
         extra_kwargs = {
             'parent': {'required': False, 'allow_null': True},
         }
+        list_serializer_class = BatchLoadingListSerializer
+
+    def validate_parent(self, parent):
+        video = self.context.get('video')
+        if parent is not None and video is not None and parent.video_id != video.pk:
+            raise serializers.ValidationError('The parent comment belongs to a different video.')
+        return parent
+
 
+def load_pending_video_views(viewer, pks):
+    return VIDEO_VIEWS.pending(pks)
 
-class VideoSerializer(serializers.ModelSerializer):
+
+class VideoSerializer(BatchLoadingMixin, serializers.ModelSerializer):
+    views_count = serializers.SerializerMethodField()
     uploader = UserSerializer(read_only=True)
     is_liked = serializers.SerializerMethodField()
 
@@ -28,9 +50,21 @@ class VideoSerializer(serializers.ModelSerializer):
             'is_public', 'tags', 'is_liked', 'created_at',
         ]
         read_only_fields = ['uploader', 'views_count', 'likes_count', 'comments_count', 'status']
+        list_serializer_class = BatchLoadingListSerializer
+
+    def prime(self, videos):
+        super().prime(videos)
+        batch_loader(self.context, load_pending_video_views, 0).prime(obj.pk for obj in videos)
+
+    def get_views_count(self, obj):
+        # Stored count plus the view increments not flushed yet.
+        return obj.views_count + batch_loader(self.context, load_pending_video_views, 0).load(obj.pk)
+
+    def prime_viewer_fields(self, videos):
+        batch_loader(self.context, load_liked_videos, False).prime(v.pk for v in videos)
 
     def get_is_liked(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
+            return batch_loader(self.context, load_liked_videos, False).load(obj.pk)
         return False
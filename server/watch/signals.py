@@ -0,0 +1,10 @@
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from andromeda.threads import assign_path
+from .models import VideoComment
+
+
+@receiver(post_save, sender=VideoComment)
+def on_video_comment_created(sender, instance, created, **kwargs):
+    if created:
+        assign_path(instance)
@@ -0,0 +1,20 @@
+"""
+Celery tasks for watch – run on the 'default' queue.
+"""
+from celery import shared_task
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task(name='watch.tasks.flush_video_views', queue='default')
+def flush_video_views():
+    """Write buffered video views and watch progress (see watch/ingest.py)."""
+    from watch.ingest import flush
+
+    try:
+        created, updated = flush()
+        return {'created': created, 'updated': updated}
+    except Exception as e:
+        logger.error(f'flush_video_views failed: {e}')
+        return None
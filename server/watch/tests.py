@@ -0,0 +1,136 @@
+import fakeredis
+import pytest
+from django.contrib.auth import get_user_model
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+from watch import ingest
+from watch.models import Video, VideoView
+
+User = get_user_model()
+
+
+# ── Fixtures ──────────────────────────────────────────────────────────────────
+
+@pytest.fixture
+def api_client():
+    return APIClient()
+
+
+@pytest.fixture
+def user(db):
+    return User.objects.create_user(username="alice", password="pass", email="a@a.com")
+
+
+@pytest.fixture
+def other_user(db):
+    return User.objects.create_user(username="bob", password="pass", email="b@b.com")
+
+
+@pytest.fixture
+def auth_client(api_client, user):
+    api_client.force_authenticate(user=user)
+    return api_client
+
+
+@pytest.fixture
+def video(user):
+    return Video.objects.create(
+        uploader=user, title="Clip", video_file="watch/videos/clip.mp4", status=Video.STATUS_READY,
+    )
+
+
+@pytest.fixture
+def redis(monkeypatch):
+    server = fakeredis.FakeRedis()
+    monkeypatch.setattr(ingest, "get_redis", lambda: server)
+    return server
+
+
+# ── Buffered views ────────────────────────────────────────────────────────────
+
+class TestViewIngest:
+    def test_views_are_written_directly_without_redis(self, video, user):
+        ingest.record_view(video.id, user.id)
+        ingest.record_progress(video.id, 42, user.id)
+        assert list(VideoView.objects.values_list("user_id", "watch_time")) == [(user.id, 42)]
+        assert ingest.flush() == (0, 0)
+
+    def test_repeated_views_flush_as_one_row(self, redis, video, user, other_user):
+        for _ in range(3):
+            ingest.record_view(video.id, user.id)
+        ingest.record_view(video.id, other_user.id)
+        ingest.record_view(video.id, None, "10.0.0.1")
+        assert not VideoView.objects.exists()
+
+        assert ingest.flush() == (3, 0)
+        assert sorted(VideoView.objects.values_list("user_id", "ip_address"), key=str) == sorted(
+            [(user.id, None), (other_user.id, None), (None, "10.0.0.1")], key=str,
+        )
+        assert ingest.flush() == (0, 0)
+        assert VideoView.objects.count() == 3
+
+    def test_progress_keeps_latest_heartbeat(self, redis, video, user):
+        ingest.record_view(video.id, user.id)
+        for watch_time in (5, 10, 15):
+            ingest.record_progress(video.id, watch_time, user.id)
+        ingest.flush()
+        assert VideoView.objects.get().watch_time == 15
+
+        # Heartbeats after the view was flushed update that row.
+        ingest.record_progress(video.id, 30, user.id)
+        assert ingest.flush() == (0, 1)
+        assert VideoView.objects.get().watch_time == 30
+
+    def test_views_of_deleted_videos_are_dropped(self, redis, video, user):
+        ingest.record_view(video.id, user.id)
+        Video.objects.filter(pk=video.pk).delete()
+        assert ingest.flush() == (0, 0)
+        assert not redis.exists(ingest.views_key("flushing"))
+
+    def test_flush_skips_while_another_holds_the_lock(self, redis, video, user):
+        ingest.record_view(video.id, user.id)
+        lock = redis.lock(ingest.lock_key(), timeout=ingest.FLUSH_LOCK_TIMEOUT)
+        assert lock.acquire(blocking=False)
+        assert ingest.flush() == (0, 0)
+        lock.release()
+        assert ingest.flush() == (1, 0)
+
+
+class TestVideoProgress:
+    def test_progress_is_buffered(self, redis, auth_client, video, user):
+        url = reverse("video-progress", kwargs={"pk": video.id})
+        response = auth_client.post(url, {"watch_time": 12}, format="json")
+        assert response.status_code == status.HTTP_202_ACCEPTED
+        assert redis.hget(ingest.progress_key(), f"{video.id}:u{user.id}") == b"12"
+
+    def test_progress_rejects_unknown_or_hidden_videos(self, redis, auth_client, video):
+        Video.objects.filter(pk=video.pk).update(is_public=False)
+        for pk in (video.id, video.id + 100, "abc"):
+            response = auth_client.post(f"/api/watch/videos/{pk}/progress/", {"watch_time": 12}, format="json")
+            assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert not redis.exists(ingest.progress_key())
+
+    def test_progress_validates_watch_time(self, auth_client, video):
+        url = reverse("video-progress", kwargs={"pk": video.id})
+        assert auth_client.post(url, {"watch_time": "x"}, format="json").status_code == status.HTTP_400_BAD_REQUEST
+
+
+class TestVideoComments:
+    def test_reply_must_belong_to_the_same_video(self, auth_client, user, video):
+        from watch.models import VideoComment
+        other = Video.objects.create(uploader=user, title="Other", video_file="watch/videos/o.mp4", status=Video.STATUS_READY)
+        top = VideoComment.objects.create(video=video, author=user, content="Top")
+        url = reverse("video-comments", kwargs={"pk": other.id})
+        response = auth_client.post(url, {"content": "Reply", "parent": top.id}, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert not other.comments.exists()
+
+    def test_delete_stays_within_the_video(self, auth_client, user, video):
+        from watch.models import VideoComment
+        other = Video.objects.create(uploader=user, title="Other", video_file="watch/videos/o.mp4", status=Video.STATUS_READY)
+        top = VideoComment.objects.create(video=video, author=user, content="Top")
+        stray = VideoComment.objects.create(video=other, author=user, content="Stray", parent=top)
+        response = auth_client.delete(f"/api/watch/videos/{video.id}/comments/{top.id}/")
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert list(VideoComment.objects.values_list("id", flat=True)) == [stray.id]
@@ -1,10 +1,21 @@
-from rest_framework import viewsets
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from .models import Video, VideoLike, VideoView, VideoComment
+from andromeda import threads
+from andromeda.counters import VIDEO_VIEWS, adjust
+from andromeda.pagination import ThreadPagination
+from . import ingest
+from .models import Video, VideoLike, VideoComment
 from .serializers import VideoSerializer, VideoCommentSerializer
 
 
+def viewer_id(request):
+    return request.user.id if request.user.is_authenticated else None
+
+
 class VideoViewSet(viewsets.ModelViewSet):
     serializer_class = VideoSerializer
 
@@ -25,22 +36,31 @@ class VideoViewSet(viewsets.ModelViewSet):
 
     def retrieve(self, request, *args, **kwargs):
         instance = self.get_object()
-        Video.objects.filter(pk=instance.pk).update(views_count=instance.views_count + 1)
-        VideoView.objects.create(
-            video=instance,
-            user=request.user if request.user.is_authenticated else None,
-        )
+        VIDEO_VIEWS.incr(instance.pk)
+        ingest.record_view(instance.pk, viewer_id(request), request.META.get('REMOTE_ADDR'))
         return super().retrieve(request, *args, **kwargs)
 
+    @action(detail=True, methods=['post'])
+    def progress(self, request, pk=None):
+        """Player heartbeat: seconds watched so far in the current view."""
+        video = self.get_object()
+        try:
+            watch_time = max(int(request.data.get('watch_time', 0)), 0)
+        except (TypeError, ValueError):
+            raise ValidationError({'watch_time': 'Must be a whole number of seconds.'})
+        ingest.record_progress(video.pk, watch_time, viewer_id(request), request.META.get('REMOTE_ADDR'))
+        return Response(status=status.HTTP_202_ACCEPTED)
+
     @action(detail=True, methods=['post'])
     def like(self, request, pk=None):
         video = self.get_object()
         like, created = VideoLike.objects.get_or_create(user=request.user, video=video)
         if not created:
-            like.delete()
-            Video.objects.filter(pk=video.pk).update(likes_count=video.likes.count())
+            deleted, _ = like.delete()
+            if deleted:
+                adjust(Video, video.pk, likes_count=-1)
             return Response({'liked': False})
-        Video.objects.filter(pk=video.pk).update(likes_count=video.likes.count())
+        adjust(Video, video.pk, likes_count=1)
         return Response({'liked': True})
 
     @action(detail=True, methods=['get', 'post'])
@@ -49,8 +69,29 @@ class VideoViewSet(viewsets.ModelViewSet):
         if request.method == 'GET':
             comments = video.comments.filter(parent=None).select_related('author')
             return Response(VideoCommentSerializer(comments, many=True, context={'request': request}).data)
-        serializer = VideoCommentSerializer(data=request.data, context={'request': request})
+        serializer = VideoCommentSerializer(data=request.data, context={'request': request, 'video': video})
         serializer.is_valid(raise_exception=True)
         serializer.save(author=request.user, video=video)
-        Video.objects.filter(pk=video.pk).update(comments_count=video.comments.count())
+        adjust(Video, video.pk, comments_count=1)
         return Response(serializer.data, status=201)
+
+    @action(detail=True, methods=['delete'], url_path=r'comments/(?P<comment_id>\d+)')
+    def delete_comment(self, request, pk=None, comment_id=None):
+        """Delete one of your comments together with all of its replies."""
+        video = self.get_object()
+        comment = get_object_or_404(video.comments, pk=comment_id, author=request.user)
+        with transaction.atomic():
+            deleted = threads.delete_subtree(comment, 'video')
+            adjust(Video, video.pk, comments_count=-deleted)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['get'])
+    def thread(self, request, pk=None):
+        """Every comment depth-first in path order, or one subtree with ?root=<comment id>."""
+        video = self.get_object()
+        comments = threads.thread(video.comments.select_related('author'), request.query_params.get('root'))
+        paginator = ThreadPagination()
+        page = paginator.paginate_queryset(comments, request)
+        return paginator.get_paginated_response(
+            VideoCommentSerializer(page, many=True, context={'request': request}).data
+        )